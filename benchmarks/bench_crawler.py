@@ -0,0 +1,74 @@
+# /// script
+# requires-python = ">=3.10"
+# dependencies = ["pandas", "numpy<2", "pillow", "deepface", "tf-keras"]
+# ///
+"""
+Archive rescan cost: serial os.walk + stat vs ArchiveCrawler (first crawl and
+no-op rescan with cached folder mtimes). Point it at a NAS share to see the
+difference that matters:  uv run benchmarks/bench_crawler.py [archive_dir]
+Without an argument a synthetic tree is created in a temp folder.
+"""
+import importlib.util
+import os
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ENGINE_PATH = os.path.join(HERE, "..", "facefinder_engine.py")
+
+FOLDERS = 500
+FILES_PER_FOLDER = 200
+EXTS = (".jpg", ".jpeg", ".png")
+
+
+def load_app():
+    spec = importlib.util.spec_from_file_location("facefinder_engine", ENGINE_PATH)
+    mod = importlib.util.module_from_spec(spec)
+    sys.modules["facefinder_engine"] = mod
+    spec.loader.exec_module(mod)
+    return mod
+
+
+def make_tree(root):
+    old = time.time_ns() - 60 * 10**9  # folders must look settled, or the crawler re-lists them
+    for d in range(FOLDERS):
+        folder = os.path.join(root, f"{d // 50:02d}", f"{d:04d}")
+        os.makedirs(folder)
+        for f in range(FILES_PER_FOLDER):
+            open(os.path.join(folder, f"img_{f:04d}.jpg"), "wb").close()
+    for folder, _, _ in os.walk(root): os.utime(folder, ns=(old, old))
+
+
+def walk_and_stat(root):
+    n = 0
+    for folder, dirs, files in os.walk(root):
+        for name in files:
+            if name.lower().endswith(EXTS):
+                os.stat(os.path.join(folder, name))
+                n += 1
+    return n
+
+
+def main():
+    app = load_app()
+    with tempfile.TemporaryDirectory() as tmp:
+        root = sys.argv[1] if len(sys.argv) > 1 else os.path.join(tmp, "archive")
+        if len(sys.argv) <= 1: make_tree(root)
+        cache = os.path.join(tmp, "dirs.json")
+
+        start = time.perf_counter()
+        n = walk_and_stat(root)
+        print(f"os.walk + stat        : {time.perf_counter() - start:7.2f}s ({n:,} files)")
+
+        for label in ("ArchiveCrawler, first", "ArchiveCrawler, no-op"):
+            crawler = app.ArchiveCrawler(cache, os.path.join(tmp, "none.pkl"), app.DEFAULT_CONFIG["excluded_folder_names"], EXTS)
+            start = time.perf_counter()
+            n = sum(1 for _ in crawler.crawl(root))
+            print(f"{label:22}: {time.perf_counter() - start:7.2f}s ({n:,} files stat'ed, "
+                  f"{crawler.listed} folders listed, {crawler.skipped} unchanged)")
+            crawler.save()
+
+
+if __name__ == "__main__":
+    main()
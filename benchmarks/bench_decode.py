@@ -0,0 +1,74 @@
+# /// script
+# requires-python = ">=3.10"
+# dependencies = ["pandas", "numpy<2", "pillow"]
+# ///
+"""
+Decode cost per image for detection: full-resolution load_image_fixed vs the reduced
+decode (JPEG draft mode + thumbnail to detect_max_edge). Point it at a folder of camera
+JPEGs to see real numbers:  uv run benchmarks/bench_decode.py [image_dir] [max_edge]
+Without a folder, synthetic 24 MP JPEGs are written to a temp folder.
+"""
+import importlib.util
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ENGINE_PATH = os.path.join(HERE, "..", "facefinder_engine.py")
+
+IMAGES = 8
+SIZE = (6000, 4000)  # 24 MP
+
+
+def load_app():
+    spec = importlib.util.spec_from_file_location("facefinder_engine", ENGINE_PATH)
+    mod = importlib.util.module_from_spec(spec)
+    sys.modules["facefinder_engine"] = mod
+    spec.loader.exec_module(mod)
+    return mod
+
+
+def make_images(folder):
+    rng = np.random.default_rng(0)
+    # smooth gradient + noise compresses like a photo, not like flat colour
+    y, x = np.mgrid[0:SIZE[1], 0:SIZE[0]]
+    base = np.stack([x * 255 // SIZE[0], y * 255 // SIZE[1], (x + y) * 255 // sum(SIZE)], axis=-1).astype(np.uint8)
+    for i in range(IMAGES):
+        noisy = np.clip(base.astype(np.int16) + rng.integers(-20, 20, base.shape), 0, 255).astype(np.uint8)
+        Image.fromarray(noisy).save(os.path.join(folder, f"img_{i:02d}.jpg"), quality=90)
+
+
+def measure(app, paths, max_edge):
+    seconds, peak = 0.0, 0
+    for path in paths:
+        start = time.perf_counter()
+        img = app.load_image_fixed(path, max_edge)
+        seconds += time.perf_counter() - start
+        peak = max(peak, img.nbytes)
+    return seconds / len(paths), peak
+
+
+def main():
+    app = load_app()
+    max_edge = int(sys.argv[2]) if len(sys.argv) > 2 else app.DEFAULT_CONFIG["detect_max_edge"]
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = sys.argv[1] if len(sys.argv) > 1 else tmp
+        if len(sys.argv) <= 1: make_images(folder)
+        paths = [os.path.join(folder, n) for n in sorted(os.listdir(folder)) if n.lower().endswith((".jpg", ".jpeg"))]
+        print(f"{len(paths)} JPEGs, detection edge {max_edge}px")
+        print(f"{'':22} | {'ms/image':>9} | {'array MB':>9}")
+        print("-" * 46)
+        full = None
+        for label, edge in (("full resolution", None), (f"reduced (≤{max_edge}px)", max_edge)):
+            seconds, peak = measure(app, paths, edge)
+            print(f"{label:22} | {seconds * 1000:9.1f} | {peak / 2**20:9.1f}"
+                  + (f"   {full[0] / seconds:.1f}x faster, {full[1] / peak:.0f}x less memory" if full else ""))
+            full = full or (seconds, peak)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+# /// script
+# requires-python = ">=3.10"
+# dependencies = ["pandas", "numpy<2", "pillow", "deepface", "tf-keras"]
+# ///
+"""
+Per-image append overhead of the index writer: EmbeddingBuffer vs the old
+row-by-row pd.concat. Run with:  uv run benchmarks/bench_embedding_buffer.py
+"""
+import importlib.util
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ENGINE_PATH = os.path.join(HERE, "..", "facefinder_engine.py")
+
+SIZES = [1_000, 10_000, 100_000, 500_000]
+CONCAT_MAX = 20_000  # pd.concat is quadratic; beyond this it takes minutes
+WINDOW = 1_000       # appends timed at the end of each run
+DIM = 512
+
+
+def load_app():
+    spec = importlib.util.spec_from_file_location("facefinder_engine", ENGINE_PATH)
+    mod = importlib.util.module_from_spec(spec)
+    sys.modules["facefinder_engine"] = mod
+    spec.loader.exec_module(mod)
+    return mod
+
+
+def bench_buffer(EmbeddingBuffer, n, emb):
+    buf = EmbeddingBuffer()
+    for i in range(n - WINDOW):
+        buf.append(f"/archive/img_{i:07d}.jpg", emb, "ok", None)
+    start = time.perf_counter()
+    for i in range(n - WINDOW, n):
+        buf.append(f"/archive/img_{i:07d}.jpg", emb, "ok", None)
+    per_image = (time.perf_counter() - start) / WINDOW
+    start = time.perf_counter()
+    buf.to_dataframe()
+    return per_image, time.perf_counter() - start
+
+
+def bench_concat(n, emb):
+    emb = emb.tolist()
+    df = pd.DataFrame()
+    for i in range(n - WINDOW):
+        df = pd.concat([df, pd.DataFrame([{"identity": f"img_{i}", "embedding": emb, "status": "ok", "error": None}])], ignore_index=True)
+    start = time.perf_counter()
+    for i in range(n - WINDOW, n):
+        df = pd.concat([df, pd.DataFrame([{"identity": f"img_{i}", "embedding": emb, "status": "ok", "error": None}])], ignore_index=True)
+    return (time.perf_counter() - start) / WINDOW
+
+
+def main():
+    app = load_app()
+    emb = np.random.default_rng(0).standard_normal(DIM).astype(np.float32)
+    print(f"{'entries':>10} | {'buffer us/img':>14} | {'to_dataframe s':>14} | {'pd.concat us/img':>16}")
+    print("-" * 64)
+    for n in SIZES:
+        per_image, convert = bench_buffer(app.EmbeddingBuffer, n, emb)
+        concat = f"{bench_concat(n, emb) * 1e6:16.1f}" if n <= CONCAT_MAX else f"{'(skipped)':>16}"
+        print(f"{n:>10,} | {per_image * 1e6:14.2f} | {convert:14.3f} | {concat}")
+
+
+if __name__ == "__main__":
+    main()
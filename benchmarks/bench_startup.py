@@ -0,0 +1,66 @@
+# /// script
+# requires-python = ">=3.10,<3.11"
+# dependencies = ["pandas", "numpy<2", "pillow", "deepface", "tf-keras", "tensorflow"]
+# ///
+"""
+Cold start of the GUI: time from interpreter start until the main window has been
+drawn, with TensorFlow/DeepFace imported up front (as before) vs loaded lazily in the
+background. Each run is a fresh process in an empty folder (no saved settings):
+    uv run benchmarks/bench_startup.py [runs]
+Without a display only the module import time is measured.
+"""
+import os
+import subprocess
+import sys
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_PATH = os.path.abspath(os.path.join(HERE, "..", "faceFindGUI_0.4.3.py"))
+RUNS = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+
+CHILD = r"""
+import time
+START = time.perf_counter()
+import importlib.util, os, sys
+if {eager}:
+    import tensorflow
+    from deepface import DeepFace
+sys.path.insert(0, os.path.dirname({app!r}))
+spec = importlib.util.spec_from_file_location("facefinder_app", {app!r})
+app_module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(app_module)
+imported = time.perf_counter() - START
+try:
+    app = app_module.FaceFinderGUI()
+    app.update()
+    visible = time.perf_counter() - START
+except Exception:  # no display
+    visible = float("nan")
+sys.__stdout__.write(f"{{imported}} {{visible}}\n")
+sys.__stdout__.flush()
+os._exit(0)  # don't wait for the background model load
+"""
+
+
+def measure(eager):
+    imported, visible = [], []
+    for _ in range(RUNS):
+        with tempfile.TemporaryDirectory() as cwd:
+            out = subprocess.run([sys.executable, "-c", CHILD.format(eager=eager, app=APP_PATH)],
+                                 cwd=cwd, capture_output=True, text=True, check=True).stdout.split()
+        imported.append(float(out[-2]))
+        visible.append(float(out[-1]))
+    return min(imported), min(visible)
+
+
+def main():
+    print(f"{'':28} | {'import s':>9} | {'window visible s':>16}   (best of {RUNS})")
+    print("-" * 62)
+    for label, eager in (("eager TF/DeepFace (before)", True), ("lazy, background (after)", False)):
+        imported, visible = measure(eager)
+        shown = f"{visible:16.2f}" if visible == visible else f"{'(no display)':>16}"
+        print(f"{label:28} | {imported:9.2f} | {shown}")
+
+
+if __name__ == "__main__":
+    main()
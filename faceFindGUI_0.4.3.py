@@ -16,48 +16,77 @@
 import tkinter as tk
 from tkinter import filedialog, messagebox, scrolledtext, simpledialog
 import os
-import shutil
 import pickle
 import time
-import pandas as pd
 import subprocess
 import platform
 import webbrowser
-from deepface import DeepFace
 from PIL import Image, ImageTk, ImageOps
 import threading
-import numpy as np
-import tensorflow as tf
+import collections
+import copy
+import logging
+import logging.handlers
+from facefinder_engine import (FaceFinderEngine, DEFAULT_CONFIG, load_config, save_config, OUTPUT_MODES,
+                               REFERENCE_CACHE_FILE, preload_models, gpu_status)  # TensorFlow/DeepFace load lazily
 
 # --- Configuration ---
-ARCHIVE_DIRS = []
-OUTPUT_DIR = os.path.join(os.path.expanduser("~"), "DeepFaceHits")
-REFERENCE_IMAGES_CONFIG = {}
-
-MODEL = "ArcFace"
-DETECTOR = "retinaface"
-DIST_METRIC = "cosine"
-MAX_DIST = 0.28
-
-# New Configuration Lists
-EXCLUDED_FOLDER_NAMES = ["$RECYCLE.BIN", "System Volume Information", ".git", "__pycache__"]
-ENABLED_EXTENSIONS = {
-    ".jpg": True, ".jpeg": True, ".png": True, 
-    ".bmp": True, ".gif": True, ".webp": True, ".tiff": True
-}
-
-CHECKPOINT_INTERVAL_SECONDS = 5 * 60  # 5 minutes
-
-# ========== GPU CHECK HELPER ==========
-def check_gpu_status():
-    try:
-        gpus = tf.config.list_physical_devices('GPU')
-        if gpus:
-            return f"✅ GPU DETECTED: {len(gpus)} device(s) active.\n   DeepFace will use hardware acceleration."
-        else:
-            return "⚠️ NO GPU DETECTED. DeepFace is running on CPU.\n   Analysis will be significantly slower."
-    except Exception as e:
-        return f"⚠️ Error checking GPU status: {str(e)}"
+# Settings and their defaults are the engine's (facefinder_engine.DEFAULT_CONFIG); the GUI saves them here
+GUI_CONFIG_FILE = "deepface_gui_config.pkl"
+
+# Console
+CONSOLE_REFRESH_MS = 100  # How often the Tk loop drains queued print() output into the console widget
+CONSOLE_MAX_LINES = 5000  # Lines kept in the console widget (and queued between refreshes); older ones are dropped
+CONSOLE_LOG_FILE = None  # e.g. "facefinder_console.log": also keep a rotating copy of the console on disk
+CONSOLE_LOG_MAX_BYTES = 5 * 1024 * 1024
+CONSOLE_LOG_BACKUPS = 3
+PROGRESS_POLL_MS = 250  # Status bar / save timer refresh while a run is active
+
+# ========== CONSOLE LOG SINK ==========
+class ConsoleLogSink:
+    """
+    Thread-safe stand-in for sys.stdout/sys.stderr. print() from any thread only
+    appends complete lines to a bounded deque; the Tk main loop drains it on a
+    timer, so worker threads never touch widgets and a flood of output costs
+    at most CONSOLE_MAX_LINES lines per refresh.
+    """
+    def __init__(self, max_lines=CONSOLE_MAX_LINES, log_path=CONSOLE_LOG_FILE):
+        self._lock = threading.Lock()
+        self._lines = collections.deque(maxlen=max_lines)
+        self._partial = {}  # thread id -> unfinished line (print() writes text and newline separately)
+        self.dropped = 0
+        self._file_log = None
+        if log_path:
+            handler = logging.handlers.RotatingFileHandler(
+                log_path, maxBytes=CONSOLE_LOG_MAX_BYTES, backupCount=CONSOLE_LOG_BACKUPS, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+            self._file_log = logging.getLogger("facefinder.console")
+            self._file_log.propagate = False
+            self._file_log.setLevel(logging.INFO)
+            self._file_log.addHandler(handler)
+
+    def write(self, message):
+        with self._lock:
+            tid = threading.get_ident()
+            lines = (self._partial.pop(tid, "") + message).split("\n")
+            if lines[-1]: self._partial[tid] = lines[-1]
+            lines.pop()
+            self.dropped += max(0, len(self._lines) + len(lines) - self._lines.maxlen)
+            self._lines.extend(lines)
+        if self._file_log:
+            for line in lines:
+                self._file_log.info(line)
+        return len(message)
+
+    def flush(self): pass
+
+    def drain(self):
+        """Returns (lines written since the last drain, number of lines dropped in between)."""
+        with self._lock:
+            lines = list(self._lines)
+            self._lines.clear()
+            dropped, self.dropped = self.dropped, 0
+        return lines, dropped
 
 # ========== TOOLTIP CLASS (FIXED) ==========
 class ToolTip(object):
@@ -116,32 +145,56 @@ class FaceFinderGUI(tk.Tk):
         self.title("DeepFace GUI Face Finder v0.4.3 (Volume Fix)")
         self.geometry("1200x950") 
 
-        self.hits_log_df = pd.DataFrame()
         self.running_thread = None
         self.stop_event = threading.Event() 
+        self.model_state = "loading"  # loading -> ready / failed (TensorFlow + model load in the background)
+        self.active_engine = None  # engine of the running job; its progress is polled for the status bar
+        self.settings = copy.deepcopy(DEFAULT_CONFIG)  # engine config keys; replaced by the saved ones in _load_initial_config
         
         self.skip_indexing_var = tk.BooleanVar(value=True) 
+        self.use_ann_var = tk.BooleanVar(value=self.settings["use_ann"])
+        self.deduplicate_var = tk.BooleanVar(value=self.settings["deduplicate"])
         
         # Extension Vars for Checkboxes
         self.ext_vars = {}
-        for ext in ENABLED_EXTENSIONS.keys():
+        for ext in self.settings["enabled_extensions"].keys():
             self.ext_vars[ext] = tk.BooleanVar(value=True)
 
-        if not os.path.exists(OUTPUT_DIR):
-            os.makedirs(OUTPUT_DIR, exist_ok=True)
-        self.HITS_LOG = os.path.join(OUTPUT_DIR, "hits_log.csv")
+        if not os.path.exists(self.settings["output_dir"]):
+            os.makedirs(self.settings["output_dir"], exist_ok=True)
+        self.HITS_LOG = os.path.join(self.settings["output_dir"], "hits_log.csv")
 
         self._create_menu()
         self._create_widgets()
         self._load_initial_config() 
-
-        self.write("--- SYSTEM CHECK ---\n")
-        self.write(check_gpu_status() + "\n")
-        self.write("-" * 20 + "\n\n")
+        self._preload_models()
+
+    def _preload_models(self):
+        """Imports TensorFlow/DeepFace and builds the selected model off the UI thread, so the window shows at once."""
+        model, detector = self.settings["model"], self.settings["detector"]
+        self._update_status(f"Loading face models ({model} + {detector})... settings can be edited meanwhile")
+        def load():
+            start = time.time()
+            try:
+                preload_models(model, detector)
+                self.model_state = "ready"
+                print("--- SYSTEM CHECK ---")
+                print(gpu_status())
+                print(f"🧠 {model} + {detector} loaded and warmed up in {time.time() - start:.1f}s")
+                print("-" * 20 + "\n")
+                if not self.running_thread: self._update_status("Ready")
+            except Exception as e:
+                self.model_state = "failed"
+                print(f"⚠️ Could not load face models: {e}")
+                if not self.running_thread: self._update_status("Model loading failed (see console)")
+        threading.Thread(target=load, name="model-preload", daemon=True).start()
 
     def _create_menu(self):
         menubar = tk.Menu(self)
         self.config(menu=menubar)
+        file_menu = tk.Menu(menubar, tearoff=0)
+        menubar.add_cascade(label="File", menu=file_menu)
+        file_menu.add_command(label="Export Config for Headless CLI...", command=self._export_engine_config)
         help_menu = tk.Menu(menubar, tearoff=0)
         menubar.add_cascade(label="Help", menu=help_menu)
         help_menu.add_command(label="User Manual / Model Guide", command=self._show_manual)
@@ -169,7 +222,7 @@ class FaceFinderGUI(tk.Tk):
         # 2. Output Dir
         tk.Label(config_frame, text="Output Directory:").grid(row=1, column=0, sticky="w", pady=2)
         self.output_dir_entry = tk.Entry(config_frame, width=70)
-        self.output_dir_entry.insert(0, OUTPUT_DIR) 
+        self.output_dir_entry.insert(0, self.settings["output_dir"])
         self.output_dir_entry.grid(row=1, column=1, columnspan=2, pady=2)
         
         tk.Button(config_frame, text="Browse", command=self._select_output_dir).grid(row=1, column=3, padx=2)
@@ -185,30 +238,62 @@ class FaceFinderGUI(tk.Tk):
         # 4. Model Settings
         tk.Label(config_frame, text="Model:").grid(row=3, column=0, sticky="w", pady=2)
         self.model_var = tk.StringVar(self)
-        self.model_var.set(MODEL)
+        self.model_var.set(self.settings["model"])
         models = ["VGG-Face", "Facenet", "Facenet512", "OpenFace", "DeepFace", "DeepID", "ArcFace", "Dlib", "SFace"]
         om_model = tk.OptionMenu(config_frame, self.model_var, *models)
         om_model.grid(row=3, column=1, sticky="ew", pady=2)
 
         tk.Label(config_frame, text="Detector:").grid(row=3, column=2, sticky="w", pady=2)
         self.detector_var = tk.StringVar(self)
-        self.detector_var.set(DETECTOR)
+        self.detector_var.set(self.settings["detector"])
         detectors = ["opencv", "ssd", "dlib", "mtcnn", "retinaface", "mediapipe", "yolov8"]
         om_detect = tk.OptionMenu(config_frame, self.detector_var, *detectors)
         om_detect.grid(row=3, column=3, sticky="ew", pady=2)
 
         tk.Label(config_frame, text="Distance Metric:").grid(row=4, column=0, sticky="w", pady=2)
         self.metric_var = tk.StringVar(self)
-        self.metric_var.set(DIST_METRIC)
+        self.metric_var.set(self.settings["distance_metric"])
         metrics = ["cosine", "euclidean", "euclidean_l2"]
         om_metric = tk.OptionMenu(config_frame, self.metric_var, *metrics)
         om_metric.grid(row=4, column=1, sticky="ew", pady=2)
 
         tk.Label(config_frame, text="Max Distance:").grid(row=4, column=2, sticky="w", pady=2)
         self.max_dist_entry = tk.Entry(config_frame, width=10)
-        self.max_dist_entry.insert(0, str(MAX_DIST))
+        self.max_dist_entry.insert(0, str(self.settings["max_dist"]))
         self.max_dist_entry.grid(row=4, column=3, sticky="w", pady=2)
 
+        tk.Label(config_frame, text="Batch Size:").grid(row=5, column=0, sticky="w", pady=2)
+        self.batch_size_entry = tk.Entry(config_frame, width=10)
+        self.batch_size_entry.insert(0, str(self.settings["batch_size"]))
+        self.batch_size_entry.grid(row=5, column=1, sticky="w", pady=2)
+        self._add_tooltip(self.batch_size_entry, "Faces sent through the recognition model in one forward pass while indexing.\n16-32 is a good start on CPU. 1 = one file at a time (old behaviour).")
+
+        tk.Label(config_frame, text="Index Workers:").grid(row=5, column=2, sticky="w", pady=2)
+        self.worker_count_entry = tk.Entry(config_frame, width=10)
+        self.worker_count_entry.insert(0, str(self.settings["worker_count"]))
+        self.worker_count_entry.grid(row=5, column=3, sticky="w", pady=2)
+        self._add_tooltip(self.worker_count_entry, "Processes used for indexing. Each loads the model once (RAM/VRAM per worker!).\n1 = index inside the app process.")
+
+        tk.Label(config_frame, text="Output Mode:").grid(row=6, column=0, sticky="w", pady=2)
+        self.output_mode_var = tk.StringVar(self)
+        self.output_mode_var.set(self.settings["output_mode"])
+        om_output = tk.OptionMenu(config_frame, self.output_mode_var, *OUTPUT_MODES)
+        om_output.grid(row=6, column=1, sticky="ew", pady=2)
+        self._add_tooltip(om_output, "copy: independent copies (default)\nhardlink: no extra disk space, archive and output on the same drive\nreflink: copy-on-write clone (Btrfs/XFS/APFS)\nsymlink: links to the archive files\nmanifest: only list matches in <person>/manifest.txt\nLinks and clones fall back to copying where they aren't possible.")
+
+        tk.Label(config_frame, text="Detector Cascade:").grid(row=6, column=2, sticky="w", pady=2)
+        self.cascade_var = tk.StringVar(self)
+        self.cascade_var.set(self.settings["cascade_detector"])
+        om_cascade = tk.OptionMenu(config_frame, self.cascade_var, "off", "opencv", "ssd")
+        om_cascade.grid(row=6, column=3, sticky="ew", pady=2)
+        self._add_tooltip(om_cascade, "A fast detector screens a downscaled copy of each photo first; the main detector\nonly runs where it finds a face. Much faster on archives full of landscapes/documents.\nA few rejected photos are double-checked; if too many had faces, the cascade turns itself off.")
+
+        tk.Label(config_frame, text="Detect Max Edge:").grid(row=7, column=0, sticky="w", pady=2)
+        self.detect_max_edge_entry = tk.Entry(config_frame, width=10)
+        self.detect_max_edge_entry.insert(0, str(self.settings["detect_max_edge"]))
+        self.detect_max_edge_entry.grid(row=7, column=1, sticky="w", pady=2)
+        self._add_tooltip(self.detect_max_edge_entry, "Longest edge (px) photos are decoded at to find faces; the faces themselves are\ncut from a larger decode. Big camera JPEGs load several times faster.\n0 = full resolution. Only used with Batch Size > 1.")
+
         # === FILTERS & EXCLUSIONS FRAME ===
         filter_frame = tk.LabelFrame(self, text="Filters & Exclusions", padx=10, pady=5)
         filter_frame.pack(side=tk.TOP, fill=tk.X, padx=10, pady=5)
@@ -246,6 +331,22 @@ class FaceFinderGUI(tk.Tk):
         )
         cb_skip.pack(anchor="w", pady=(0, 5))
 
+        cb_ann = tk.Checkbutton(
+            action_results_frame,
+            text="Approximate Search (ANN index - for multi-million face archives)",
+            variable=self.use_ann_var
+        )
+        cb_ann.pack(anchor="w", pady=(0, 5))
+        self._add_tooltip(cb_ann, "Searches an IVF index built next to the PKL instead of every face.\nMuch faster on huge archives, may miss a few matches (recall is printed when the index is built).\nUntick for exact search.")
+
+        cb_dedup = tk.Checkbutton(
+            action_results_frame,
+            text="Skip Duplicates (identical copies reuse existing embeddings)",
+            variable=self.deduplicate_var
+        )
+        cb_dedup.pack(anchor="w", pady=(0, 5))
+        self._add_tooltip(cb_dedup, "New photos are hashed first; a byte-identical copy of an already indexed photo\n(backups of backups) gets its embeddings without running the model again.\nA summary of the inference saved is printed after indexing.")
+
         button_frame = tk.Frame(action_results_frame)
         button_frame.pack(side=tk.TOP, fill=tk.X, pady=5)
         
@@ -255,6 +356,10 @@ class FaceFinderGUI(tk.Tk):
         btn_index = tk.Button(button_frame, text="Build/Update Indexes Only", command=self._start_indexing_only, bg="#2980b9", fg="white")
         btn_index.pack(side=tk.LEFT, padx=5)
 
+        btn_watch = tk.Button(button_frame, text="Watch Folders", command=self._start_watch, bg="#8e44ad", fg="white")
+        btn_watch.pack(side=tk.LEFT, padx=5)
+        self._add_tooltip(btn_watch, "Keeps running: new or changed photos in the archive folders are indexed\n(and matched against the references, if any) seconds after they land.\nUse 'Stop Analysis' to end it.")
+
         btn_stop = tk.Button(button_frame, text="Stop Analysis", command=self._stop_analysis, bg="red", fg="white")
         btn_stop.pack(side=tk.LEFT, padx=5)
         
@@ -283,8 +388,9 @@ class FaceFinderGUI(tk.Tk):
         self.console_output.tag_config('success', foreground='green')
 
         import sys
-        sys.stdout = self
-        sys.stderr = self
+        self.console_sink = ConsoleLogSink()
+        sys.stdout = sys.stderr = self.console_sink
+        self.after(CONSOLE_REFRESH_MS, self._drain_console)
 
         status_frame = tk.Frame(self, bd=1, relief=tk.SUNKEN)
         status_frame.pack(side=tk.BOTTOM, fill=tk.X)
@@ -298,41 +404,7 @@ class FaceFinderGUI(tk.Tk):
         self.status_var.set("Ready")
         self.status_bar = tk.Label(status_frame, textvariable=self.status_var, anchor=tk.W, font=("Arial", 9))
         self.status_bar.pack(side=tk.LEFT, fill=tk.X, expand=True)
-
-    # =========================================
-    # NEW HELPER: SMART PATH RESOLVER
-    # =========================================
-    def _smart_resolve_path(self, stored_path, current_archive_root):
-        """
-        Attempts to find a file even if the volume/drive letter has changed.
-        1. Checks if the original stored_path exists.
-        2. If not, swaps the drive letter of stored_path with the drive letter of current_archive_root.
-        """
-        # 1. Happy Path: The file exists exactly where the index says it is
-        if os.path.exists(stored_path):
-            return stored_path
-
-        if not current_archive_root:
-            return None
-
-        try:
-            # Break down the paths
-            stored_drive, stored_tail = os.path.splitdrive(stored_path)
-            current_drive, _ = os.path.splitdrive(current_archive_root)
-
-            # 2. Drive Swap Strategy (e.g. C:\Photos\img.jpg -> D:\Photos\img.jpg)
-            # Note: stored_tail usually preserves the leading slash
-            new_path_drive_swap = current_drive + stored_tail
-            
-            if os.path.exists(new_path_drive_swap):
-                return new_path_drive_swap
-            
-            # If still not found, return None (or the attempt, to help debug)
-            return None
-
-        except Exception as e:
-            print(f"Path resolution error: {e}")
-            return None
+        self.after(PROGRESS_POLL_MS, self._poll_progress)
 
     def _update_status(self, message):
         self.after(0, lambda: self.status_var.set(message))
@@ -340,6 +412,15 @@ class FaceFinderGUI(tk.Tk):
     def _update_timer(self, message):
         self.after(0, lambda: self.timer_var.set(message))
 
+    def _poll_progress(self):
+        """Refreshes status bar and save timer from the running engine's counters; reschedules itself."""
+        engine = self.active_engine
+        if engine is not None and not self.stop_event.is_set():
+            status = engine.progress.status_line()
+            if status: self.status_var.set(status)
+            self.timer_var.set(engine.progress.timer_line())
+        self.after(PROGRESS_POLL_MS, self._poll_progress)
+
     def _show_manual(self):
         manual_win = tk.Toplevel(self)
         manual_win.title("User Manual & Guide")
@@ -352,30 +433,28 @@ class FaceFinderGUI(tk.Tk):
         txt.insert(tk.END, "Real-Time Matching enabled. Matches are copied immediately during indexing.\n")
         txt.configure(state=tk.DISABLED)
 
-    def write(self, message):
-        self.console_output.insert(tk.END, message)
-        if "⚠️" in message or "warning" in message.lower():
-            self.console_output.tag_add('warning', self.console_output.index('end-1c linestart'), self.console_output.index('end-1c'))
-        elif "Error" in message or "Traceback" in message or "fail" in message.lower():
-            self.console_output.tag_add('error', self.console_output.index('end-1c linestart'), self.console_output.index('end-1c'))
-        elif "✅" in message or "success" in message.lower():
-            self.console_output.tag_add('success', self.console_output.index('end-1c linestart'), self.console_output.index('end-1c'))
-        else:
-            self.console_output.tag_add('info', self.console_output.index('end-1c linestart'), self.console_output.index('end-1c'))
-        self.console_output.see(tk.END)
-
-    def flush(self): pass
-
-    def _load_image_fixed(self, path):
-        try:
-            img = Image.open(path)
-            img = ImageOps.exif_transpose(img)
-            img = img.convert("RGB") 
-            img_np = np.array(img)
-            img_np = img_np[:, :, ::-1] 
-            return img_np
-        except Exception as e:
-            return path 
+    def _console_tag(self, line):
+        if "⚠️" in line or "warning" in line.lower(): return 'warning'
+        if "Error" in line or "Traceback" in line or "fail" in line.lower(): return 'error'
+        if "✅" in line or "success" in line.lower(): return 'success'
+        return 'info'
+
+    def _drain_console(self):
+        """Moves queued print() output into the console widget; reschedules itself."""
+        lines, dropped = self.console_sink.drain()
+        if lines or dropped:
+            console = self.console_output
+            at_bottom = console.yview()[1] >= 0.999
+            if dropped:
+                console.insert(tk.END, f"... {dropped} lines skipped to keep the console responsive ...\n", 'warning')
+            for line in lines:
+                console.insert(tk.END, line + "\n", self._console_tag(line))
+            excess = int(console.index('end-1c').split('.')[0]) - 1 - CONSOLE_MAX_LINES
+            if excess > 0:
+                console.delete("1.0", f"{excess + 1}.0")
+            if at_bottom:
+                console.see(tk.END)
+        self.after(CONSOLE_REFRESH_MS, self._drain_console)
 
     def _open_file_from_link(self, filepath):
         print(f"🖱️ Link clicked! Attempting to open: {filepath}")
@@ -415,10 +494,9 @@ class FaceFinderGUI(tk.Tk):
         if directory:
             self.output_dir_entry.delete(0, tk.END)
             self.output_dir_entry.insert(0, directory)
-            global OUTPUT_DIR
-            OUTPUT_DIR = directory
-            self.HITS_LOG = os.path.join(OUTPUT_DIR, "hits_log.csv")
-            print(f"Output directory set to: {OUTPUT_DIR}. Hits log will be at: {self.HITS_LOG}")
+            self.settings["output_dir"] = directory
+            self.HITS_LOG = os.path.join(directory, "hits_log.csv")
+            print(f"Output directory set to: {directory}. Hits log will be at: {self.HITS_LOG}")
 
     def _add_reference_person(self):
         person_name = simpledialog.askstring("Add Person", "Enter the name of the person:")
@@ -426,13 +504,13 @@ class FaceFinderGUI(tk.Tk):
             return
         ref_paths = filedialog.askopenfilenames(title=f"Select Reference Images for {person_name}", filetypes=[("Image files", "*.jpg *.jpeg *.png *.gif *.bmp")])
         if ref_paths:
-            REFERENCE_IMAGES_CONFIG[person_name.strip()] = list(ref_paths)
+            self.settings["reference_images_config"][person_name.strip()] = list(ref_paths)
             self._update_ref_images_listbox()
             self._show_selected_ref_images()
 
     def _update_ref_images_listbox(self):
         self.ref_images_listbox.delete(0, tk.END)
-        for person, refs in REFERENCE_IMAGES_CONFIG.items():
+        for person, refs in self.settings["reference_images_config"].items():
             self.ref_images_listbox.insert(tk.END, f"{person}: {len(refs)} images")
 
     def _remove_reference_person(self):
@@ -441,8 +519,8 @@ class FaceFinderGUI(tk.Tk):
         index = selected_indices[0]
         person_name = self.ref_images_listbox.get(index).split(":")[0].strip()
         if messagebox.askyesno("Remove Person", f"Are you sure you want to remove '{person_name}'?"):
-            if person_name in REFERENCE_IMAGES_CONFIG:
-                del REFERENCE_IMAGES_CONFIG[person_name]
+            if person_name in self.settings["reference_images_config"]:
+                del self.settings["reference_images_config"][person_name]
                 self._update_ref_images_listbox()
                 self._clear_image_previews()
 
@@ -452,8 +530,8 @@ class FaceFinderGUI(tk.Tk):
         if not selected_indices: return
         index = selected_indices[0]
         person_name = self.ref_images_listbox.get(index).split(":")[0].strip()
-        if person_name in REFERENCE_IMAGES_CONFIG:
-            for i, ref_path in enumerate(REFERENCE_IMAGES_CONFIG[person_name]):
+        if person_name in self.settings["reference_images_config"]:
+            for i, ref_path in enumerate(self.settings["reference_images_config"][person_name]):
                 try:
                     img = Image.open(ref_path)
                     img = ImageOps.exif_transpose(img)
@@ -468,81 +546,101 @@ class FaceFinderGUI(tk.Tk):
         for widget in self.image_preview_frame.winfo_children(): widget.destroy()
 
     def _get_current_config(self):
-        global ARCHIVE_DIRS, OUTPUT_DIR, MODEL, DETECTOR, DIST_METRIC, MAX_DIST, EXCLUDED_FOLDER_NAMES, ENABLED_EXTENSIONS
-        ARCHIVE_DIRS = list(self.archive_dirs_listbox.get(0, tk.END))
-        EXCLUDED_FOLDER_NAMES = list(self.exclude_listbox.get(0, tk.END))
-        OUTPUT_DIR = self.output_dir_entry.get().strip()
-        self.HITS_LOG = os.path.join(OUTPUT_DIR, "hits_log.csv")
-        MODEL = self.model_var.get()
-        DETECTOR = self.detector_var.get()
-        DIST_METRIC = self.metric_var.get()
+        """Reads the widgets into self.settings; False (nothing changed) if they don't make a usable configuration."""
+        try: max_dist = float(self.max_dist_entry.get().strip())
+        except ValueError: return False
+        settings = self.settings
+        settings["archive_dirs"] = list(self.archive_dirs_listbox.get(0, tk.END))
+        settings["excluded_folder_names"] = list(self.exclude_listbox.get(0, tk.END))
+        settings["output_dir"] = self.output_dir_entry.get().strip()
+        self.HITS_LOG = os.path.join(settings["output_dir"], "hits_log.csv")
+        settings["model"] = self.model_var.get()
+        settings["detector"] = self.detector_var.get()
+        settings["distance_metric"] = self.metric_var.get()
+        settings["max_dist"] = max_dist
+        settings["use_ann"] = self.use_ann_var.get()
+        settings["deduplicate"] = self.deduplicate_var.get()
+        settings["output_mode"] = self.output_mode_var.get()
+        settings["cascade_detector"] = self.cascade_var.get()
         
         # Update enabled extensions
         for ext, var in self.ext_vars.items():
-            ENABLED_EXTENSIONS[ext] = var.get()
-
-        try: MAX_DIST = float(self.max_dist_entry.get().strip())
-        except ValueError: return False
+            settings["enabled_extensions"][ext] = var.get()
+
+        try: settings["batch_size"] = max(1, int(self.batch_size_entry.get().strip()))
+        except ValueError: settings["batch_size"] = 1
+        try: settings["worker_count"] = max(1, int(self.worker_count_entry.get().strip()))
+        except ValueError: settings["worker_count"] = 1
+        try: settings["detect_max_edge"] = max(0, int(self.detect_max_edge_entry.get().strip()))
+        except ValueError: settings["detect_max_edge"] = 0
         
-        if not ARCHIVE_DIRS or not OUTPUT_DIR:
+        if not settings["archive_dirs"] or not settings["output_dir"]:
             messagebox.showerror("Configuration Error", "Please check your Archive and Output directories.")
             return False
-        os.makedirs(OUTPUT_DIR, exist_ok=True)
+        os.makedirs(settings["output_dir"], exist_ok=True)
         return True
 
+    def _config_data(self):
+        """Current settings under the engine's config keys (also the saved-config format)."""
+        return copy.deepcopy(self.settings)
+
+    def _export_engine_config(self):
+        """JSON config for `facefinder_engine.py --config ...` (cron/systemd runs without the GUI)."""
+        if not self._get_current_config(): return
+        path = filedialog.asksaveasfilename(title="Export config", defaultextension=".json", initialfile="facefinder.json", filetypes=[("JSON", "*.json")])
+        if not path: return
+        config_data = self._config_data()
+        if config_data["reference_cache_file"] in ("", os.path.abspath(REFERENCE_CACHE_FILE)):
+            config_data["reference_cache_file"] = ""  # the GUI's own cache: headless runs keep one next to their config
+        try:
+            save_config(config_data, path)
+            print(f"Engine config exported to {path}")
+        except Exception as e: print(f"⚠️ Error exporting configuration: {e}")
+
     def _save_config(self):
         if not self._get_current_config(): return
-        config_data = {
-            "archive_dirs": ARCHIVE_DIRS, "output_dir": OUTPUT_DIR,
-            "reference_images_config": REFERENCE_IMAGES_CONFIG, "model": MODEL,
-            "detector": DETECTOR, "distance_metric": DIST_METRIC, "max_dist": MAX_DIST,
-            "excluded_folder_names": EXCLUDED_FOLDER_NAMES,
-            "enabled_extensions": ENABLED_EXTENSIONS
-        }
+        config_data = self._config_data()
         try:
-            with open("deepface_gui_config.pkl", "wb") as f: pickle.dump(config_data, f)
+            with open(GUI_CONFIG_FILE, "wb") as f: pickle.dump(config_data, f)
             print("Configuration saved successfully.")
         except Exception as e: print(f"⚠️ Error saving configuration: {e}")
 
     def _load_initial_config(self):
-        global ARCHIVE_DIRS, OUTPUT_DIR, REFERENCE_IMAGES_CONFIG, MODEL, DETECTOR, DIST_METRIC, MAX_DIST, EXCLUDED_FOLDER_NAMES, ENABLED_EXTENSIONS
-        try:
-            with open("deepface_gui_config.pkl", "rb") as f:
-                config_data = pickle.load(f)
-            ARCHIVE_DIRS = config_data.get("archive_dirs", [])
-            OUTPUT_DIR = config_data.get("output_dir", os.path.join(os.path.expanduser("~"), "DeepFaceHits"))
-            REFERENCE_IMAGES_CONFIG = config_data.get("reference_images_config", {})
-            MODEL = config_data.get("model", "ArcFace")
-            DETECTOR = config_data.get("detector", "retinaface")
-            DIST_METRIC = config_data.get("distance_metric", "cosine")
-            MAX_DIST = config_data.get("max_dist", 0.28)
-            EXCLUDED_FOLDER_NAMES = config_data.get("excluded_folder_names", ["$RECYCLE.BIN", "System Volume Information", ".git", "__pycache__"])
-            loaded_exts = config_data.get("enabled_extensions", {})
-            
-            # Merge loaded extensions with defaults
-            for ext, val in loaded_exts.items():
-                ENABLED_EXTENSIONS[ext] = val
-
-            # UI Populate
-            for d in ARCHIVE_DIRS: self.archive_dirs_listbox.insert(tk.END, d)
-            for d in EXCLUDED_FOLDER_NAMES: self.exclude_listbox.insert(tk.END, d)
-            
-            self.output_dir_entry.delete(0, tk.END)
-            self.output_dir_entry.insert(0, OUTPUT_DIR)
-            self._update_ref_images_listbox()
-            self.model_var.set(MODEL)
-            self.detector_var.set(DETECTOR)
-            self.metric_var.set(DIST_METRIC)
-            self.max_dist_entry.delete(0, tk.END)
-            self.max_dist_entry.insert(0, str(MAX_DIST))
-            
-            # Set checkboxes
-            for ext, var in self.ext_vars.items():
-                if ext in ENABLED_EXTENSIONS:
-                    var.set(ENABLED_EXTENSIONS[ext])
-
-            self.HITS_LOG = os.path.join(OUTPUT_DIR, "hits_log.csv")
-        except: print("No saved configuration found. Starting with default values.")
+        """Saved settings (missing keys from DEFAULT_CONFIG, via the engine's load_config) into self.settings and the widgets."""
+        try: self.settings = load_config(GUI_CONFIG_FILE)
+        except FileNotFoundError:
+            print("No saved configuration found. Starting with default values.")
+            return
+        except Exception as e:
+            print(f"⚠️ Could not read saved configuration ({e}). Starting with default values.")
+            return
+        settings = self.settings
+
+        # UI Populate
+        for d in settings["archive_dirs"]: self.archive_dirs_listbox.insert(tk.END, d)
+        for d in settings["excluded_folder_names"]: self.exclude_listbox.insert(tk.END, d)
+        
+        self.output_dir_entry.delete(0, tk.END)
+        self.output_dir_entry.insert(0, settings["output_dir"])
+        self._update_ref_images_listbox()
+        self.model_var.set(settings["model"])
+        self.detector_var.set(settings["detector"])
+        self.metric_var.set(settings["distance_metric"])
+        for entry, key in ((self.max_dist_entry, "max_dist"), (self.batch_size_entry, "batch_size"),
+                           (self.worker_count_entry, "worker_count"), (self.detect_max_edge_entry, "detect_max_edge")):
+            entry.delete(0, tk.END)
+            entry.insert(0, str(settings[key]))
+        self.use_ann_var.set(settings["use_ann"])
+        self.deduplicate_var.set(settings["deduplicate"])
+        self.output_mode_var.set(settings["output_mode"])
+        self.cascade_var.set(settings["cascade_detector"])
+        
+        # Set checkboxes
+        for ext, var in self.ext_vars.items():
+            if ext in settings["enabled_extensions"]:
+                var.set(settings["enabled_extensions"][ext])
+
+        self.HITS_LOG = os.path.join(settings["output_dir"], "hits_log.csv")
 
     # --- Analysis Methods ---
 
@@ -551,13 +649,15 @@ class FaceFinderGUI(tk.Tk):
             messagebox.showinfo("Info", "Analysis is already running.")
             return
         if not self._get_current_config(): return
-        if not REFERENCE_IMAGES_CONFIG:
+        if not self.settings["reference_images_config"]:
             messagebox.showerror("Config Error", "You need at least one Reference Person to run an analysis.")
             return
 
         print("\n--- Starting Analysis ---")
         self.stop_event.clear()
-        self.running_thread = threading.Thread(target=self._run_analysis_in_thread, args=(False,))
+        # Tk variables are read here, on the main thread: the worker only gets plain values
+        skip_indexing = self.skip_indexing_var.get()
+        self.running_thread = threading.Thread(target=self._run_analysis_in_thread, args=(False, skip_indexing))
         self.running_thread.daemon = True
         self.running_thread.start()
 
@@ -573,6 +673,21 @@ class FaceFinderGUI(tk.Tk):
         self.running_thread.daemon = True
         self.running_thread.start()
 
+    def _start_watch(self):
+        if self.running_thread and self.running_thread.is_alive():
+            messagebox.showinfo("Info", "A process is already running.")
+            return
+        if not self._get_current_config(): return
+        if not self.settings["archive_dirs"]:
+            messagebox.showerror("Config Error", "Add at least one Archive Directory to watch.")
+            return
+
+        print("\n--- Starting Watch Mode ---")
+        self.stop_event.clear()
+        self.running_thread = threading.Thread(target=self._run_watch_in_thread)
+        self.running_thread.daemon = True
+        self.running_thread.start()
+
     def _stop_analysis(self):
         if self.running_thread and self.running_thread.is_alive():
             self.stop_event.set()
@@ -580,177 +695,26 @@ class FaceFinderGUI(tk.Tk):
             print("\n--- Stopping Analysis ---")
         else: messagebox.showinfo("Info", "No analysis is currently running.")
 
-    def _precompute_reference_embeddings(self):
-        """Calculates and returns a list of dictionaries containing reference embeddings."""
-        live_refs = []
-        print("🔄 Pre-calculating reference embeddings for live matching...")
-        self._update_status("Pre-calculating reference embeddings...")
-        
-        for person, refs in REFERENCE_IMAGES_CONFIG.items():
-            for ref_path in refs:
-                if not os.path.exists(ref_path): continue
-                try:
-                    img_input = self._load_image_fixed(ref_path)
-                    ref_reps = DeepFace.represent(img_path=img_input, model_name=MODEL, detector_backend=DETECTOR, enforce_detection=False)
-                    if ref_reps:
-                        emb = np.array(ref_reps[0]["embedding"])
-                        if DIST_METRIC == "cosine":
-                            # Pre-normalize to speed up math inside loop
-                            emb = emb / np.linalg.norm(emb)
-                        live_refs.append({
-                            "person": person,
-                            "ref_path": ref_path,
-                            "embedding": emb
-                        })
-                except Exception as e:
-                    print(f"⚠️ Error loading reference {os.path.basename(ref_path)}: {e}")
-        
-        print(f"✅ Loaded {len(live_refs)} reference embeddings.")
-        return live_refs
+    def _engine(self):
+        """Engine for the current settings, reporting to the status bar and stoppable with 'Stop Analysis'."""
+        return FaceFinderEngine(self._config_data(), stop_event=self.stop_event, status_callback=self._update_status)
 
-    def _handle_live_match(self, archive_path, archive_emb, live_refs, archive_dir):
-        """Compare a single new archive embedding against all references and copy matches."""
-        
-        # Pre-normalize archive embedding if cosine (references are already normalized)
-        if DIST_METRIC == "cosine":
-            norm = np.linalg.norm(archive_emb)
-            if norm == 0: return
-            archive_emb_norm = archive_emb / norm
-        
-        for ref in live_refs:
-            ref_emb = ref["embedding"]
-            
-            if DIST_METRIC == "cosine":
-                distance = 1 - np.dot(archive_emb_norm, ref_emb)
-            else:
-                distance = np.linalg.norm(archive_emb - ref_emb)
-            
-            # --- Check Logic ---
-            if distance <= MAX_DIST:
-                # Filter Exact Duplicates (Self-Matches)
-                if distance < 1e-6: continue
-                
-                person = ref["person"]
-                print(f"🔥 LIVE MATCH FOUND! {person} -> {os.path.basename(archive_path)} (dist: {distance:.4f})")
-                
-                # Copy File Logic
-                person_dir = os.path.join(OUTPUT_DIR, person)
-                os.makedirs(person_dir, exist_ok=True)
-                dest_path = os.path.join(person_dir, os.path.basename(archive_path))
-                
-                # Avoid expensive Copy if file exists
-                if not os.path.exists(dest_path):
-                    try:
-                        shutil.copy2(archive_path, dest_path)
-                        # Log to CSV (Memory Only for now, or append mode)
-                        new_row = {
-                            "person": person, "archive_dir": archive_dir, 
-                            "identity": archive_path, "distance": distance, "copied_path": dest_path
-                        }
-                        # Append to in-memory log
-                        self.hits_log_df = pd.concat([self.hits_log_df, pd.DataFrame([new_row])], ignore_index=True)
-                        # Safe atomic save of CSV
-                        self.hits_log_df.to_csv(self.HITS_LOG, index=False)
-                    except Exception as e: print(f"⚠️ Live copy failed: {e}")
-
-    def _run_analysis_in_thread(self, index_only=False):
-        try:
-            self.hits_log_df = self._load_hits_log()
-            
-            # 0. Prepare Live References (if we are not just indexing blind)
-            live_references = []
-            if not index_only and not self.skip_indexing_var.get():
-                live_references = self._precompute_reference_embeddings()
-
-            # 1. Load/Build Embeddings + Live Match
-            all_archive_embeddings = []
-            for archive_dir in ARCHIVE_DIRS:
-                if self.stop_event.is_set(): break
-                
-                should_index = True if index_only else (not self.skip_indexing_var.get())
-                
-                if should_index:
-                    print(f"\n🧠 Checking/Updating index for: {archive_dir}")
-                    # Pass live_references here for real-time matching
-                    self._incremental_index(MODEL, archive_dir, live_references=live_references)
-                    self._update_timer("") 
-                else:
-                    print(f"\n🧠 Using existing index (Read-Only) for: {archive_dir}")
-
-                if index_only: continue
-
-                # Load index for final sweep (or if skipping index)
-                index_path = os.path.join(archive_dir, f"representations_{MODEL.lower()}.pkl")
-                if os.path.exists(index_path):
-                    try:
-                        self._update_status(f"Loading index: {os.path.basename(archive_dir)}")
-                        with open(index_path, 'rb') as f:
-                            archive_df = pickle.load(f)
-                            if "status" not in archive_df.columns: archive_df["status"] = "ok"
-                            filtered = archive_df[archive_df["status"] == "ok"][["identity", "embedding"]]
-                            filtered["archive_dir"] = archive_dir 
-                            if not filtered.empty:
-                                all_archive_embeddings.append(filtered)
-                    except Exception as e: print(f"⚠️ Failed to load index: {e}")
+    def _note_model_loading(self):
+        if self.model_state == "loading":
+            self._update_status("Face models are still loading; the run continues as soon as they are ready...")
 
+    def _run_analysis_in_thread(self, index_only=False, skip_indexing=False):
+        try:
+            self._note_model_loading()
+            engine = self.active_engine = self._engine()
             if index_only:
+                engine.index()
                 print(f"\n{'=' * 60}\n🎉 INDEXING COMPLETE\n{'=' * 60}")
                 self._update_status("Indexing Complete.")
                 self._update_timer("")
                 return
-
-            if not all_archive_embeddings:
-                print("❌ No valid embeddings found.")
-                self._update_status("Error: No embeddings found")
-                return
-            
-            # 2. Final Sweep (Catches matches if 'Skip Indexing' was used, or confirms live matches)
-            # Only runs if we actually loaded data
-            print(f"\n{'=' * 60}\n🔍 Performing Final Verification Sweep\n{'=' * 60}")
-            
-            unified_df = pd.concat(all_archive_embeddings, ignore_index=True)
-            archive_embeddings_np = np.array(unified_df['embedding'].tolist())
-            
-            total_copied = 0
-            for person, refs in REFERENCE_IMAGES_CONFIG.items():
-                if self.stop_event.is_set(): break
-                
-                potential_matches_df = pd.DataFrame()
-                for ref in refs:
-                    if self.stop_event.is_set(): break
-                    if not os.path.exists(ref): continue
-
-                    try:
-                        img_input = self._load_image_fixed(ref)
-                        ref_reps = DeepFace.represent(img_path=img_input, model_name=MODEL, detector_backend=DETECTOR, enforce_detection=False)
-                        if not ref_reps: continue
-                        
-                        ref_embedding = np.array(ref_reps[0]["embedding"])
-
-                        if DIST_METRIC == "cosine":
-                            ref_embedding_norm = ref_embedding / np.linalg.norm(ref_embedding)
-                            archive_embeddings_norm = archive_embeddings_np / np.linalg.norm(archive_embeddings_np, axis=1, keepdims=True)
-                            distances = 1 - np.dot(archive_embeddings_norm, ref_embedding_norm)
-                        else:
-                            distances = np.linalg.norm(archive_embeddings_np - ref_embedding, axis=1)
-
-                        matches_indices = np.where(distances <= MAX_DIST)[0]
-                        
-                        if len(matches_indices) > 0:
-                            matches = unified_df.iloc[matches_indices].copy()
-                            matches["distance"] = distances[matches_indices]
-                            potential_matches_df = pd.concat([potential_matches_df, matches], ignore_index=True)
-                    except: pass
-
-                if not potential_matches_df.empty:
-                    # Pass the first archive dir just as a fallback, though rows have specific ones
-                    default_arch = ARCHIVE_DIRS[0] if ARCHIVE_DIRS else ""
-                    self.hits_log_df, copied = self._copy_hits_for_archive(potential_matches_df, person, default_arch, self.hits_log_df)
-                    total_copied += copied
-
-            if not self.stop_event.is_set():
-                print(f"\n{'=' * 60}\n🎉 COMPLETE\n{'=' * 60}")
-                self._update_status("Analysis Complete.")
+            # Live matching while indexing, then the final sweep (catches matches if 'Skip Indexing' was used)
+            engine.run_analysis(index=not skip_indexing)
 
         except Exception as e:
             print(f"\n--- FATAL ERROR IN ANALYSIS ---: {e}")
@@ -759,251 +723,75 @@ class FaceFinderGUI(tk.Tk):
             print(traceback.format_exc())
         finally:
             self.running_thread = None
+            self.active_engine = None
+            self._update_timer("")
+
+    def _run_watch_in_thread(self):
+        """Catch up once, then index (and live-match) files as they land until Stop is pressed."""
+        try:
+            print("Press 'Stop Analysis' to end watch mode.")
+            self._note_model_loading()
+            self.active_engine = self._engine()
+            self.active_engine.watch()
+        except Exception as e:
+            print(f"\n--- FATAL ERROR IN WATCH MODE ---: {e}")
+            self._update_status("Fatal Error (see console)")
+            import traceback
+            print(traceback.format_exc())
+        finally:
+            self.running_thread = None
+            self.active_engine = None
             self._update_timer("")
 
     def _calculate_min_distances_optimized(self):
         if not self._get_current_config(): return
-        if not REFERENCE_IMAGES_CONFIG:
+        if not self.settings["reference_images_config"]:
             messagebox.showerror("Config Error", "No Reference images.")
             return
 
         self.min_dist_display.delete(1.0, tk.END)
         print("\n--- Calculating Minimum Distances ---")
-        
-        all_archive_embeddings = [] 
-        for archive_dir in ARCHIVE_DIRS:
-            index_path = os.path.join(archive_dir, f"representations_{MODEL.lower()}.pkl")
-            if os.path.exists(index_path):
-                try:
-                    with open(index_path, 'rb') as f:
-                        archive_df = pickle.load(f)
-                        if "status" not in archive_df.columns: archive_df["status"] = "ok" 
-                        filtered = archive_df[archive_df["status"] == "ok"][["identity", "embedding"]]
-                        filtered["archive_dir"] = archive_dir # IMPORTANT: Tag with source dir
-                        if not filtered.empty: all_archive_embeddings.append(filtered)
-                except: pass
-        
-        if not all_archive_embeddings:
+        self._note_model_loading()
+        engine = self._engine()
+
+        def calculate():
+            # off the UI thread: the reference embeddings may wait for the models to finish loading
+            try: results = engine.min_distances()  # One pass over the archive for all references
+            except Exception as e:
+                print(f"⚠️ Min distance calculation failed: {e}")
+                self._update_status("Min Distance Calc Failed (see console)")
+                return
+            self.after(0, lambda: self._show_min_distances(results))
+        threading.Thread(target=calculate, name="min-distances", daemon=True).start()
+
+    def _show_min_distances(self, results):
+        if results is None:
             messagebox.showerror("Error", "No embeddings indexes found.")
             return
 
-        unified_embeddings_df = pd.concat(all_archive_embeddings, ignore_index=True)
-        archive_embeddings_np = np.array(unified_embeddings_df['embedding'].tolist())
-
         self.min_dist_display.tag_config("hyperlink", foreground="blue", underline=1, font=("Segoe UI", 9, "bold"))
         self.min_dist_display.tag_bind("hyperlink", "<Enter>", lambda e: self.min_dist_display.config(cursor="hand2"))
         self.min_dist_display.tag_bind("hyperlink", "<Leave>", lambda e: self.min_dist_display.config(cursor="arrow"))
 
-        for person, refs in REFERENCE_IMAGES_CONFIG.items():
-            for ref_path in refs:
-                if not os.path.exists(ref_path): continue
-                try:
-                    self._update_status(f"Calculating min dist for: {os.path.basename(ref_path)}")
-                    img_input = self._load_image_fixed(ref_path)
-                    ref_reps = DeepFace.represent(img_path=img_input, model_name=MODEL, detector_backend=DETECTOR, enforce_detection=False)
-                    if not ref_reps: continue
-                    ref_embedding = np.array(ref_reps[0]["embedding"])
-
-                    if DIST_METRIC == "cosine":
-                        ref_embedding_norm = ref_embedding / np.linalg.norm(ref_embedding)
-                        archive_embeddings_norm = archive_embeddings_np / np.linalg.norm(archive_embeddings_np, axis=1, keepdims=True)
-                        distances = 1 - np.dot(archive_embeddings_norm, ref_embedding_norm)
-                    else:
-                        distances = np.linalg.norm(archive_embeddings_np - ref_embedding, axis=1)
-                    
-                    distances[distances < 1e-6] = np.inf
-                    min_index = np.argmin(distances)
-                    lowest_dist_for_ref = distances[min_index]
-                    
-                    if lowest_dist_for_ref == np.inf:
-                        self.min_dist_display.insert(tk.END, f"Ref: {os.path.basename(ref_path)} ({person})\nResult: Exact matches only.\n\n")
-                        continue
-
-                    # === SMART PATH RESOLVE FOR LINK ===
-                    raw_match_path = unified_embeddings_df.iloc[min_index]["identity"]
-                    match_archive_root = unified_embeddings_df.iloc[min_index].get("archive_dir", "")
-                    
-                    # Try to resolve it
-                    closest_match_path = self._smart_resolve_path(raw_match_path, match_archive_root)
-                    if not closest_match_path: closest_match_path = raw_match_path
-                    closest_match_path = os.path.abspath(closest_match_path)
-                    # ===================================
-
-                    self.min_dist_display.insert(tk.END, f"Ref: {os.path.basename(ref_path)} ({person})\n")
-                    self.min_dist_display.insert(tk.END, f"  Dist: {lowest_dist_for_ref:.4f}\n")
-                    self.min_dist_display.insert(tk.END, f"  Path: {closest_match_path}\n")
-                    unique_tag = f"link_{int(time.time()*1000)}_{min_index}"
-                    self.min_dist_display.insert(tk.END, "  👉 [ OPEN IMAGE ]\n\n", (unique_tag, "hyperlink"))
-                    self.min_dist_display.tag_bind(unique_tag, "<Button-1>", lambda e, p=closest_match_path: self._open_file_from_link(p))
-
-                except Exception as e: print(f"Error: {e}")
+        for n, result in enumerate(results):
+            person, ref_path, closest_match_path = result["person"], result["ref_path"], result["path"]
+            try:
+                if closest_match_path is None:
+                    self.min_dist_display.insert(tk.END, f"Ref: {os.path.basename(ref_path)} ({person})\nResult: Exact matches only.\n\n")
+                    continue
+
+                self.min_dist_display.insert(tk.END, f"Ref: {os.path.basename(ref_path)} ({person})\n")
+                self.min_dist_display.insert(tk.END, f"  Dist: {result['distance']:.4f}\n")
+                self.min_dist_display.insert(tk.END, f"  Path: {closest_match_path}\n")
+                unique_tag = f"link_{int(time.time()*1000)}_{n}"
+                self.min_dist_display.insert(tk.END, "  👉 [ OPEN IMAGE ]\n\n", (unique_tag, "hyperlink"))
+                self.min_dist_display.tag_bind(unique_tag, "<Button-1>", lambda e, p=closest_match_path: self._open_file_from_link(p))
+
+            except Exception as e: print(f"Error: {e}")
         print("Minimum distances calculation complete.")
         self.min_dist_display.see(tk.END)
         self._update_status("Min Distance Calc Complete")
 
-    def _load_hits_log(self):
-        if os.path.exists(self.HITS_LOG):
-            try: return pd.read_csv(self.HITS_LOG)
-            except: pass
-        return pd.DataFrame(columns=["person", "archive_dir", "identity", "distance", "copied_path"])
-
-    def _atomic_pickle_save(self, df, path):
-        tmp_path = path + ".tmp"
-        try:
-            with open(tmp_path, 'wb') as f: pickle.dump(df, f)
-            os.replace(tmp_path, path)
-        except: 
-            if os.path.exists(tmp_path): os.remove(tmp_path)
-
-    def _incremental_index(self, model_name, db_path, live_references=None):
-        """Scan folder, calc embeddings. If live_references is provided, check matches immediately."""
-        index_path = os.path.join(db_path, f"representations_{model_name.lower()}.pkl")
-        bak_path = index_path + ".bak"
-
-        if os.path.exists(index_path):
-            try: shutil.copy2(index_path, bak_path)
-            except: pass
-
-        existing = pd.DataFrame()
-        processed_paths = set()
-        
-        files_to_try = [index_path, index_path + ".tmp", bak_path]
-        for fp in files_to_try:
-            if os.path.exists(fp):
-                try:
-                    with open(fp, 'rb') as f: existing = pickle.load(f)
-                    if not existing.empty:
-                        if 'identity' in existing.columns: processed_paths = set(existing['identity'].tolist())
-                        break 
-                except: pass
-        
-        if not existing.empty:
-            if "status" not in existing.columns: existing["status"] = "ok"
-            if "error" not in existing.columns: existing["error"] = None
-
-        df = existing.copy()
-        initial_df_len = len(df)
-        last_save_time = time.time()
-
-        # Build dynamic list of allowed extensions
-        allowed_exts = tuple(ext for ext, enabled in ENABLED_EXTENSIONS.items() if enabled)
-
-        def maybe_checkpoint(force=False):
-            nonlocal last_save_time, df
-            now = time.time()
-            remaining = CHECKPOINT_INTERVAL_SECONDS - (now - last_save_time)
-            if remaining < 0: remaining = 0
-            mins, secs = divmod(int(remaining), 60)
-            self._update_timer(f"Next Save: {mins:02d}:{secs:02d}")
-            
-            if force or (now - last_save_time) >= CHECKPOINT_INTERVAL_SECONDS:
-                self._update_timer("Saving Checkpoint...")
-                self._atomic_pickle_save(df, index_path)
-                last_save_time = now
-                print(f"💾 checkpoint saved ({len(df)} entries)")
-
-        for root, dirs, files in os.walk(db_path):
-            # --- EXCLUSION LOGIC ---
-            # Modify dirs in-place to prevent walking into excluded folders
-            dirs[:] = [d for d in dirs if d not in EXCLUDED_FOLDER_NAMES]
-            
-            files.sort() 
-            for file in files:
-                if self.stop_event.is_set(): 
-                    print("🛑 Stop requested. Saving current progress...")
-                    maybe_checkpoint(force=True) 
-                    return df
-
-                # --- EXTENSION FILTER LOGIC ---
-                if not file.lower().endswith(allowed_exts): continue
-                
-                img_path = os.path.join(root, file)
-                
-                self._update_status(f"Indexing: {img_path}")
-                maybe_checkpoint(force=False)
-                
-                if img_path in processed_paths: continue
-
-                try:
-                    reps = DeepFace.represent(img_path=img_path, model_name=model_name, enforce_detection=False, detector_backend=DETECTOR)
-                    if isinstance(reps, list) and len(reps) > 0:
-                        emb = reps[0]["embedding"]
-                        new_row = {"identity": img_path, "embedding": emb, "status": "ok", "error": None}
-                        df = pd.concat([df, pd.DataFrame([new_row])], ignore_index=True)
-                        processed_paths.add(img_path)
-                        
-                        # --- LIVE MATCHING HOOK ---
-                        if live_references:
-                            self._handle_live_match(img_path, np.array(emb), live_references, db_path)
-                        # --------------------------
-
-                except Exception as e:
-                    msg = str(e)
-                    print(f"⚠️ Skipping {img_path}: {msg}")
-                    new_row = {"identity": img_path, "embedding": None, "status": "failed", "error": msg}
-                    df = pd.concat([df, pd.DataFrame([new_row])], ignore_index=True)
-                    processed_paths.add(img_path)
-
-        if len(df) > initial_df_len or not existing.equals(df): maybe_checkpoint(force=True)
-        print(f"✅ index complete: {len(df)} entries saved")
-        return df
-
-    def _copy_hits_for_archive(self, df, person, archive_dir, hits_log_df):
-        if df is None or df.empty: return hits_log_df, 0
-        df = df.sort_values(by="distance").drop_duplicates(subset=["identity"])
-        hits = df[df["distance"] <= MAX_DIST].copy()
-        if hits.empty: return hits_log_df, 0
-
-        person_dir = os.path.join(OUTPUT_DIR, person)
-        os.makedirs(person_dir, exist_ok=True)
-        already_copied = set(hits_log_df["identity"]) if not hits_log_df.empty else set()
-        copied = 0
-        new_rows = []
-
-        for _, row in hits.iterrows():
-            if self.stop_event.is_set(): break 
-            p = row["identity"]
-            dist = row["distance"]
-            # row.get("archive_dir") is the key here - it's the CURRENT ROOT attached to this row
-            src_arch = row.get("archive_dir", archive_dir)
-
-            if p in already_copied: continue 
-            
-            if dist < 1e-6: continue # Skip exact
-
-            try:
-                # === FIX START: Smart Resolve Path ===
-                resolved_path = self._smart_resolve_path(p, src_arch)
-                
-                # If resolved_path is valid, use it. Otherwise fall back to p (original)
-                final_source_path = resolved_path if (resolved_path and os.path.exists(resolved_path)) else p
-                # === FIX END ===
-
-                if os.path.exists(final_source_path):
-                    dest_path = os.path.join(person_dir, os.path.basename(final_source_path))
-                    
-                    # Avoid overwrite if live matching already grabbed it
-                    if not os.path.exists(dest_path):
-                        shutil.copy2(final_source_path, dest_path)
-                        copied += 1
-                        print(f"✅ Copied: {os.path.basename(final_source_path)} (dist: {dist:.4f})")
-                    
-                        new_rows.append({
-                            "person": person, 
-                            "archive_dir": src_arch, 
-                            "identity": p,  # Keep original identity for consistency
-                            "distance": dist, 
-                            "copied_path": dest_path
-                        })
-                else: 
-                    print(f"⚠️ Missing file (skipped copy): {p} (Tried: {final_source_path})")
-            except Exception as e: print(f"⚠️ Copy failed for {p}: {e}")
-
-        if new_rows:
-            hits_log_df = pd.concat([hits_log_df, pd.DataFrame(new_rows)], ignore_index=True)
-            hits_log_df.to_csv(self.HITS_LOG, index=False)
-        return hits_log_df, copied
-
 if __name__ == "__main__":
     app = FaceFinderGUI()
     app.mainloop()
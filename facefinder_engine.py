@@ -0,0 +1,2901 @@
+# /// script
+# requires-python = ">=3.10,<3.11"
+# dependencies = [
+#     "deepface",
+#     "pandas",
+#     "numpy<2",
+#     "pillow",
+#     "tf-keras",
+#     # --- Platform Specifics ---
+#     "tensorflow==2.10.1 ; sys_platform == 'win32'",
+#     "tensorflow[and-cuda] ; sys_platform == 'linux'",
+#     "tensorflow-macos ; sys_platform == 'darwin'",
+#     "tensorflow-metal ; sys_platform == 'darwin'",
+# ]
+# ///
+"""
+FaceFinder engine: indexing, search and copy without any GUI.
+Used by faceFindGUI_0.4.3.py and runnable on its own (cron, systemd, no X / Tk):
+
+    uv run facefinder_engine.py --config facefinder.json index [--live] [--watch]
+    uv run facefinder_engine.py --config facefinder.json search [--no-copy] [--matches matches.csv]
+    uv run facefinder_engine.py --config facefinder.json mindist
+    uv run facefinder_engine.py --config facefinder.json copy matches.csv
+
+The JSON config uses the same keys as the GUI's saved configuration (see DEFAULT_CONFIG);
+the GUI's deepface_gui_config.pkl is accepted as well.
+"""
+import os
+import sys
+import shutil
+import pickle
+import hashlib
+import json
+import importlib
+import csv
+import time
+import argparse
+import signal
+import platform
+import threading
+import collections
+import copy
+import errno
+import queue
+import ctypes
+import ctypes.util
+import select
+import struct
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait as futures_wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+import pandas as pd
+import numpy as np
+from PIL import Image, ImageOps
+
+# ========== LAZY IMPORTS ==========
+class _LazyImport(object):
+    """
+    Stand-in for a heavy module that imports it on first attribute access. TensorFlow and
+    DeepFace take seconds to import; the GUI window, config edits and cached-reference
+    searches should not wait for them. load() can be called early from a background thread.
+    """
+    def __init__(self, module, attr=None):
+        self._module_name = module
+        self._attr = attr
+        self._target = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        if self._target is None:
+            with self._lock:
+                if self._target is None:
+                    target = importlib.import_module(self._module_name)
+                    self._target = getattr(target, self._attr) if self._attr else target
+        return self._target
+
+    @property
+    def loaded(self):
+        return self._target is not None
+
+    def __getattr__(self, name):
+        return getattr(self.load(), name)
+
+tf = _LazyImport("tensorflow")
+DeepFace = _LazyImport("deepface", "DeepFace")
+
+def preload_models(model_name, detector_backend):
+    """Import TensorFlow/DeepFace, build and warm up the models now (e.g. in a background thread at startup)."""
+    tf.load()
+    MODELS.get(model_name, detector_backend)
+
+def gpu_status():
+    """One-line summary of the devices TensorFlow will use (imports TensorFlow)."""
+    try:
+        gpus = tf.config.list_physical_devices('GPU')
+        if gpus: return f"✅ GPU DETECTED: {len(gpus)} device(s) active.\n   DeepFace will use hardware acceleration."
+        return "⚠️ NO GPU DETECTED. DeepFace is running on CPU.\n   Analysis will be significantly slower."
+    except Exception as e:
+        return f"⚠️ Error checking GPU status: {str(e)}"
+
+# --- Configuration ---
+DEFAULT_CONFIG = {
+    "archive_dirs": [],
+    "output_dir": os.path.join(os.path.expanduser("~"), "DeepFaceHits"),
+    "reference_images_config": {},  # person -> [reference image paths]
+    "model": "ArcFace",
+    "detector": "retinaface",
+    "distance_metric": "cosine",
+    "max_dist": 0.28,
+    "batch_size": 16,  # Faces per recognition forward pass while indexing (1 = one DeepFace.represent call per file)
+    "worker_count": 1,  # Indexing processes (1 = embed in the indexing thread itself)
+    "use_ann": False,  # Approximate (IVF) search; False = exact brute force
+    "deduplicate": True,  # Byte-identical copies of an indexed file reuse its embeddings instead of being embedded again
+    "output_mode": "copy",  # How matches land in output_dir/<person>: one of OUTPUT_MODES
+    "detect_max_edge": 1600,  # Batched indexing detects faces on a decode scaled to this longest edge (0 = full resolution); crops still come from a larger decode
+    "cascade_detector": "off",  # Cheap detector (e.g. "opencv", "ssd") deciding whether `detector` runs on an image; "off" = always run it
+    "watch_polling": False,  # Watch mode polls instead of using inotify (network shares are detected and polled anyway)
+    "reference_cache_file": "",  # Reference embedding cache; "" = REFERENCE_CACHE_FILE next to the config file, relative paths from its folder
+    "excluded_folder_names": ["$RECYCLE.BIN", "System Volume Information", ".git", "__pycache__"],
+    "enabled_extensions": {
+        ".jpg": True, ".jpeg": True, ".png": True,
+        ".bmp": True, ".gif": True, ".webp": True, ".tiff": True
+    },
+}
+
+# Engine tunables (not part of the saved configuration)
+PREFETCH_DEPTH = 8  # Images decoded ahead of inference (in-process indexing)
+PREFETCH_THREADS = 4
+SEARCH_CHUNK_ROWS = 32768  # Archive rows per GEMM block in the batched search
+ANN_NPROBE = 16  # IVF lists probed per query (higher = better recall, slower)
+SCAN_THREADS = 8  # Directory listings in flight while crawling an archive (helps most on NAS shares)
+FULL_RESCAN_HOURS = 24  # Re-list every folder at least this often (catches files overwritten in place)
+WATCH_DEBOUNCE_SECONDS = 2.0  # Watch mode: a file must stop changing this long before it is indexed
+WATCH_POLL_SECONDS = 5  # Watch mode without inotify: seconds between polls
+REFERENCE_CACHE_FILE = "reference_embeddings_cache.pkl"  # Reference embeddings by (content hash, model, detector); see reference_cache_file
+CHECKPOINT_INTERVAL_SECONDS = 5 * 60  # 5 minutes
+HITS_FSYNC_ROWS = 64  # hits_log.csv: fsync after this many appended matches...
+HITS_FSYNC_SECONDS = 2.0  # ...or this long after the first unsynced one
+COPY_WORKERS = 4  # Threads copying matched photos into the output folder
+COPY_QUEUE_SIZE = 256  # Copies waiting for a worker before the producer (indexer / sweep) has to wait
+COPY_RETRIES = 3  # Extra attempts for transient I/O errors (NAS hiccups, busy files)
+COPY_RETRY_SECONDS = 0.5  # First retry delay, doubled per attempt
+PROGRESS_RATE_WINDOW_SECONDS = 30  # images/sec and ETA are averaged over this trailing window
+FACE_CROP_MIN_EDGE = 224  # Face crops are cut from a decode where the smallest detected face is at least this wide (up to full resolution)
+FACE_CROP_MARGIN = 0.5  # Context around a face box (share of its size, per side) when it is re-detected on the larger decode
+CONTENT_HASH_BLOCK = 64 * 1024  # Dedup: bytes read from the start and the end of a file for its partial hash
+CASCADE_MAX_EDGE = 640  # Detector cascade: the cheap detector sees each image scaled down to this longest edge
+CASCADE_MIN_CONFIDENCE = 0.0  # Cheap detections at/above this confidence send the image on to the main detector
+CASCADE_AUDIT_RATE = 0.02  # Share of rejected images still run through the main detector to measure misses
+CASCADE_MAX_MISS_RATE = 0.05  # More audited misses than this switch the cascade off for the rest of the run...
+CASCADE_MIN_AUDITS = 20  # ...once at least this many rejected images were audited
+
+def load_config(path):
+    """DEFAULT_CONFIG updated with a JSON config file (or the GUI's pickled deepface_gui_config.pkl)."""
+    if path.lower().endswith(".pkl"):
+        with open(path, "rb") as f: loaded = pickle.load(f)
+    else:
+        with open(path, "r", encoding="utf-8") as f: loaded = json.load(f)
+    unknown = set(loaded) - set(DEFAULT_CONFIG)
+    if unknown: print(f"⚠️ Ignoring unknown config keys: {', '.join(sorted(unknown))}")
+    config = copy.deepcopy(DEFAULT_CONFIG)  # callers (the GUI) edit its lists/dicts in place
+    config.update({k: v for k, v in loaded.items() if k in DEFAULT_CONFIG})
+    config["enabled_extensions"] = dict(DEFAULT_CONFIG["enabled_extensions"], **loaded.get("enabled_extensions", {}))
+    config["reference_cache_file"] = os.path.join(os.path.dirname(os.path.abspath(path)), config["reference_cache_file"] or REFERENCE_CACHE_FILE)
+    return config
+
+def save_config(config, path):
+    with open(path + ".tmp", "w", encoding="utf-8") as f: json.dump(config, f, indent=2, ensure_ascii=False)
+    os.replace(path + ".tmp", path)
+
+# ========== APPEND-ONLY EMBEDDING BUFFER ==========
+def file_signature(st):
+    """(size, mtime_ns, inode) of an os.stat result - what decides whether a file must be re-embedded."""
+    return (int(st.st_size), int(st.st_mtime_ns), int(st.st_ino))
+
+def same_file_signature(old, new):
+    """Inode only counts when both sides know it (0 = unknown, e.g. FAT/SMB shares)."""
+    if old[0] != new[0] or old[1] != new[1]: return False
+    return not (old[2] and new[2]) or old[2] == new[2]
+
+def _facial_area_box(area):
+    """DeepFace facial_area dict -> [x, y, w, h] ints (zeros if unknown)."""
+    if not isinstance(area, dict): return [0, 0, 0, 0]
+    return [int(area.get(k) or 0) for k in ("x", "y", "w", "h")]
+
+class EmbeddingBuffer(object):
+    """
+    Columnar, append-only store for index rows while indexing. Two tables:
+      images  identity / status / error / stat signature per file (Python lists);
+              a re-embedded file's old entry is marked "stale" and dropped at the next checkpoint
+      faces   image id, bbox (x, y, w, h), confidence and float32 embedding per detected face,
+              kept in preallocated numpy arrays that double when full (appends stay O(1))
+    Only converted to a DataFrame (one row per face) at checkpoint time.
+    """
+    def __init__(self, initial_capacity=1024):
+        self.identities = []
+        self.statuses = []
+        self.errors = []
+        self.signatures = []  # (size, mtime_ns, inode) or None if unknown (indexes from older versions)
+        self._capacity = max(1, int(initial_capacity))
+        self._image_ids = np.zeros(self._capacity, dtype=np.int32)
+        self._boxes = np.zeros((self._capacity, 4), dtype=np.int32)
+        self._confidences = np.zeros(self._capacity, dtype=np.float32)
+        self._emb = None  # allocated on the first real embedding (dim unknown until then)
+        self._n_faces = 0
+
+    def __len__(self):
+        return len(self.identities)
+
+    @property
+    def n_faces(self):
+        return self._n_faces
+
+    @property
+    def dim(self):
+        return None if self._emb is None else self._emb.shape[1]
+
+    @property
+    def embeddings(self):
+        """(n_faces, dim) view of the filled part of the face matrix."""
+        if self._emb is None: return np.zeros((0, 0), dtype=np.float32)
+        return self._emb[:self._n_faces]
+
+    @property
+    def face_image_ids(self):
+        return self._image_ids[:self._n_faces]
+
+    @property
+    def face_boxes(self):
+        return self._boxes[:self._n_faces]
+
+    @property
+    def face_confidences(self):
+        return self._confidences[:self._n_faces]
+
+    def _grow(self):
+        self._capacity *= 2
+        for name in ("_image_ids", "_boxes", "_confidences", "_emb"):
+            old = getattr(self, name)
+            if old is None: continue
+            grown = np.zeros((self._capacity,) + old.shape[1:], dtype=old.dtype)
+            grown[:self._n_faces] = old[:self._n_faces]
+            setattr(self, name, grown)
+
+    def _add_face(self, image_id, embedding, box=None, confidence=0.0):
+        vec = np.asarray(embedding, dtype=np.float32).ravel()
+        if self._emb is None:
+            self._emb = np.zeros((self._capacity, vec.shape[0]), dtype=np.float32)
+        elif vec.shape[0] != self._emb.shape[1]:
+            raise ValueError(f"Embedding size {vec.shape[0]} does not match index size {self._emb.shape[1]}")
+        if self._n_faces >= self._capacity: self._grow()
+        i = self._n_faces
+        self._image_ids[i] = image_id
+        self._boxes[i] = box if box is not None else (0, 0, 0, 0)
+        self._confidences[i] = confidence or 0.0
+        self._emb[i] = vec
+        self._n_faces += 1
+
+    def append(self, identity, embedding=None, status="ok", error=None, signature=None):
+        """One image with (at most) one embedding - the legacy single-face row."""
+        image_id = len(self.identities)
+        if embedding is not None: self._add_face(image_id, embedding)
+        self.identities.append(identity)
+        self.statuses.append(status)
+        self.errors.append(error)
+        self.signatures.append(signature)
+
+    def append_faces(self, identity, reps, signature=None):
+        """One image with every face DeepFace.represent returned for it."""
+        image_id = len(self.identities)
+        for rep in reps:
+            self._add_face(image_id, rep["embedding"], _facial_area_box(rep.get("facial_area")), rep.get("face_confidence"))
+        self.identities.append(identity)
+        self.statuses.append("ok")
+        self.errors.append(None)
+        self.signatures.append(signature)
+
+    def face_rows(self, image_id):
+        """Face row indices belonging to an image (faces are appended in image order, so a binary search)."""
+        image_ids = self.face_image_ids
+        return np.arange(np.searchsorted(image_ids, image_id, "left"), np.searchsorted(image_ids, image_id, "right"))
+
+    def mark_stale(self, image_id):
+        """The file changed on disk: its faces stop being searchable and the entry is dropped at the next save."""
+        self.statuses[image_id] = "stale"
+
+    def latest_by_identity(self):
+        """{identity: image id} of the newest non-stale entry per file."""
+        return {identity: i for i, (identity, status) in enumerate(zip(self.identities, self.statuses)) if status != "stale"}
+
+    def searchable_face_mask(self):
+        """True for faces whose image is 'ok' (not failed or stale)."""
+        ok = np.fromiter((status == "ok" for status in self.statuses), dtype=bool, count=len(self.statuses))
+        return ok[self.face_image_ids] if len(ok) else np.zeros(0, dtype=bool)
+
+    @classmethod
+    def from_dataframe(cls, df):
+        """Accepts both the per-face layout and legacy one-row-per-image pickles."""
+        if df is None or df.empty: return cls()
+        buf = cls(initial_capacity=2 * len(df))
+        n = len(df)
+        statuses = df["status"].tolist() if "status" in df.columns else ["ok"] * n
+        errors = df["error"].tolist() if "error" in df.columns else [None] * n
+        boxes = df[["face_x", "face_y", "face_w", "face_h"]].to_numpy() if "face_x" in df.columns else None
+        confidences = df["face_confidence"].tolist() if "face_confidence" in df.columns else None
+        sigs = df[["file_size", "file_mtime_ns", "file_inode"]].to_numpy(dtype=np.int64) if "file_size" in df.columns else None
+        last_identity = None
+        for row, (identity, emb, status, error) in enumerate(zip(df["identity"].tolist(), df["embedding"].tolist(), statuses, errors)):
+            if not isinstance(emb, (list, tuple, np.ndarray)): emb = None
+            if emb is None and status == "ok": status = "failed"
+            if identity == last_identity and emb is not None and buf.statuses[-1] == "ok":
+                # further face of the image on the previous row
+                box = boxes[row] if boxes is not None else None
+                buf._add_face(len(buf.identities) - 1, emb, box, confidences[row] if confidences else 0.0)
+                continue
+            sig = tuple(int(v) for v in sigs[row]) if sigs is not None and sigs[row][0] >= 0 else None
+            buf.append(identity, None, status, error, sig)
+            if emb is not None:
+                box = boxes[row] if boxes is not None else None
+                buf._add_face(len(buf.identities) - 1, emb, box, confidences[row] if confidences else 0.0)
+            last_identity = identity
+        return buf
+
+    def to_dataframe(self):
+        """One row per face (older app versions read it as one row per embedding); faceless images get one row, stale ones none."""
+        matrix = self.embeddings
+        image_ids = self.face_image_ids
+        boxes = self.face_boxes
+        confidences = self.face_confidences
+        face_start = np.searchsorted(image_ids, np.arange(len(self.identities) + 1))
+        rows = []
+        for image_id, (identity, status, error, sig) in enumerate(zip(self.identities, self.statuses, self.errors, self.signatures)):
+            if status == "stale": continue
+            sig = sig or (-1, -1, -1)
+            lo, hi = face_start[image_id], face_start[image_id + 1]
+            if lo == hi:
+                rows.append((identity, None, status, error, 0, 0, 0, 0, 0, 0.0) + sig)
+                continue
+            for face_index, f in enumerate(range(lo, hi)):
+                x, y, w, h = boxes[f]
+                rows.append((identity, matrix[f], status, error, face_index, x, y, w, h, confidences[f]) + sig)
+        return pd.DataFrame(rows, columns=["identity", "embedding", "status", "error", "face_index",
+                                           "face_x", "face_y", "face_w", "face_h", "face_confidence",
+                                           "file_size", "file_mtime_ns", "file_inode"])
+
+# ========== BINARY EMBEDDING STORE ==========
+class EmbeddingStore(object):
+    """
+    Search-side index format kept next to representations_<model>.pkl:
+      representations_<model>.f32.npy    contiguous float32 matrix, one row per detected face (memory-mapped on load)
+      representations_<model>.paths.txt  identity of each matrix row, one per line (repeated for multi-face images)
+      representations_<model>.faces.i32.npy  face index within its image and bbox (x, y, w, h) per row
+      representations_<model>.store.json row count, dim and the signature of the pickle it was built from
+      representations_<model>.norm.f32.npy / .norms.f32.npy  L2-normalised copy + row norms (cosine search)
+    The pickle stays the indexer's resume journal; searches only touch these files.
+    Every write() stamps a new generation; the normalised copy records the generation
+    it was derived from and is (re)built by the first load(normalized=True) after a write,
+    so indexing checkpoints only write the raw matrix.
+    """
+    def __init__(self, db_path, model_name):
+        base = os.path.join(db_path, f"representations_{model_name.lower()}")
+        self.pkl_path = base + ".pkl"
+        self.npy_path = base + ".f32.npy"
+        self.paths_path = base + ".paths.txt"
+        self.faces_path = base + ".faces.i32.npy"
+        self.meta_path = base + ".store.json"
+        self.norm_path = base + ".norm.f32.npy"
+        self.norms_path = base + ".norms.f32.npy"
+        self.norm_meta_path = base + ".norm.json"
+        self.ivf_base = base
+
+    def pickle_signature(self):
+        try:
+            st = os.stat(self.pkl_path)
+            return [st.st_size, st.st_mtime_ns]
+        except OSError:
+            return None
+
+    def _read_meta(self):
+        try:
+            with open(self.meta_path, "r", encoding="utf-8") as f: return json.load(f)
+        except Exception:
+            return None
+
+    def is_current(self):
+        meta = self._read_meta()
+        return bool(meta) and os.path.exists(self.npy_path) and meta.get("source") == self.pickle_signature()
+
+    def write(self, identities, matrix, faces=None):
+        """Atomically replace the store with `identities` / float32 `matrix` / int32 `faces` (same row order)."""
+        if faces is None: faces = np.zeros((len(identities), 5), dtype=np.int32)
+        keep = [i for i, p in enumerate(identities) if "\n" not in p]  # the path table is line-based
+        if len(keep) != len(identities):
+            identities = [identities[i] for i in keep]
+            matrix = matrix[keep]
+            faces = faces[keep]
+        matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        generation = time.time_ns()
+        try:
+            with open(self.npy_path + ".tmp", "wb") as f: np.save(f, matrix)
+            with open(self.faces_path + ".tmp", "wb") as f: np.save(f, np.ascontiguousarray(faces, dtype=np.int32))
+            with open(self.paths_path + ".tmp", "w", encoding="utf-8", newline="\n") as f: f.write("\n".join(identities))
+            os.replace(self.npy_path + ".tmp", self.npy_path)
+            os.replace(self.faces_path + ".tmp", self.faces_path)
+            os.replace(self.paths_path + ".tmp", self.paths_path)
+            meta = {"rows": int(matrix.shape[0]), "dim": int(matrix.shape[1]) if matrix.ndim == 2 else 0,
+                    "source": self.pickle_signature(), "generation": generation}
+            with open(self.meta_path + ".tmp", "w", encoding="utf-8") as f: json.dump(meta, f)
+            os.replace(self.meta_path + ".tmp", self.meta_path)
+        except Exception as e:
+            print(f"⚠️ Could not write binary index {os.path.basename(self.npy_path)}: {e}")
+            for tmp in (self.npy_path + ".tmp", self.faces_path + ".tmp", self.paths_path + ".tmp", self.meta_path + ".tmp"):
+                if os.path.exists(tmp): os.remove(tmp)
+
+    def _write_normalized(self, matrix, generation):
+        """Norms are computed once per generation here, so a cosine query is a single matrix-vector product."""
+        norms = np.linalg.norm(matrix, axis=1).astype(np.float32) if matrix.size else np.zeros((matrix.shape[0],), dtype=np.float32)
+        safe = np.where(norms > 0, norms, 1.0).astype(np.float32)
+        normalized = matrix / safe[:, np.newaxis] if matrix.size else matrix
+        try:
+            with open(self.norm_path + ".tmp", "wb") as f: np.save(f, np.ascontiguousarray(normalized, dtype=np.float32))
+            with open(self.norms_path + ".tmp", "wb") as f: np.save(f, norms)
+            os.replace(self.norm_path + ".tmp", self.norm_path)
+            os.replace(self.norms_path + ".tmp", self.norms_path)
+            with open(self.norm_meta_path + ".tmp", "w", encoding="utf-8") as f: json.dump({"generation": generation}, f)
+            os.replace(self.norm_meta_path + ".tmp", self.norm_meta_path)
+        except Exception as e:
+            print(f"⚠️ Could not write normalised index {os.path.basename(self.norm_path)}: {e}")
+            for tmp in (self.norm_path + ".tmp", self.norms_path + ".tmp", self.norm_meta_path + ".tmp"):
+                if os.path.exists(tmp): os.remove(tmp)
+
+    def _normalized_is_current(self, meta):
+        try:
+            with open(self.norm_meta_path, "r", encoding="utf-8") as f: norm_meta = json.load(f)
+        except Exception:
+            return False
+        return norm_meta.get("generation") == meta.get("generation") and os.path.exists(self.norm_path)
+
+    def write_from_buffer(self, buf):
+        if buf.dim is None: return self.write([], np.zeros((0, 0), dtype=np.float32))
+        image_ids = buf.face_image_ids
+        face_index = np.arange(image_ids.shape[0]) - np.searchsorted(image_ids, image_ids)
+        keep = buf.searchable_face_mask()
+        faces = np.column_stack([face_index, buf.face_boxes]).astype(np.int32)[keep]
+        self.write([buf.identities[i] for i in image_ids[keep]], buf.embeddings[keep], faces)
+
+    def migrate_from_pickle(self):
+        """One-time conversion of an existing representations_<model>.pkl."""
+        with open(self.pkl_path, "rb") as f: df = pickle.load(f)
+        self.write_from_buffer(EmbeddingBuffer.from_dataframe(df))
+
+    def load(self, mmap=True, normalized=False):
+        """
+        (identities, float32 matrix) - the matrix is a read-only memory map unless mmap=False.
+        normalized=True returns the cached unit-length copy (rebuilt first if stale).
+        """
+        meta = self._read_meta()
+        if not meta or meta.get("rows", 0) == 0 or meta.get("dim", 0) == 0:
+            return [], np.zeros((0, 0), dtype=np.float32)
+        if normalized and not self._normalized_is_current(meta):
+            if "generation" not in meta:
+                # store written before generations existed: stamp one so the cache can be validated
+                meta["generation"] = time.time_ns()
+                with open(self.meta_path + ".tmp", "w", encoding="utf-8") as f: json.dump(meta, f)
+                os.replace(self.meta_path + ".tmp", self.meta_path)
+            self._write_normalized(np.load(self.npy_path, mmap_mode="r"), meta["generation"])
+        matrix = np.load(self.norm_path if normalized else self.npy_path, mmap_mode="r" if mmap else None)
+        with open(self.paths_path, "r", encoding="utf-8", newline="\n") as f: identities = f.read().split("\n")
+        if len(identities) != matrix.shape[0] or matrix.shape[0] != meta["rows"]:
+            raise ValueError(f"{os.path.basename(self.npy_path)} and its path table disagree ({matrix.shape[0]} vs {len(identities)} rows)")
+        return identities, matrix
+
+    def load_faces(self):
+        """(rows, 5) int32 of face index + bbox per matrix row; zeros for stores written before multi-face indexing."""
+        meta = self._read_meta() or {}
+        try:
+            faces = np.load(self.faces_path)
+            if faces.shape[0] == meta.get("rows", -1): return faces
+        except Exception: pass
+        return np.zeros((meta.get("rows", 0), 5), dtype=np.int32)
+
+    def ann_index(self, matrix, metric, rebuild=False):
+        """IVF index for `metric` over `matrix` (as returned by load()); built and saved if missing or stale."""
+        path = f"{self.ivf_base}.ivf_{metric}.npz"
+        generation = (self._read_meta() or {}).get("generation", 0)
+        if not rebuild and os.path.exists(path):
+            try:
+                ivf = IVFIndex.load(path)
+                if ivf.generation == generation and ivf.order.shape[0] == matrix.shape[0]: return ivf
+            except Exception: pass
+        print(f"🧭 Building ANN index for {os.path.basename(self.ivf_base)} ({matrix.shape[0]} faces, {metric})...")
+        start = time.time()
+        ivf = IVFIndex.build(matrix, metric, generation)
+        try: ivf.save(path)
+        except Exception as e: print(f"⚠️ Could not save ANN index: {e}")
+        print(f"📈 ANN index ready in {time.time() - start:.1f}s: {ivf.n_lists} lists, "
+              f"recall@10 vs exact = {ivf.recall(matrix):.3f} (nprobe={ANN_NPROBE})")
+        return ivf
+
+    def load_or_migrate(self, mmap=True, normalized=False):
+        """Load the store, (re)building it first from the pickle if it is missing or older than the pickle."""
+        if not self.is_current():
+            if not os.path.exists(self.pkl_path): return [], np.zeros((0, 0), dtype=np.float32)
+            print(f"🔄 Converting {os.path.basename(self.pkl_path)} to the binary search index (one-time)...")
+            self.migrate_from_pickle()
+        return self.load(mmap=mmap, normalized=normalized)
+
+# ========== BATCHED SEARCH ==========
+def batched_distance_search(archive_matrix, ref_matrix, metric, max_dist=None, chunk_rows=SEARCH_CHUNK_ROWS, should_stop=None):
+    """
+    Archive x references distances in one chunked GEMM (a single pass over the archive).
+    For cosine both matrices must already be unit-length. Accumulates in float64 so the
+    exact-duplicate filter (dist < 1e-6) behaves like the old per-reference math.
+    Returns (best_dist, best_idx, hits):
+      best_dist/best_idx  nearest non-identical archive row per reference (inf/-1 if none)
+      hits                per reference, (row_indices, distances) with distance <= max_dist
+    """
+    refs = np.asarray(ref_matrix, dtype=np.float64)
+    n_refs = refs.shape[0]
+    best_dist = np.full(n_refs, np.inf)
+    best_idx = np.full(n_refs, -1, dtype=np.int64)
+    hit_rows = [[] for _ in range(n_refs)]
+    hit_dists = [[] for _ in range(n_refs)]
+    refs_sq = np.einsum("ij,ij->i", refs, refs)
+
+    for start in range(0, archive_matrix.shape[0], chunk_rows):
+        if should_stop and should_stop(): break
+        block_rows = np.asarray(archive_matrix[start:start + chunk_rows], dtype=np.float64)
+        dots = block_rows @ refs.T
+        if metric == "cosine":
+            block = 1 - dots
+        else:
+            rows_sq = np.einsum("ij,ij->i", block_rows, block_rows)
+            block = np.sqrt(np.maximum(rows_sq[:, np.newaxis] + refs_sq[np.newaxis, :] - 2 * dots, 0))
+
+        if max_dist is not None:
+            rows, cols = np.nonzero(block <= max_dist)
+            for r in np.unique(cols):
+                sel = cols == r
+                hit_rows[r].append(rows[sel] + start)
+                hit_dists[r].append(block[rows[sel], r])
+
+        block[block < 1e-6] = np.inf
+        local_idx = np.argmin(block, axis=0)
+        local_best = block[local_idx, np.arange(n_refs)]
+        better = local_best < best_dist
+        best_dist[better] = local_best[better]
+        best_idx[better] = local_idx[better] + start
+
+    hits = [(np.concatenate(hit_rows[r]) if hit_rows[r] else np.zeros(0, dtype=np.int64),
+             np.concatenate(hit_dists[r]) if hit_dists[r] else np.zeros(0))
+            for r in range(n_refs)]
+    return best_dist, best_idx, hits
+
+# ========== APPROXIMATE NEAREST NEIGHBOUR INDEX ==========
+def _rows_distance(rows, query, metric):
+    rows = np.asarray(rows, dtype=np.float64)
+    if metric == "cosine": return 1 - rows @ query
+    return np.linalg.norm(rows - query, axis=1)
+
+def exact_topk(matrix, queries, metric, k, chunk_rows=SEARCH_CHUNK_ROWS):
+    """Brute-force k nearest rows per query (indices, distances), used as ground truth for recall."""
+    queries = np.asarray(queries, dtype=np.float64)
+    best_d = np.full((len(queries), 0), np.inf)
+    best_i = np.zeros((len(queries), 0), dtype=np.int64)
+    for start in range(0, matrix.shape[0], chunk_rows):
+        block = np.asarray(matrix[start:start + chunk_rows], dtype=np.float64)
+        if metric == "cosine": d = 1 - queries @ block.T
+        else: d = np.sqrt(np.maximum((queries ** 2).sum(1)[:, None] + (block ** 2).sum(1)[None, :] - 2 * queries @ block.T, 0))
+        best_d = np.hstack([best_d, d])
+        best_i = np.hstack([best_i, np.broadcast_to(np.arange(start, start + block.shape[0]), d.shape)])
+        keep = np.argsort(best_d, axis=1)[:, :k]
+        best_d = np.take_along_axis(best_d, keep, 1)
+        best_i = np.take_along_axis(best_i, keep, 1)
+    return best_i, best_d
+
+class IVFIndex(object):
+    """
+    Inverted-file ANN index: k-means coarse quantiser over the archive matrix, exact
+    re-ranking inside the `nprobe` closest lists. Pure numpy, persisted next to the
+    binary store and tied to its generation so it is rebuilt when the index changes.
+    """
+    def __init__(self, centroids, order, offsets, metric, generation):
+        self.centroids = centroids
+        self.order = order        # archive rows grouped by list
+        self.offsets = offsets    # list i = order[offsets[i]:offsets[i + 1]]
+        self.metric = metric
+        self.generation = generation
+
+    @property
+    def n_lists(self):
+        return self.centroids.shape[0]
+
+    @staticmethod
+    def _nearest_centroids(x, centroids, metric, n=1):
+        x = np.asarray(x, dtype=np.float32)
+        if metric == "cosine": scores = -(x @ centroids.T)
+        else: scores = (centroids ** 2).sum(1)[None, :] - 2 * (x @ centroids.T)
+        if n == 1: return np.argmin(scores, axis=1)
+        n = min(n, centroids.shape[0])
+        return np.argpartition(scores, n - 1, axis=1)[:, :n]
+
+    @classmethod
+    def build(cls, matrix, metric, generation, n_lists=None, iters=10, seed=0):
+        n = matrix.shape[0]
+        n_lists = n_lists or max(1, min(n, int(np.sqrt(n))))
+        rng = np.random.default_rng(seed)
+        sample_idx = np.sort(rng.choice(n, size=min(n, 64 * n_lists), replace=False))
+        sample = np.asarray(matrix[sample_idx], dtype=np.float32)
+        centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)].copy()
+        for _ in range(iters):
+            labels = cls._nearest_centroids(sample, centroids, metric)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            counts = np.bincount(labels, minlength=n_lists)
+            filled = counts > 0
+            centroids[filled] = sums[filled] / counts[filled, None]
+            if metric == "cosine":
+                centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+        labels = np.concatenate([cls._nearest_centroids(matrix[s:s + SEARCH_CHUNK_ROWS], centroids, metric)
+                                 for s in range(0, n, SEARCH_CHUNK_ROWS)]) if n else np.zeros(0, dtype=np.int64)
+        order = np.argsort(labels, kind="stable").astype(np.int64)
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(labels, minlength=n_lists))]).astype(np.int64)
+        return cls(centroids.astype(np.float32), order, offsets, metric, generation)
+
+    def save(self, path):
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, centroids=self.centroids, order=self.order, offsets=self.offsets,
+                 metric=np.array(self.metric), generation=np.array(self.generation, dtype=np.int64))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["centroids"], data["order"], data["offsets"], str(data["metric"]), int(data["generation"]))
+
+    def search(self, matrix, queries, k=None, radius=None, nprobe=ANN_NPROBE):
+        """Per query: (row indices, distances) sorted by distance - top-k and/or within radius."""
+        queries = np.asarray(queries, dtype=np.float64)
+        probes = self._nearest_centroids(queries, self.centroids, self.metric, n=nprobe)
+        if probes.ndim == 1: probes = probes[:, None]
+        results = []
+        for query, lists in zip(queries, probes):
+            cand = np.sort(np.concatenate([self.order[self.offsets[c]:self.offsets[c + 1]] for c in lists]))
+            if not len(cand):
+                results.append((cand, np.zeros(0)))
+                continue
+            d = _rows_distance(matrix[cand], query, self.metric)
+            sel = np.argsort(d)
+            if radius is not None: sel = sel[d[sel] <= radius]
+            if k is not None: sel = sel[:k]
+            results.append((cand[sel], d[sel]))
+        return results
+
+    def recall(self, matrix, k=10, n_queries=200, nprobe=ANN_NPROBE, seed=1):
+        """recall@k against brute force, using archive rows as sample queries."""
+        n = matrix.shape[0]
+        if n == 0: return 1.0
+        idx = np.random.default_rng(seed).choice(n, size=min(n, n_queries), replace=False)
+        queries = np.asarray(matrix[np.sort(idx)], dtype=np.float64)
+        truth, _ = exact_topk(matrix, queries, self.metric, k)
+        approx = self.search(matrix, queries, k=k, nprobe=nprobe)
+        found = sum(len(set(t) & set(a)) for t, (a, _) in zip(truth, approx))
+        return found / float(truth.size)
+
+# ========== IMAGE LOADING ==========
+DRAFT_SLACK = 0.75  # Reduced decodes end up between this share of max_edge and max_edge (lets the JPEG decoder do all the scaling)
+
+def load_image_fixed(path, max_edge=None):
+    """
+    EXIF-rotated BGR array for DeepFace; returns the path unchanged if PIL can't read it.
+    max_edge: cap on the longest edge. JPEGs are then decoded at 1/2..1/8 scale right
+    in the decoder (draft mode), so the full-resolution pixels are never materialized.
+    """
+    try:
+        img = Image.open(path)
+        if max_edge and max(img.size) > max_edge:
+            shrink = max(img.size) / (max_edge * DRAFT_SLACK)
+            img.draft("RGB", (int(img.size[0] / shrink), int(img.size[1] / shrink)))  # no-op for non-JPEGs
+            img = ImageOps.exif_transpose(img)
+            img.thumbnail((max_edge, max_edge), Image.BILINEAR)
+        else: img = ImageOps.exif_transpose(img)
+        img = img.convert("RGB") 
+        img_np = np.array(img)
+        img_np = img_np[:, :, ::-1] 
+        return img_np
+    except Exception as e:
+        return path 
+
+# ========== ARCHIVE CRAWLER ==========
+class ArchiveCrawler(object):
+    """
+    Parallel os.scandir crawl of an archive that fans out across subdirectories.
+    Folders whose mtime matches the last completed crawl are not listed again (their
+    cached subfolders are still visited), so a no-op rescan costs one stat per folder
+    instead of one per file. A folder's mtime only changes when entries are added,
+    removed or renamed; files overwritten in place are caught by the full rescan that
+    runs every FULL_RESCAN_HOURS, or whenever the index file was changed behind our back.
+    cache_path=None keeps the folder state in memory only (see remember()).
+    """
+    def __init__(self, cache_path, index_path, excluded, allowed_exts, threads=SCAN_THREADS):
+        self.cache_path = cache_path
+        self.index_path = index_path
+        self.excluded = set(excluded)
+        self.allowed_exts = tuple(allowed_exts)
+        self.threads = max(1, int(threads))
+        self._config = [sorted(self.excluded), sorted(self.allowed_exts)]
+        cache = {}
+        if cache_path:
+            try:
+                with open(cache_path, "r", encoding="utf-8") as f: cache = json.load(f)
+            except Exception: pass
+        self._last_full = cache.get("full_scan", 0)
+        self.full = (cache.get("config") != self._config or cache.get("index") != self._index_signature()
+                     or time.time() - self._last_full > FULL_RESCAN_HOURS * 3600)
+        self._dirs = {} if self.full else cache.get("dirs", {})
+        self._seen_dirs = {}
+        self.listed = self.skipped = self.files = 0
+
+    def _index_signature(self):
+        if not self.index_path: return None
+        try:
+            st = os.stat(self.index_path)
+            return [st.st_size, st.st_mtime_ns]
+        except OSError:
+            return None
+
+    def _scan_dir(self, path):
+        """(mtime_ns, subfolder names, [(file path, stat)] or None if the folder is unchanged)."""
+        mtime = os.stat(path).st_mtime_ns  # taken before listing, so a file landing mid-listing changes it again
+        cached = self._dirs.get(path)
+        if cached and cached[0] == mtime: return mtime, cached[1], None
+        subdirs, files = [], []
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.name not in self.excluded: subdirs.append(entry.name)
+                    elif entry.name.lower().endswith(self.allowed_exts):
+                        files.append((entry.path, entry.stat()))  # free on Windows: comes with the listing
+                except OSError: continue
+        files.sort()
+        # coarse timestamps (FAT, SMB): a folder touched within the last 2s may change again without a new mtime
+        if time.time_ns() - mtime < 2_000_000_000: mtime = -1
+        return mtime, sorted(subdirs), files
+
+    def crawl(self, root, should_stop=None):
+        """Yield (file path, stat) for every matching file in a changed (listed) folder."""
+        with ThreadPoolExecutor(max_workers=self.threads) as ex:
+            pending = {ex.submit(self._scan_dir, root): root}
+            while pending:
+                if should_stop and should_stop():
+                    for fut in pending: fut.cancel()
+                    return
+                done, _ = futures_wait(pending, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    path = pending.pop(fut)
+                    try: mtime, subdirs, files = fut.result()
+                    except OSError as e:
+                        print(f"⚠️ Cannot list {path}: {e}")
+                        continue
+                    self._seen_dirs[path] = [mtime, subdirs]
+                    for name in subdirs:
+                        sub = os.path.join(path, name)
+                        pending[ex.submit(self._scan_dir, sub)] = sub
+                    if files is None:
+                        self.skipped += 1
+                        continue
+                    self.listed += 1
+                    self.files += len(files)
+                    for item in files: yield item
+
+    def remember(self):
+        """Use this crawl's folder state for the next crawl() of the same object (in-memory polling)."""
+        self._dirs, self._seen_dirs = self._seen_dirs, {}
+        self.listed = self.skipped = self.files = 0
+
+    def forget(self, paths):
+        """Folders of files that were found but never indexed (crashed worker...): list them again next crawl."""
+        for path in paths: self._seen_dirs.pop(os.path.dirname(path), None)
+
+    def save(self):
+        """Remember this crawl's folder state. Only call once every yielded file has been indexed (and the index saved)."""
+        cache = {"config": self._config, "index": self._index_signature(),
+                 "full_scan": time.time() if self.full else self._last_full, "dirs": self._seen_dirs}
+        try:
+            with open(self.cache_path + ".tmp", "w", encoding="utf-8") as f: json.dump(cache, f)
+            os.replace(self.cache_path + ".tmp", self.cache_path)
+        except Exception as e:
+            print(f"⚠️ Could not save folder cache {os.path.basename(self.cache_path)}: {e}")
+            if os.path.exists(self.cache_path + ".tmp"): os.remove(self.cache_path + ".tmp")
+
+# ========== WATCH MODE ==========
+IN_CLOSE_WRITE, IN_MOVED_TO, IN_CREATE = 0x8, 0x80, 0x100
+IN_Q_OVERFLOW, IN_IGNORED, IN_ISDIR = 0x4000, 0x8000, 0x40000000
+# statfs f_type of network filesystems: inotify watches succeed there but only see writes made by this machine
+NETWORK_FILESYSTEMS = {0x6969: "NFS", 0xFF534D42: "CIFS", 0xFE534D42: "SMB2", 0x517B: "SMB", 0x01021997: "9P",
+                       0x564C: "NCP", 0x5346414F: "AFS", 0x00C36400: "CephFS", 0x0BD00BD0: "Lustre", 0x47504653: "GPFS"}
+
+def network_filesystem(path):
+    """Name of the network filesystem `path` is on (NFS, SMB, 9P...), else None (Linux only)."""
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        buf = ctypes.create_string_buffer(256)  # struct statfs; f_type is its first (word-sized) field
+        if libc.statfs(os.fsencode(path), buf) != 0: return None
+        return NETWORK_FILESYSTEMS.get(ctypes.c_long.from_buffer(buf).value & 0xFFFFFFFF)
+    except Exception:
+        return None
+
+class _Inotify(object):
+    """Minimal ctypes binding of Linux inotify (no third-party dependency)."""
+    def __init__(self):
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0: raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.folders = {}  # watch descriptor -> folder
+
+    def add(self, folder):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(folder), IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, f"cannot watch {folder}: {os.strerror(err)}")  # ENOSPC = fs.inotify.max_user_watches reached
+        self.folders[wd] = folder
+
+    def read(self, timeout):
+        """[(folder, name, mask)] received within `timeout` seconds."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready: return []
+        try: data = os.read(self.fd, 1 << 16)
+        except BlockingIOError: return []
+        events, offset = [], 0
+        while offset + 16 <= len(data):
+            wd, mask, _, length = struct.unpack_from("iIII", data, offset)
+            name = data[offset + 16:offset + 16 + length].split(b"\0", 1)[0]
+            offset += 16 + length
+            if mask & IN_IGNORED:
+                self.folders.pop(wd, None)
+                continue
+            events.append((self.folders.get(wd), os.fsdecode(name), mask))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+class ArchiveWatcher(object):
+    """
+    Reports image files that appear or change under the archive folders once their
+    size/mtime has been stable for `debounce` seconds, so copies still in progress are
+    not indexed half-written. Linux uses inotify; elsewhere (or if inotify is unavailable,
+    e.g. the watch limit is reached, an archive is on a network share, or force_poll is set)
+    an in-memory ArchiveCrawler polls every `poll_interval`.
+    Create it before the catch-up indexing run so nothing landing in between is missed.
+    """
+    def __init__(self, roots, excluded, allowed_exts, debounce=None, poll_interval=None, force_poll=False):
+        self.roots = list(roots)
+        self.excluded = set(excluded)
+        self.allowed_exts = tuple(allowed_exts)
+        self.debounce = WATCH_DEBOUNCE_SECONDS if debounce is None else debounce
+        self.poll_interval = WATCH_POLL_SECONDS if poll_interval is None else poll_interval
+        self._pending = {}  # path -> (signature, monotonic time it last changed)
+        self._inotify = None
+        remote = [(root, network_filesystem(root)) for root in self.roots] if platform.system() == "Linux" and not force_poll else []
+        remote = [(root, fs) for root, fs in remote if fs]
+        for root, fs in remote: print(f"ℹ️ {root} is on {fs}: inotify misses files written by other machines, polling every {self.poll_interval}s")
+        if platform.system() == "Linux" and not force_poll and not remote:
+            try:
+                self._inotify = _Inotify()
+                for root in self.roots: self._watch_tree(root)
+            except OSError as e:
+                print(f"⚠️ inotify unavailable ({e}), polling every {self.poll_interval}s instead")
+                if self._inotify: self._inotify.close()
+                self._inotify = None
+        self.mode = "inotify" if self._inotify else "polling"
+        if not self._inotify:
+            self._crawlers = {root: ArchiveCrawler(None, None, excluded, allowed_exts) for root in self.roots}
+            self._known = {}  # root -> {path: signature}
+            for root in self.roots: self._poll(root, seed=True)
+
+    def _watch_tree(self, folder, enqueue=False):
+        """Watch a folder and its subfolders; enqueue=True also queues the files already in it (new folder)."""
+        for sub, dirs, files in os.walk(folder):
+            dirs[:] = [d for d in dirs if d not in self.excluded]
+            self._inotify.add(sub)
+            if enqueue:
+                for name in files: self._touch(os.path.join(sub, name))
+
+    def _touch(self, path):
+        if path.lower().endswith(self.allowed_exts): self._pending[path] = (None, time.monotonic())
+
+    def _poll(self, root, seed=False):
+        crawler = self._crawlers[root]
+        known = self._known.setdefault(root, {})  # path -> signature of every file seen under root
+        listed = set()
+        for path, st in crawler.crawl(root):
+            listed.add(path)
+            self._check(known, path, file_signature(st), seed)
+        crawler.remember()
+        # a file rewritten in place doesn't change its folder's mtime, so unchanged folders aren't
+        # listed: stat their known files instead (deleted ones are forgotten)
+        for path in [p for p in known if p not in listed]:
+            try: self._check(known, path, file_signature(os.stat(path)), seed)
+            except OSError: del known[path]
+
+    def _check(self, known, path, signature, seed):
+        if known.get(path) != signature:
+            known[path] = signature
+            if not seed: self._pending[path] = (signature, time.monotonic())
+
+    def _settled(self):
+        """Pop the pending files that have not changed for `debounce` seconds."""
+        now, ready = time.monotonic(), []
+        for path, (signature, since) in list(self._pending.items()):
+            try: current = file_signature(os.stat(path))
+            except OSError:
+                del self._pending[path]  # deleted or renamed away
+                continue
+            if current != signature: self._pending[path] = (current, now)
+            elif now - since >= self.debounce:
+                ready.append(path)
+                del self._pending[path]
+        return ready
+
+    def _root_of(self, path):
+        return max((r for r in self.roots if path.startswith(os.path.join(r, ""))), key=len, default=None)
+
+    def changes(self, should_stop):
+        """
+        Yield (archive root, [settled paths]) until should_stop() is true.
+        (archive root, None) means events were lost (inotify queue overflow): crawl that archive.
+        """
+        next_poll = time.monotonic() + self.poll_interval
+        while not should_stop():
+            if self._inotify:
+                for folder, name, mask in self._inotify.read(0.5):
+                    if mask & IN_Q_OVERFLOW:
+                        print("⚠️ Too many file events at once, rescanning the archives")
+                        for root in self.roots: yield root, None
+                        continue
+                    if folder is None: continue
+                    path = os.path.join(folder, name)
+                    if not mask & IN_ISDIR: self._touch(path)
+                    elif name not in self.excluded:
+                        try: self._watch_tree(path, enqueue=True)
+                        except OSError as e: print(f"⚠️ {e}")
+            else:
+                time.sleep(0.5)
+                if time.monotonic() >= next_poll:
+                    for root in self.roots: self._poll(root)
+                    next_poll = time.monotonic() + self.poll_interval
+            by_root = {}
+            for path in self._settled():
+                root = self._root_of(path)
+                if root is not None: by_root.setdefault(root, []).append(path)
+            for root, paths in by_root.items(): yield root, sorted(paths)
+
+    def close(self):
+        if self._inotify: self._inotify.close()
+
+# ========== REFERENCE EMBEDDING CACHE ==========
+class ReferenceEmbeddingCache(object):
+    """
+    Disk-backed {(sha256 of file content, model, detector): (embedding, faces found)}.
+    Keyed on content rather than path, so a renamed reference is still a hit and an
+    edited one (same path) is re-embedded.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._dirty = False
+        self._entries = {}
+        if os.path.exists(path):
+            try:
+                with open(path, "rb") as f: self._entries = pickle.load(f)
+            except Exception as e: print(f"⚠️ Ignoring unreadable reference cache {path}: {e}")
+
+    @staticmethod
+    def key(ref_path, model_name, detector_backend):
+        h = hashlib.sha256()
+        with open(ref_path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""): h.update(block)
+        return (h.hexdigest(), model_name, detector_backend)
+
+    def get(self, key):
+        return self._entries.get(key)
+
+    def put(self, key, embedding, n_faces):
+        self._entries[key] = (np.asarray(embedding, dtype=np.float64), int(n_faces))
+        self._dirty = True
+
+    def save(self):
+        if not self._dirty: return
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "wb") as f: pickle.dump(self._entries, f)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+        except Exception as e:
+            print(f"⚠️ Could not save reference cache: {e}")
+            if os.path.exists(tmp_path): os.remove(tmp_path)
+
+# ========== CONTENT-HASH DEDUPLICATION ==========
+def partial_content_hash(path, size):
+    """Digest of the size plus the first and last CONTENT_HASH_BLOCK bytes: two small reads, however big the file."""
+    h = hashlib.blake2b(str(size).encode(), digest_size=16)
+    with open(path, "rb") as f:
+        h.update(f.read(CONTENT_HASH_BLOCK))
+        if size > 2 * CONTENT_HASH_BLOCK: f.seek(-CONTENT_HASH_BLOCK, os.SEEK_END)
+        h.update(f.read(CONTENT_HASH_BLOCK))
+    return h.digest()
+
+def full_content_hash(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""): h.update(block)
+    return h.digest()
+
+class DuplicateFinder(object):
+    """
+    Content hashes of the indexed files of every archive, so byte-identical copies (backups of
+    backups) are embedded once. Per archive, representations_<model>.hashes.pkl maps
+    identity -> [size, mtime_ns, partial hash, full hash or None, faces]. Only files that were
+    actually indexed are entered, so every entry can lend its embeddings to a copy. A shared
+    partial hash is always confirmed with a full SHA-256 of both files before anything is reused.
+    """
+    def __init__(self, archive_dirs, model_name):
+        self.model_name = model_name
+        self._tables = {}  # archive -> {identity: entry}
+        self._by_partial = collections.defaultdict(list)  # partial hash -> [(archive, identity)]
+        self._dirty = set()
+        self._stores = {}  # archive -> (identity -> (first row, faces), matrix, faces) of its binary store
+        self._pending = {}  # path -> [size, mtime_ns, partial, full] of files queued for embedding this run
+        self._queued = collections.defaultdict(list)  # partial hash -> queued paths
+        self._waiting = collections.defaultdict(list)  # queued path -> its copies, recorded with its result
+        self.stats = {"hashed": 0, "full_hashed": 0, "hash_seconds": 0.0, "reused": 0, "in_run": 0, "saved_seconds": 0.0,
+                      "backfilled": 0}
+        for archive in archive_dirs: self._table(archive)
+
+    def _path(self, archive):
+        return os.path.join(archive, f"representations_{self.model_name.lower()}.hashes.pkl")
+
+    def _table(self, archive):
+        table = self._tables.get(archive)
+        if table is None:
+            table = {}
+            try:
+                with open(self._path(archive), "rb") as f: table = pickle.load(f)
+            except FileNotFoundError: pass
+            except Exception as e: print(f"⚠️ Ignoring unreadable content hashes {self._path(archive)}: {e}")
+            self._tables[archive] = table
+            for identity, entry in table.items(): self._by_partial[entry[2]].append((archive, identity))
+        return table
+
+    def _full_hash(self, path):
+        self.stats["full_hashed"] += 1
+        return full_content_hash(path)
+
+    def _backfill(self, archive, indexed):
+        """Enter indexed files [(identity, signature, faces)] that predate the table (e.g. indexed with deduplicate off)."""
+        table = self._table(archive)
+        for identity, signature, n_faces in indexed:
+            entry = table.get(identity)
+            if entry is not None and (entry[0], entry[1]) == (signature[0], signature[1]): continue
+            try: partial = partial_content_hash(identity, signature[0])
+            except OSError: continue
+            self.stats["backfilled"] += 1
+            table[identity] = [signature[0], signature[1], partial, None, int(n_faces)]
+            self._by_partial[partial].append((archive, identity))
+            self._dirty.add(archive)
+
+    def check(self, archive, path, signature, same_size=None):
+        """
+        ("reuse", (archive, identity)) - identical to an indexed file, ("wait", path) - identical to a
+        file queued earlier in this run, or ("embed", None). Hashes are kept for done().
+        same_size(size): indexed files of this archive with that size, as [(identity, signature, faces)];
+        the ones not hashed yet are hashed first, so copies of files indexed before the table existed are found.
+        """
+        start = time.perf_counter()
+        try:
+            self._table(archive)
+            size, mtime_ns = signature[0], signature[1]
+            try: partial = partial_content_hash(path, size)
+            except OSError: return "embed", None
+            self.stats["hashed"] += 1
+            if same_size: self._backfill(archive, same_size(size))
+            pending = self._pending[path] = [size, mtime_ns, partial, None]
+            for other_archive, identity in self._by_partial.get(partial, ()):
+                entry = self._tables[other_archive].get(identity)
+                if identity == path or entry is None or entry[2] != partial: continue
+                try: st = os.stat(identity)
+                except OSError: continue
+                if (st.st_size, st.st_mtime_ns) != (entry[0], entry[1]): continue  # changed since it was embedded
+                if entry[3] is None:
+                    entry[3] = self._full_hash(identity)
+                    self._dirty.add(other_archive)
+                if pending[3] is None: pending[3] = self._full_hash(path)
+                if entry[3] == pending[3]: return "reuse", (other_archive, identity)
+            for queued in self._queued.get(partial, ()):
+                other = self._pending[queued]
+                if other[3] is None: other[3] = self._full_hash(queued)
+                if pending[3] is None: pending[3] = self._full_hash(path)
+                if other[3] == pending[3]:
+                    self._waiting[queued].append(path)
+                    return "wait", queued
+            self._queued[partial].append(path)
+            return "embed", None
+        finally: self.stats["hash_seconds"] += time.perf_counter() - start
+
+    def done(self, archive, path, n_faces=None, reused=False):
+        """path was indexed (n_faces) or failed (None): enter it, and return its waiting copies."""
+        pending = self._pending.pop(path, None)
+        if reused: self.stats["reused"] += 1
+        if pending is None: return []
+        queued = self._queued.get(pending[2])
+        if queued and path in queued: queued.remove(path)
+        table = self._table(archive)
+        if n_faces is None: table.pop(path, None)
+        else:
+            if path not in table or table[path][2] != pending[2]: self._by_partial[pending[2]].append((archive, path))
+            table[path] = pending + [int(n_faces)]
+        self._dirty.add(archive)
+        copies = self._waiting.pop(path, [])
+        self.stats["in_run"] += len(copies)
+        return copies
+
+    def settle(self):
+        """End of an indexing pass: copies still waiting on an unfinished file are retried next run."""
+        self._pending.clear()
+        self._queued.clear()
+        self._waiting.clear()
+
+    def stored_reps(self, archive, identity):
+        """represent-style faces of an indexed file of another archive (from its binary store), or None."""
+        entry = self._table(archive).get(identity)
+        if entry is None: return None
+        if entry[4] == 0: return []
+        if archive not in self._stores:
+            store, rows = EmbeddingStore(archive, self.model_name), {}
+            try:
+                identities, matrix = store.load(mmap=True) if store.is_current() else ([], None)
+                faces = store.load_faces()
+            except Exception: identities, matrix, faces = [], None, None
+            for i, ident in enumerate(identities):
+                first, count = rows.get(ident, (i, 0))
+                rows[ident] = (first, count + 1)
+            self._stores[archive] = (rows, matrix, faces)
+        rows, matrix, faces = self._stores[archive]
+        first, count = rows.get(identity, (0, 0))
+        if count != entry[4]: return None  # store out of date
+        return [{"embedding": np.array(matrix[r], dtype=np.float32),
+                 "facial_area": dict(zip(("x", "y", "w", "h"), faces[r, 1:].tolist())), "face_confidence": 0.0}
+                for r in range(first, first + count)]
+
+    def save(self):
+        for archive in list(self._dirty):
+            path = self._path(archive)
+            try:
+                with open(path + ".tmp", "wb") as f: pickle.dump(self._tables[archive], f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(path + ".tmp", path)
+                self._dirty.discard(archive)
+            except Exception as e: print(f"⚠️ Could not save content hashes {path}: {e}")
+        self._stores.clear()  # other archives may have been re-indexed since
+
+    def summary(self):
+        st = self.stats
+        copies = st["reused"] + st["in_run"]
+        if not st["hashed"]: return None
+        line = f"♊ Duplicates: {copies:,} of {st['hashed']:,} new files are byte-identical copies"
+        if copies:
+            line += f" ({st['reused']:,} of indexed files, {st['in_run']:,} within the run) - embeddings reused"
+            if st["saved_seconds"] > 0: line += f", ≈{_format_duration(st['saved_seconds'])} of inference saved"
+        backfilled = f", {st['backfilled']:,} indexed files hashed" if st["backfilled"] else ""
+        return line + f" | hashing {st['hash_seconds']:.1f}s ({st['full_hashed']:,} full hashes{backfilled})"
+
+# ========== HITS JOURNAL ==========
+class HitsJournal(object):
+    """
+    hits_log.csv as an append-only journal: one CSV line per copied match, fsynced in
+    batches, plus an in-memory map of (person, identity) -> output mode so "already copied?"
+    is O(1) without re-reading the file. A match saved again in a mode that produces the
+    real file (after a symlink or manifest run) gets a new row that supersedes the old one.
+    A torn last line (crash mid-write) or superseded rows are removed by compact(), which
+    runs automatically on load when needed.
+    """
+    COLUMNS = ["person", "archive_dir", "identity", "distance", "copied_path", "mode"]
+    LEGACY_DEFAULTS = {"mode": "copy"}  # logs written before a column existed
+
+    def __init__(self, path, fsync_rows=None, fsync_seconds=None):
+        self.path = path
+        self.fsync_rows = HITS_FSYNC_ROWS if fsync_rows is None else fsync_rows
+        self.fsync_seconds = HITS_FSYNC_SECONDS if fsync_seconds is None else fsync_seconds
+        self.copied = {}  # (person, identity) -> mode it was saved in
+        self._lock = threading.Lock()
+        self._file = None
+        self._writer = None
+        self._unsynced = 0
+        self._first_unsynced = 0.0
+        rows, dirty = self._read()
+        for row in rows: self.copied[(row["person"], row["identity"])] = row["mode"]
+        if dirty: self.compact(rows)
+
+    def _read(self):
+        """Valid rows in file order, and whether the file needs compacting."""
+        if not os.path.exists(self.path): return [], False
+        rows, dirty = {}, False
+        try:
+            with open(self.path, "r", newline="", encoding="utf-8") as f:
+                text = f.read()
+        except OSError as e:
+            print(f"⚠️ Could not read hits log {self.path}: {e}")
+            return [], False
+        if text and not text.endswith("\n"):
+            text, dirty = text[:text.rfind("\n") + 1], True  # torn last line
+        reader = csv.DictReader(text.splitlines())
+        for row in reader:
+            key = (row.get("person"), row.get("identity"))
+            if not key[0] or not key[1] or key in rows:
+                dirty = True
+                if not key[0] or not key[1]: continue
+            rows[key] = {c: row.get(c) or self.LEGACY_DEFAULTS.get(c, "") for c in self.COLUMNS}  # the last row wins
+        if rows and reader.fieldnames != self.COLUMNS: dirty = True  # rewrite with the current header before appending
+        return list(rows.values()), dirty
+
+    def __contains__(self, key):
+        return key in self.copied
+
+    def covers(self, key, mode):
+        """True if key was already saved in a way that makes saving it in mode redundant."""
+        previous = self.copied.get(key)
+        if previous is None: return False
+        if mode in MATERIALIZED_MODES: return previous in MATERIALIZED_MODES  # links and listings don't hold the bytes
+        return mode == "manifest" or previous != "manifest"
+
+    def __len__(self):
+        return len(self.copied)
+
+    def append(self, person, archive_dir, identity, distance, copied_path, mode="copy"):
+        """Journal one copied match; False if (person, identity) was already logged in a mode that covers this one."""
+        with self._lock:
+            if self.covers((person, identity), mode): return False
+            if self._file is None:
+                new = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+                self._file = open(self.path, "a", newline="", encoding="utf-8")
+                self._writer = csv.writer(self._file)
+                if new: self._writer.writerow(self.COLUMNS)
+            self._writer.writerow([person, archive_dir, identity, distance, copied_path, mode])
+            self.copied[(person, identity)] = mode
+            if not self._unsynced: self._first_unsynced = time.time()
+            self._unsynced += 1
+            if self._unsynced >= self.fsync_rows or time.time() - self._first_unsynced >= self.fsync_seconds:
+                self._sync()
+            return True
+
+    def _sync(self):
+        if self._file is None or not self._unsynced: return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+
+    def flush(self):
+        with self._lock: self._sync()
+
+    def close(self):
+        with self._lock:
+            if self._file is None: return
+            self._sync()
+            self._file.close()
+            self._file, self._writer = None, None
+
+    def compact(self, rows=None):
+        """Rewrite the log atomically with one row per (person, identity)."""
+        self.close()
+        if rows is None: rows, _ = self._read()
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=self.COLUMNS)
+            writer.writeheader()
+            writer.writerows(rows)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        print(f"🧹 Compacted hits log: {len(rows)} entries")
+
+# ========== COPY SERVICE ==========
+_PERMANENT_COPY_ERRORS = {errno.ENOENT, errno.EACCES, errno.EPERM, errno.EISDIR, errno.ENOTDIR, errno.ENOSPC, errno.EROFS}
+FICLONE = 0x40049409  # Linux ioctl: share the source's extents (Btrfs, XFS, bcachefs, ZFS 2.2+)
+
+def _reflink(src, dst):
+    """Copy-on-write clone of src; OSError where the filesystem or platform can't."""
+    system = platform.system()
+    if system == "Linux":
+        import fcntl
+        with open(src, "rb") as fs, open(dst, "wb") as fd:
+            try: fcntl.ioctl(fd.fileno(), FICLONE, fs.fileno())
+            except OSError:
+                fd.close()
+                os.remove(dst)
+                raise
+    elif system == "Darwin":
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)  # APFS clonefile(2)
+        if libc.clonefile(os.fsencode(src), os.fsencode(dst), 0) != 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+    else: raise OSError(errno.EOPNOTSUPP, f"reflinks are not supported on {system}")
+    shutil.copystat(src, dst)
+
+def output_file_name(source, archive_dir):
+    """
+    Output name for a match: original name plus a hash of its path inside the archive, so
+    equally named photos from different folders never collide and re-runs map the same
+    photo to the same name. e.g. 2019/Party/IMG_0001.JPG -> IMG_0001_5d41402abc.JPG
+    """
+    rel = os.path.relpath(source, archive_dir) if archive_dir and is_relative_to(source, archive_dir) else os.path.abspath(source)
+    digest = hashlib.sha1(rel.replace("\\", "/").encode("utf-8", "surrogateescape")).hexdigest()[:10]
+    stem, ext = os.path.splitext(os.path.basename(source))
+    return f"{stem}_{digest}{ext}"
+
+def is_relative_to(path, root):
+    try: return os.path.commonpath([os.path.abspath(path), os.path.abspath(root)]) == os.path.abspath(root)
+    except ValueError: return False  # different drives
+
+def _log(message):
+    """print() from worker threads: one write per line, so lines of parallel workers don't interleave."""
+    sys.stdout.write(message + "\n")
+
+def _symlink(src, dst):
+    os.symlink(os.path.abspath(src), dst)
+
+# copy: independent copy (default) | hardlink: same file, no extra space (same filesystem only)
+# reflink: copy-on-write clone | symlink: link to the archive file | manifest: only list the paths
+OUTPUT_MODES = ("copy", "hardlink", "reflink", "symlink", "manifest")
+MATERIALIZED_MODES = ("copy", "hardlink", "reflink")  # the output folder holds the photo itself
+OUTPUT_STRATEGIES = {"hardlink": os.link, "reflink": _reflink, "symlink": _symlink}
+OUTPUT_VERBS = {"copy": "Copied", "hardlink": "Linked", "reflink": "Cloned", "symlink": "Symlinked", "manifest": "Listed"}
+
+class CopyService(object):
+    """
+    Copies matched photos on a few background threads so indexing and the sweep never
+    wait on the output disk. submit() only blocks while COPY_QUEUE_SIZE copies are
+    already waiting. Transient I/O errors are retried with backoff; every finished copy
+    is journaled in hits_log.csv. close() waits for the queue to drain.
+    mode (see OUTPUT_MODES) picks how a match lands in the output folder; links and
+    clones fall back to a plain copy when they aren't possible.
+    """
+    def __init__(self, journal, should_stop=None, mode="copy", workers=None, queue_size=None, retries=None, retry_delay=None):
+        self.journal = journal
+        self.mode = mode
+        self._fallback_reported = False
+        self.should_stop = should_stop or (lambda: False)
+        self.retries = COPY_RETRIES if retries is None else retries
+        self.retry_delay = COPY_RETRY_SECONDS if retry_delay is None else retry_delay
+        self.stats = {}  # person -> {"files", "bytes", "seconds", "failed", "modes"}
+        self.copied = 0
+        self._queue = queue.Queue(maxsize=COPY_QUEUE_SIZE if queue_size is None else queue_size)
+        self._pending = set()  # (person, identity) queued or in progress
+        self._names = {}  # output folder -> file names in it (listed once, then kept up to date here)
+        self._lock = threading.Lock()
+        self._threads = [threading.Thread(target=self._work, name=f"copy-{i}", daemon=True)
+                         for i in range(max(1, COPY_WORKERS if workers is None else workers))]
+        for t in self._threads: t.start()
+
+    def submit(self, person, identity, archive_dir, distance, dest_dir, source=None, live=False):
+        """
+        Queue one copy; False if this person already has (or is getting) this photo. A photo only
+        symlinked or listed by an earlier run is saved again when the mode produces real files.
+        source: the file to read, else identity is resolved against archive_dir in the worker.
+        """
+        key = (person, identity)
+        with self._lock:
+            if key in self._pending or self.journal.covers(key, self.mode): return False
+            self._pending.add(key)
+        self._queue.put((person, identity, archive_dir, distance, dest_dir, source, live))
+        return True
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            try:
+                if job is None: return
+                self._copy(*job)
+            except Exception as e: _log(f"⚠️ Copy failed for {job[1]}: {e}")
+            finally:
+                if job is not None:
+                    with self._lock: self._pending.discard((job[0], job[1]))
+                self._queue.task_done()
+
+    def _copy(self, person, identity, archive_dir, distance, dest_dir, source, live):
+        if self.should_stop(): return  # not journaled: copied on the next run
+        if source is None:
+            resolved = smart_resolve_path(identity, archive_dir)
+            source = resolved if (resolved and os.path.exists(resolved)) else identity
+            if not os.path.exists(source):
+                _log(f"⚠️ Missing file (skipped copy): {identity} (Tried: {source})")
+                return
+        stats = self._person_stats(person)
+        start = time.perf_counter()
+        size = 0
+        if self.mode == "manifest":
+            os.makedirs(dest_dir, exist_ok=True)
+            with self._lock:
+                with open(os.path.join(dest_dir, "manifest.txt"), "a", encoding="utf-8") as f: f.write(source + "\n")
+            mode, dest_path = "manifest", source
+        else:
+            name = output_file_name(source, archive_dir)
+            dest_path = os.path.join(dest_dir, name)
+            if not self._claim_name(dest_dir, name):
+                # already in the output folder (earlier run); a symlink is replaced when real files are wanted
+                if self.mode not in MATERIALIZED_MODES or not os.path.islink(dest_path): return
+                try: os.remove(dest_path)
+                except OSError: pass
+            for attempt in range(self.retries + 1):
+                try:
+                    mode = self._materialize(source, dest_path)
+                    break
+                except OSError as e:
+                    if e.errno in _PERMANENT_COPY_ERRORS or attempt == self.retries or self.should_stop():
+                        with self._lock:
+                            stats["failed"] += 1
+                            self._names[dest_dir].discard(name)
+                        _log(f"⚠️ {'Live copy' if live else 'Copy'} failed for {identity}: {e}")
+                        return
+                    time.sleep(self.retry_delay * 2 ** attempt)
+            if mode == "copy":
+                try: size = os.path.getsize(dest_path)
+                except OSError: pass
+        with self._lock:
+            stats["files"] += 1
+            stats["bytes"] += size
+            stats["seconds"] += time.perf_counter() - start
+            stats["modes"][mode] += 1
+            self.copied += 1
+        self.journal.append(person, archive_dir, identity, distance, dest_path, mode)
+        if not live: _log(f"✅ {OUTPUT_VERBS[mode]}: {os.path.basename(source)} (dist: {distance:.4f})")
+
+    def _claim_name(self, dest_dir, name):
+        """Reserve name in dest_dir; False if it is taken. The folder is only listed the first time."""
+        with self._lock:
+            names = self._names.get(dest_dir)
+            if names is None:
+                os.makedirs(dest_dir, exist_ok=True)
+                names = self._names[dest_dir] = set(os.listdir(dest_dir))
+            if name in names: return False
+            names.add(name)
+            return True
+
+    def _materialize(self, source, dest_path):
+        """Create dest_path with the configured strategy, else a plain copy. Returns the strategy used."""
+        strategy = OUTPUT_STRATEGIES.get(self.mode)
+        if strategy:
+            try:
+                strategy(source, dest_path)
+                return self.mode
+            except OSError as e:
+                with self._lock: report, self._fallback_reported = not self._fallback_reported, True
+                if report: _log(f"⚠️ Output mode '{self.mode}' not possible ({e}); copying instead where it fails.")
+        # copied under a temporary name: a failed or interrupted copy never leaves a half-written dest_path
+        # behind, which _claim_name would take for a finished one on the next run
+        part_path = dest_path + ".part"
+        try:
+            shutil.copy2(source, part_path)
+            os.replace(part_path, dest_path)
+        except BaseException:
+            try: os.remove(part_path)
+            except OSError: pass
+            raise
+        return "copy"
+
+    def _person_stats(self, person):
+        with self._lock:
+            return self.stats.setdefault(person, {"files": 0, "bytes": 0, "seconds": 0.0, "failed": 0,
+                                                  "modes": collections.Counter()})
+
+    def join(self):
+        self._queue.join()
+
+    def close(self):
+        """Finish queued copies and stop the workers."""
+        self.join()
+        for _ in self._threads: self._queue.put(None)
+        for t in self._threads: t.join()
+
+    def summary(self):
+        lines = []
+        for person, st in self.stats.items():
+            mb = st["bytes"] / 1e6
+            modes = ", ".join(f"{n} {mode}" for mode, n in st["modes"].most_common())
+            rate = f" at {mb / st['seconds']:.1f} MB/s per worker" if st["bytes"] and st["seconds"] > 0 else ""
+            failed = f", {st['failed']} failed" if st["failed"] else ""
+            lines.append(f"📤 {person}: {st['files']} saved ({modes or 'none'}), {mb:.1f} MB copied{rate}{failed}")
+        return lines
+
+# ========== MODEL REGISTRY ==========
+WARMUP_IMAGE_SIZE = 224  # Dummy image pushed through detector + model once when a pair is built
+
+class ModelHandle(object):
+    """
+    One recognition model + detector pair, built and warmed up once, used by every
+    embedding call in this process. All inference goes through represent() /
+    detect() / forward(), which also record latency. model_name None = detector only.
+    """
+    def __init__(self, model_name, detector_backend):
+        self.model_name = model_name
+        self.detector_backend = detector_backend
+        self._lock = threading.Lock()
+        self.latency = {}  # op -> {"calls", "items", "seconds", "recent"}
+        start = time.perf_counter()
+        self.model = DeepFace.build_model(model_name) if model_name else None
+        try: self.input_size = _model_input_size(self.model)  # (width, height)
+        except Exception: self.input_size = None
+        # First calls pay graph tracing, detector weight loading and cuDNN autotuning: pay them here, once
+        warmup = np.zeros((WARMUP_IMAGE_SIZE, WARMUP_IMAGE_SIZE, 3), dtype=np.uint8)
+        try:
+            if model_name: self.represent(warmup, op="warm-up")
+            else: self.detect(warmup, align=False, op="warm-up")
+        except Exception: pass
+        self.build_seconds = time.perf_counter() - start
+
+    def _timed(self, op, items, fn, *args, **kwargs):
+        start = time.perf_counter()
+        try: return fn(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                st = self.latency.setdefault(op, {"calls": 0, "items": 0, "seconds": 0.0, "recent": collections.deque(maxlen=1000)})
+                st["calls"] += 1
+                st["items"] += items
+                st["seconds"] += elapsed
+                st["recent"].append(elapsed)
+
+    def represent(self, img, op="represent"):
+        """DeepFace.represent (detect + align + embed) of one image with this pair."""
+        return self._timed(op, 1, DeepFace.represent, img_path=img, model_name=self.model_name,
+                           detector_backend=self.detector_backend, enforce_detection=False)
+
+    def detect(self, img, align=True, op="detect"):
+        return self._timed(op, 1, DeepFace.extract_faces, img_path=img, detector_backend=self.detector_backend,
+                           enforce_detection=False, align=align)
+
+    def forward(self, batch):
+        """Embeddings for a stacked (N, h, w, 3) batch of preprocessed crops."""
+        return self._timed("forward", len(batch), _forward_batch, self.model, batch)
+
+    def seconds_per_image(self, warmup=False):
+        """Measured detect + embed time per image, None before any real inference (warmup=True: the warm-up call counts)."""
+        with self._lock: lat = {op: (st["calls"], st["items"], st["seconds"]) for op, st in self.latency.items()}
+        if "represent" in lat: return lat["represent"][2] / lat["represent"][0]
+        if "detect" in lat and "forward" in lat: return lat["detect"][2] / lat["detect"][0] + lat["forward"][2] / max(1, lat["forward"][1])
+        if warmup and "warm-up" in lat: return lat["warm-up"][2] / lat["warm-up"][0]
+        return None
+
+    def summary(self):
+        parts = []
+        with self._lock:
+            for op, st in self.latency.items():
+                if op == "warm-up": continue
+                p95 = sorted(st["recent"])[int(0.95 * (len(st["recent"]) - 1))] * 1000
+                per = f"{st['seconds'] / st['items'] * 1000:.1f} ms/face" if op == "forward" else f"{st['seconds'] / st['calls'] * 1000:.1f} ms"
+                parts.append(f"{op} {st['calls']:,}× {per} (p95 {p95:.1f} ms/call)")
+        return f"⏱️ {self.model_name or 'detector'} + {self.detector_backend}: built in {self.build_seconds:.1f}s" + (" | " + " | ".join(parts) if parts else "")
+
+class ModelRegistry(object):
+    """Process-wide (model, detector) -> ModelHandle; the first caller builds, everyone else reuses."""
+    def __init__(self):
+        self._handles = {}
+        self._building = {}  # key -> lock held while that pair is built
+        self._lock = threading.Lock()  # guards the two dicts only, never held during a build
+
+    def get(self, model_name, detector_backend):
+        key = (model_name, detector_backend)
+        with self._lock:
+            handle = self._handles.get(key)
+            if handle is not None: return handle
+            build_lock = self._building.setdefault(key, threading.Lock())
+        # only callers of the same pair wait (a preload and an early run never build twice);
+        # e.g. the cascade's detector builds meanwhile. A failed build is retried by the next caller.
+        with build_lock:
+            with self._lock: handle = self._handles.get(key)
+            if handle is None:
+                handle = ModelHandle(model_name, detector_backend)
+                with self._lock:
+                    self._handles[key] = handle
+                    self._building.pop(key, None)
+            return handle
+
+    def peek(self, model_name, detector_backend):
+        """The handle of an already built pair, else None (never builds)."""
+        with self._lock: return self._handles.get((model_name, detector_backend))
+
+    def summary(self):
+        with self._lock: handles = list(self._handles.values())
+        return [h.summary() for h in handles]
+
+MODELS = ModelRegistry()
+
+# ========== DETECTOR CASCADE ==========
+def _real_faces(faces, shape, min_confidence=0.0):
+    """Detections that are actual faces, not the whole-image stand-in DeepFace returns when it finds none."""
+    h, w = shape[:2]
+    real = []
+    for face in faces or []:
+        x, y, fw, fh = _facial_area_box(face.get("facial_area"))
+        if x <= 0 and y <= 0 and fw >= w - 1 and fh >= h - 1: continue
+        if (face.get("confidence", face.get("face_confidence")) or 0.0) < min_confidence: continue
+        real.append(face)
+    return real
+
+class CascadeReject(list):
+    """Empty represent() result of an image the cascade skipped: indexed as "cascade_reject", re-checked once the cascade is off."""
+
+class DetectorCascade(object):
+    """
+    Two-stage detection: a cheap detector looks at a downscaled copy of each image and the
+    main detector only runs where it saw a face. Recall safeguards: the cheap stage is
+    permissive (any detection passes, errors pass), a share of the rejected images is run
+    through the main detector anyway, and too many misses there switch the cascade off.
+    """
+    COUNTERS = ("screened", "rejected", "audited", "missed", "errors", "switched_off")
+
+    def __init__(self, detector_backend, main_detector, max_edge=None, min_confidence=None,
+                 audit_rate=None, max_miss_rate=None, min_audits=None):
+        self.detector_backend = detector_backend
+        self.main_detector = main_detector
+        self.max_edge = max(32, int(max_edge or CASCADE_MAX_EDGE))
+        self.min_confidence = CASCADE_MIN_CONFIDENCE if min_confidence is None else float(min_confidence)
+        self.audit_rate = CASCADE_AUDIT_RATE if audit_rate is None else float(audit_rate)
+        self.max_miss_rate = CASCADE_MAX_MISS_RATE if max_miss_rate is None else float(max_miss_rate)
+        self.min_audits = CASCADE_MIN_AUDITS if min_audits is None else int(min_audits)
+        self._fast = None  # detector-only ModelHandle, from the registry on first use
+        self.reset()
+
+    def reset(self):
+        """New run: zero the counters and re-arm a cascade that switched itself off."""
+        self.active = True
+        self.counts = dict.fromkeys(self.COUNTERS, 0)
+        self._reported = dict(self.counts)
+        self._audit_credit = 0.0
+
+    @property
+    def running(self):
+        """Still screening: not switched off here, nor in an index worker (its counters are merged), nor unavailable."""
+        return self.active and not self.counts["switched_off"]
+
+    def _downscale(self, img):
+        h, w = img.shape[:2]
+        scale = self.max_edge / float(max(h, w))
+        if scale >= 1: return img
+        size = (max(1, int(round(w * scale))), max(1, int(round(h * scale))))
+        return np.asarray(Image.fromarray(np.ascontiguousarray(img)).resize(size, Image.BILINEAR, reducing_gap=2.0))
+
+    def screen(self, img):
+        """'run' the main detector, 'skip' it (no face: index the image as faceless) or 'audit' a rejected image."""
+        if not self.running or not isinstance(img, np.ndarray): return "run"  # undecodable: let the main path report it
+        if self._fast is None:
+            try: self._fast = MODELS.get(None, self.detector_backend)
+            except Exception as e:
+                _log(f"⚠️ Cascade detector {self.detector_backend} unavailable ({e}); running {self.main_detector} on everything.")
+                self.active = False
+                return "run"
+        self.counts["screened"] += 1
+        try:
+            small = self._downscale(img)
+            faces = self._fast.detect(small, align=False, op="screen")
+        except Exception:
+            self.counts["errors"] += 1
+            return "run"
+        if _real_faces(faces, small.shape, self.min_confidence): return "run"
+        self.counts["rejected"] += 1
+        self._audit_credit += self.audit_rate
+        if self._audit_credit < 1: return "skip"
+        self._audit_credit -= 1
+        return "audit"
+
+    def audited(self, faces, shape):
+        """Main-detector result for an audited reject: a face there is a miss of the cheap stage."""
+        self.counts["audited"] += 1
+        if _real_faces(faces, shape): self.counts["missed"] += 1
+        audited, missed = self.counts["audited"], self.counts["missed"]
+        if self.active and audited >= self.min_audits and missed > self.max_miss_rate * audited:
+            self.active = False
+            self.counts["switched_off"] += 1
+            _log(f"⚠️ Cascade: {self.detector_backend} missed faces in {missed} of {audited} audited images; "
+                 f"running {self.main_detector} on everything for the rest of this run.")
+
+    def take_delta(self):
+        """Counters since the last call (index workers send these back with every chunk)."""
+        delta = {k: v - self._reported[k] for k, v in self.counts.items()}
+        self._reported = dict(self.counts)
+        return delta
+
+    def merge(self, delta):
+        for k, v in delta.items(): self.counts[k] += v
+
+    def summary(self):
+        c = self.counts
+        if not c["screened"]: return None
+        skipped = c["rejected"] - c["audited"]
+        line = (f"🪜 Detector cascade ({self.detector_backend} at ≤{self.max_edge}px → {self.main_detector}): "
+                f"{c['screened']:,} screened, {c['rejected']:,} without a face ({c['rejected'] / c['screened']:.0%}), "
+                f"{self.main_detector} skipped on {skipped:,}")
+        if c["audited"]: line += f" | audit: {c['missed']} of {c['audited']} rejected images had a face"
+        if c["errors"]: line += f" | {c['errors']} screening errors (passed on)"
+        if c["switched_off"]: line += " | switched off after too many misses"
+        return line
+
+def represent_screened(models, img, cascade=None):
+    """models.represent() behind the cascade: CascadeReject() without running the main detector when the cheap stage finds no face."""
+    verdict = cascade.screen(img) if cascade else "run"
+    if verdict == "skip": return CascadeReject()
+    reps = models.represent(img)
+    if verdict == "audit": cascade.audited(reps, img.shape)
+    return reps
+
+# ========== REDUCED-RESOLUTION DETECTION ==========
+def _map_area(area, scale, dx=0, dy=0):
+    """facial_area shifted by (dx, dy) and scaled, e.g. from crop or reduced pixels to full-resolution pixels."""
+    out = dict(area)
+    x, y, w, h = _facial_area_box(area)
+    out.update(x=int(round((x + dx) * scale)), y=int(round((y + dy) * scale)), w=int(round(w * scale)), h=int(round(h * scale)))
+    for eye in ("left_eye", "right_eye"):
+        if isinstance(area.get(eye), (tuple, list)):
+            out[eye] = (int(round((area[eye][0] + dx) * scale)), int(round((area[eye][1] + dy) * scale)))
+    return out
+
+def refine_faces(detect, faces, img, source, max_edge):
+    """
+    Faces found on a reduced decode of `source` (load_image_fixed(source, max_edge)) -> the same
+    faces detected and aligned again on crops of a decode just large enough that the smallest one
+    is FACE_CROP_MIN_EDGE wide (full resolution at most). facial_area comes back in full-resolution
+    pixels, like a detection on the full image. Faces the second pass can't find keep their crop.
+    """
+    h, w = img.shape[:2]
+    if not faces or max(h, w) < max_edge * DRAFT_SLACK: return faces  # not reduced
+    real = _real_faces(faces, img.shape)
+    try:
+        with Image.open(source) as pil:
+            full_edge = float(max(pil.size))
+            scale = full_edge / max(h, w)  # reduced px -> full-resolution px
+            if scale <= 1.01: return faces
+            if not real: return [dict(face, facial_area=_map_area(face.get("facial_area") or {}, scale)) for face in faces]
+            smallest = min(_facial_area_box(f.get("facial_area"))[2] for f in real) * scale
+            shrink = 1
+            while shrink < 8 and shrink * 2 <= scale and smallest / (shrink * 2) >= FACE_CROP_MIN_EDGE: shrink *= 2
+            pil.draft("RGB", (pil.size[0] // shrink, pil.size[1] // shrink))
+            big = np.asarray(ImageOps.exif_transpose(pil).convert("RGB"))[:, :, ::-1]
+    except Exception: return faces
+    k = max(big.shape[:2]) / float(max(h, w))  # reduced px -> big px
+    to_full = full_edge / max(big.shape[:2])
+    real_ids = set(id(f) for f in real)
+    out = []
+    for face in faces:
+        area = face.get("facial_area") or {}
+        if id(face) not in real_ids:
+            out.append(dict(face, facial_area=_map_area(area, scale)))
+            continue
+        x, y, fw, fh = _facial_area_box(area)
+        mx, my = fw * FACE_CROP_MARGIN, fh * FACE_CROP_MARGIN
+        x0, y0 = max(0, int((x - mx) * k)), max(0, int((y - my) * k))
+        x1, y1 = min(big.shape[1], int((x + fw + mx) * k)), min(big.shape[0], int((y + fh + my) * k))
+        crop = np.ascontiguousarray(big[y0:y1, x0:x1])
+        try: found = _real_faces(detect(crop), crop.shape)
+        except Exception: found = []
+        if not found:
+            out.append(dict(face, facial_area=_map_area(area, scale)))
+            continue
+        best = max(found, key=lambda f: _facial_area_box(f.get("facial_area"))[2] * _facial_area_box(f.get("facial_area"))[3])
+        out.append(dict(best, facial_area=_map_area(best.get("facial_area") or {}, to_full, x0, y0)))
+    return out
+
+# ========== BATCHED INFERENCE ==========
+def _model_input_size(model):
+    """(width, height) a DeepFace recognition model expects, across deepface versions."""
+    shape = getattr(model, "input_shape", None)
+    if shape is None: shape = model.model.layers[0].input_shape
+    if isinstance(shape, list): shape = shape[0]
+    if len(shape) == 4: return int(shape[2]), int(shape[1])  # keras (None, h, w, c)
+    return int(shape[0]), int(shape[1])
+
+def _forward_batch(model, batch):
+    """One forward pass for a stacked (N, h, w, 3) batch; per-face fallback for non-keras models."""
+    keras_model = getattr(model, "model", None)
+    if keras_model is not None and hasattr(keras_model, "predict_on_batch"):
+        return np.asarray(keras_model(batch, training=False), dtype=np.float32)
+    out = []
+    for face in batch:
+        emb = model.forward(face[np.newaxis, ...])
+        out.append(np.asarray(emb, dtype=np.float32).reshape(-1))
+    return np.vstack(out)
+
+class FaceBatcher(object):
+    """
+    Collects aligned face crops image by image (detection runs in add()), then
+    embed() pushes every crop collected so far through the recognition model in
+    a single forward pass. Only the small crops are held between calls.
+    """
+    def __init__(self, model_name, detector_backend, cascade=None, detect_max_edge=None):
+        self.model_name = model_name
+        self.detector_backend = detector_backend
+        self.cascade = cascade  # DetectorCascade or None
+        self.detect_max_edge = detect_max_edge  # inputs may be reduced decodes; add() then needs their source file
+        self._items = []  # (key, [(crop, face_obj)] or Exception or reps)
+        self._models = None  # from the registry on the first add(): runs with nothing new never build a model
+
+    def _setup(self):
+        self._models = MODELS.get(self.model_name, self.detector_backend)
+        try:
+            from deepface.modules import preprocessing
+            self._preprocessing = preprocessing
+            self._target_w, self._target_h = self._models.input_size
+            self.batched = True
+        except Exception:
+            # Older deepface without the preprocessing module: per-image DeepFace.represent fallback
+            self.batched = False
+
+    def __len__(self):
+        return len(self._items)
+
+    def add(self, key, img_input, source=None):
+        """source: the file img_input was decoded from (needed to refine faces found on a reduced decode)."""
+        if self._models is None: self._setup()
+        # (an undecodable file arrives as its path: DeepFace reads and reports it, nothing to refine)
+        reduced = self.detect_max_edge and isinstance(source, str) and isinstance(img_input, np.ndarray)
+        try:
+            verdict = self.cascade.screen(img_input) if self.cascade else "run"
+            if verdict == "skip":
+                self._items.append((key, CascadeReject()))
+                return
+            if not self.batched:
+                # represent() can't be handed boxes: screened on the reduced decode, embedded from the full one
+                if reduced: img_input = load_image_fixed(source)
+                reps = self._models.represent(img_input)
+                if verdict == "audit" and isinstance(img_input, np.ndarray): self.cascade.audited(reps, img_input.shape)
+                self._items.append((key, reps))
+                return
+            faces = self._models.detect(img_input)
+            if verdict == "audit": self.cascade.audited(faces, img_input.shape)
+            if reduced: faces = refine_faces(lambda crop: self._models.detect(crop, op="refine"), faces, img_input, source, self.detect_max_edge)
+            crops = []
+            for face_obj in faces:
+                face_bgr = face_obj["face"][:, :, ::-1]  # extract_faces returns RGB; represent feeds BGR
+                crops.append((self._preprocessing.resize_image(img=face_bgr, target_size=(self._target_h, self._target_w)), face_obj))
+            self._items.append((key, crops))
+        except Exception as e:
+            self._items.append((key, e))
+
+    def embed(self):
+        """Returns [(key, represent-style list or Exception)] for everything added, then resets."""
+        items, self._items = self._items, []
+        if not items or not self.batched: return items
+        crops = [crop for _, faces in items if not isinstance(faces, Exception) for crop, _ in faces]
+        try: embeddings = iter(self._models.forward(np.vstack(crops)) if crops else [])
+        except Exception as e: return [(key, e) for key, _ in items]
+        results = []
+        for key, faces in items:
+            if isinstance(faces, (Exception, CascadeReject)):
+                results.append((key, faces))
+                continue
+            results.append((key, [{
+                "embedding": next(embeddings).tolist(),
+                "facial_area": face_obj.get("facial_area"),
+                "face_confidence": face_obj.get("confidence"),
+            } for _, face_obj in faces]))
+        return results
+
+def represent_batch(img_inputs, model_name, detector_backend, loader=None, cascade=None, detect_max_edge=None):
+    """
+    Batched equivalent of DeepFace.represent for a list of images.
+    `loader` (optional) decodes each input just before detection, so only the
+    face crops are held for the whole batch, never the full images.
+    detect_max_edge: the loader decodes paths at reduced size (see refine_faces).
+    Returns one entry per input: a list of represent-style dicts (CascadeReject = skipped by the cascade), or the Exception raised.
+    """
+    load = loader or (lambda x: x)
+    batcher = FaceBatcher(model_name, detector_backend, cascade, detect_max_edge)
+    for i, img_input in enumerate(img_inputs):
+        batcher.add(i, load(img_input), source=img_input if loader else None)
+    return [result for _, result in batcher.embed()]
+
+# ========== DECODE PREFETCHING ==========
+class ImagePrefetcher(object):
+    """
+    Bounded read-ahead: a small thread pool decodes the next `depth` images while
+    the caller embeds the current one. Also measures where the run spends its time:
+    wait_time = consumer blocked on decode (I/O-bound), compute_time = consumer busy.
+    """
+    def __init__(self, loader, depth=8, threads=4):
+        self.loader = loader
+        self.depth = max(1, int(depth))
+        self.threads = max(1, int(threads))
+        self.decode_time = 0.0
+        self.wait_time = 0.0
+        self.compute_time = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def _load(self, path):
+        start = time.perf_counter()
+        try: return self.loader(path)
+        finally:
+            with self._lock: self.decode_time += time.perf_counter() - start
+
+    def iterate(self, paths):
+        """Yield (path, decoded) in input order with up to `depth` decodes in flight."""
+        source = iter(paths)
+        queue = collections.deque()
+        with ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="prefetch") as pool:
+            def top_up():
+                while len(queue) < self.depth:
+                    try: path = next(source)
+                    except StopIteration: return
+                    queue.append((path, pool.submit(self._load, path)))
+            try:
+                top_up()
+                last = time.perf_counter()
+                while queue:
+                    path, fut = queue.popleft()
+                    top_up()
+                    start = time.perf_counter()
+                    self.compute_time += start - last
+                    img = fut.result()
+                    last = time.perf_counter()
+                    self.wait_time += last - start
+                    self.count += 1
+                    yield path, img
+            finally:
+                for _, fut in queue: fut.cancel()
+
+    def summary(self):
+        busy = self.wait_time + self.compute_time
+        if not self.count or busy <= 0: return "no images decoded"
+        io_share = self.wait_time / busy
+        verdict = "I/O-bound" if io_share > 0.25 else "compute-bound"
+        return (f"{self.count} images | waiting on decode {self.wait_time:.1f}s ({io_share:.0%}) | "
+                f"inference {self.compute_time:.1f}s | decode work {self.decode_time:.1f}s -> {verdict}")
+
+# ========== MULTI-PROCESS INDEXING ==========
+_worker_state = {}
+
+def _index_worker_init(model_name, detector_backend, batch_size, threads_per_worker, cascade_detector=None, detect_max_edge=None):
+    """Runs once in each worker process: pin TF threads and build the model a single time."""
+    cascade = DetectorCascade(cascade_detector, detector_backend) if cascade_detector else None
+    _worker_state.update(model_name=model_name, detector=detector_backend, batch_size=batch_size, cascade=cascade,
+                         detect_max_edge=detect_max_edge)
+    try:
+        tf.config.threading.set_intra_op_parallelism_threads(threads_per_worker)
+        tf.config.threading.set_inter_op_parallelism_threads(1)
+        for gpu in tf.config.list_physical_devices('GPU'):
+            tf.config.experimental.set_memory_growth(gpu, True)
+    except Exception: pass
+    try: MODELS.get(model_name, detector_backend)
+    except Exception as e: print(f"⚠️ Worker {os.getpid()} could not preload {model_name}: {e}")
+
+def _index_worker_embed(paths):
+    """
+    Embed a chunk of paths in a worker. Returns ([(path, reps or None, error or None)], cascade counters
+    since the last chunk or None) for the writer.
+    """
+    model_name, detector, cascade = _worker_state["model_name"], _worker_state["detector"], _worker_state["cascade"]
+    max_edge = _worker_state["detect_max_edge"]
+    if _worker_state["batch_size"] > 1:
+        results = represent_batch(paths, model_name, detector, loader=lambda p: load_image_fixed(p, max_edge),
+                                  cascade=cascade, detect_max_edge=max_edge)
+    else:
+        results = []
+        models = MODELS.get(model_name, detector)
+        for img_path in paths:
+            # the cascade needs pixels; without it DeepFace reads the file itself, as before
+            try: results.append(represent_screened(models, load_image_fixed(img_path) if cascade else img_path, cascade))
+            except Exception as e: results.append(e)
+    rows = [(p, None, str(r)) if isinstance(r, Exception) else (p, r, None) for p, r in zip(paths, results)]
+    return rows, cascade.take_delta() if cascade else None
+
+def create_index_pool(model_name, detector_backend, batch_size, worker_count, cascade_detector=None, detect_max_edge=None):
+    # spawn, not fork: forking a process that already initialised TF/threads can deadlock
+    threads_per_worker = max(1, (os.cpu_count() or 1) // worker_count)
+    return ProcessPoolExecutor(
+        max_workers=worker_count,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_index_worker_init,
+        initargs=(model_name, detector_backend, batch_size, threads_per_worker, cascade_detector, detect_max_edge),
+    )
+
+# ========== PROGRESS REPORTING ==========
+def _format_duration(seconds):
+    mins, secs = divmod(int(seconds), 60)
+    hours, mins = divmod(mins, 60)
+    return f"{hours}:{mins:02d}:{secs:02d}" if hours else f"{mins:02d}:{secs:02d}"
+
+class ProgressReporter(object):
+    """
+    Indexing counters shared with whatever displays them. The indexing thread only bumps
+    plain attributes per file (no callbacks, no locks); a GUI or CLI polls status_line() /
+    timer_line() at its own pace, so display cost does not grow with the file rate.
+    """
+    def __init__(self):
+        self.begin("idle")
+
+    def begin(self, phase, archive="", total=None):
+        """Start a new phase with fresh counters (scanning -> indexing per archive)."""
+        self.phase = phase
+        self.archive = archive
+        self.total = total  # files queued for embedding, None when unknown (watch mode)
+        self.scanned = self.skipped = 0
+        self.embedded = self.failed = self.faces = 0
+        self.duplicates = 0  # embedded by reusing an identical file's embeddings
+        self.current = ""
+        self.next_save = None  # time.time() of the next checkpoint
+        self.saving = False
+        self.started = time.time()
+        self._samples = collections.deque()  # (time, done) seen by the poller, for the trailing rate
+
+    def start_indexing(self, total=None):
+        """Scan finished: keep its counters, restart the clock for images/sec."""
+        self.phase, self.total = "indexing", total
+        self.started = time.time()
+        self._samples = collections.deque()
+
+    def finish(self):
+        self.phase = "idle"
+        self.next_save = None
+
+    @property
+    def done(self):
+        return self.embedded + self.failed
+
+    def snapshot(self):
+        """Counters plus images/sec over the last PROGRESS_RATE_WINDOW_SECONDS and an ETA (None if unknown)."""
+        now, done, samples = time.time(), self.done, self._samples
+        samples.append((now, done))
+        while len(samples) > 2 and now - samples[0][0] > PROGRESS_RATE_WINDOW_SECONDS: samples.popleft()
+        t0, d0 = samples[0]
+        if now - t0 < 1.0: t0, d0 = self.started, 0
+        rate = (done - d0) / (now - t0) if now > t0 else 0.0
+        remaining = self.total - done if self.total is not None else None
+        return {
+            "phase": self.phase, "archive": self.archive, "current": self.current,
+            "scanned": self.scanned, "skipped": self.skipped, "embedded": self.embedded,
+            "failed": self.failed, "faces": self.faces, "total": self.total, "rate": rate,
+            "eta": remaining / rate if remaining is not None and rate > 0 else None,
+            "next_save": max(0.0, self.next_save - now) if self.next_save is not None else None,
+        }
+
+    def status_line(self):
+        """One-line summary for a status bar; empty when nothing is being indexed."""
+        if self.phase == "idle": return ""
+        snap = self.snapshot()
+        name = os.path.basename(os.path.normpath(snap["archive"])) or snap["archive"]
+        if snap["phase"] == "scanning":
+            return f"Scanning {name}: {snap['scanned']:,} files checked, {snap['scanned'] - snap['skipped']:,} new/changed"
+        parts = [f"Indexing {name}: {self.done:,}" + (f"/{snap['total']:,}" if snap["total"] is not None else ""),
+                 f"{snap['rate']:.1f} img/s"]
+        if snap["eta"] is not None: parts.append(f"ETA {_format_duration(snap['eta'])}")
+        if snap["failed"]: parts.append(f"{snap['failed']:,} failed")
+        if self.duplicates: parts.append(f"{self.duplicates:,} duplicates")
+        if snap["skipped"]: parts.append(f"{snap['skipped']:,} unchanged")
+        if snap["current"]: parts.append(os.path.basename(snap["current"]))
+        return " | ".join(parts)
+
+    def timer_line(self):
+        if self.saving: return "Saving Checkpoint..."
+        if self.phase == "idle" or self.next_save is None: return ""
+        return f"Next Save: {_format_duration(max(0.0, self.next_save - time.time()))}"
+
+# ========== PATH RESOLUTION ==========
+def smart_resolve_path(stored_path, current_archive_root):
+    """
+    Attempts to find a file even if the volume/drive letter has changed.
+    1. Checks if the original stored_path exists.
+    2. If not, swaps the drive letter of stored_path with the drive letter of current_archive_root.
+    """
+    # 1. Happy Path: The file exists exactly where the index says it is
+    if os.path.exists(stored_path):
+        return stored_path
+
+    if not current_archive_root:
+        return None
+
+    try:
+        # Break down the paths
+        stored_drive, stored_tail = os.path.splitdrive(stored_path)
+        current_drive, _ = os.path.splitdrive(current_archive_root)
+
+        # 2. Drive Swap Strategy (e.g. C:\Photos\img.jpg -> D:\Photos\img.jpg)
+        # Note: stored_tail usually preserves the leading slash
+        new_path_drive_swap = current_drive + stored_tail
+
+        if os.path.exists(new_path_drive_swap):
+            return new_path_drive_swap
+
+        # If still not found, return None (or the attempt, to help debug)
+        return None
+
+    except Exception as e:
+        print(f"Path resolution error: {e}")
+        return None
+
+# ========== ENGINE ==========
+class FaceFinderEngine(object):
+    """
+    Indexing, search and copy for one configuration. No GUI: progress goes to print()
+    and the optional status/timer callbacks; stop_event lets a caller end a run cleanly
+    (a checkpoint is saved before returning).
+    """
+    def __init__(self, config, stop_event=None, status_callback=None):
+        config = dict(DEFAULT_CONFIG, **config)
+        self.archive_dirs = list(config["archive_dirs"])
+        self.output_dir = config["output_dir"]
+        self.references = dict(config["reference_images_config"])
+        self.model = config["model"]
+        self.detector = config["detector"]
+        self.metric = config["distance_metric"]
+        self.max_dist = float(config["max_dist"])
+        self.batch_size = max(1, int(config["batch_size"]))
+        # batch size 1 keeps the plain DeepFace.represent path: it can't be handed refined face crops
+        self.detect_max_edge = (max(0, int(config["detect_max_edge"] or 0)) or None) if self.batch_size > 1 else None
+        self.worker_count = max(1, int(config["worker_count"]))
+        self.use_ann = bool(config["use_ann"])
+        self.deduplicate = bool(config["deduplicate"])
+        self.watch_polling = bool(config["watch_polling"])
+        self.reference_cache_file = config["reference_cache_file"] or REFERENCE_CACHE_FILE  # (load_config makes it absolute)
+        self.output_mode = config["output_mode"] if config["output_mode"] in OUTPUT_MODES else "copy"
+        if self.output_mode != config["output_mode"]:
+            print(f"⚠️ Unknown output_mode {config['output_mode']!r} (use one of {', '.join(OUTPUT_MODES)}); copying.")
+        cascade = config["cascade_detector"]
+        self.cascade_detector = cascade if cascade and cascade != "off" and cascade != self.detector else None
+        self.cascade = DetectorCascade(self.cascade_detector, self.detector) if self.cascade_detector else None
+        self.excluded_folder_names = list(config["excluded_folder_names"])
+        self.enabled_extensions = dict(config["enabled_extensions"])
+        self.hits_log_path = os.path.join(self.output_dir, "hits_log.csv")
+        self.stop_event = stop_event or threading.Event()
+        self._status_callback = status_callback
+        self.progress = ProgressReporter()  # per-file counters; poll progress.status_line() instead of per-file callbacks
+        self.hits = None  # HitsJournal, opened on first use
+        self.copier = None  # CopyService of the current run
+        self.duplicates = None  # DuplicateFinder, loaded on the first indexing pass
+        self._open_indexes = {}  # index path -> in-memory index kept between watch-mode calls
+        self._index_pool = None  # index worker processes, shared by every archive of a run
+
+    def _update_status(self, message):
+        if self._status_callback: self._status_callback(message)
+
+    @property
+    def allowed_exts(self):
+        return tuple(ext for ext, enabled in self.enabled_extensions.items() if enabled)
+
+    # --- High-level operations (GUI buttons / CLI commands) ---
+
+    def index(self, live_match=False):
+        """Build/update the index of every archive; live_match copies matches while indexing."""
+        if live_match: self._open_hits_log()
+        live_references = self._precompute_reference_embeddings() if live_match and self.references else []
+        if self.cascade: self.cascade.reset()
+        self._start_index_pool()
+        try:
+            for archive_dir in self.archive_dirs:
+                if self.stop_event.is_set(): break
+                print(f"\n🧠 Checking/Updating index for: {archive_dir}")
+                # Pass live_references here for real-time matching
+                try: self._incremental_index(self.model, archive_dir, live_references=live_references)
+                finally: self.progress.finish()
+        finally: self._stop_index_pool()
+        self._finish_copies()
+        for line in MODELS.summary(): print(line)  # in-process inference only; index workers keep their own
+        self._print_cascade_summary()
+        self._print_duplicate_summary()
+        return live_references
+
+    def search(self, references=None, copy=True):
+        """
+        Final sweep: all references of all people stacked and searched in one pass over the archive.
+        Returns the matches (person, identity, archive_dir, distance), one row per person and image,
+        or None if there is nothing to search. copy=True copies them into output_dir/<person>.
+        """
+        unified_df, archive_embeddings_np, archive_parts = self._load_archive_embeddings()
+        if unified_df is None:
+            print("❌ No valid embeddings found.")
+            self._update_status("Error: No embeddings found")
+            return None
+        # (reuses the live-matching references when indexing already computed them)
+        sweep_refs = references or self._precompute_reference_embeddings()
+        if not sweep_refs:
+            print("❌ No usable reference embeddings.")
+            self._update_status("Error: No reference embeddings")
+            return None
+        self._update_status(f"Searching {len(unified_df)} faces against {len(sweep_refs)} references...")
+        ref_matrix = np.vstack([r["embedding"] for r in sweep_refs])
+        if self.use_ann:
+            hits = self._ann_search(archive_parts, ref_matrix, radius=self.max_dist)
+        else:
+            _, _, hits = batched_distance_search(archive_embeddings_np, ref_matrix, self.metric, max_dist=self.max_dist, should_stop=self.stop_event.is_set)
+
+        matches = []
+        for person in self.references:
+            if self.stop_event.is_set(): break
+            person_hits = [hits[i] for i, r in enumerate(sweep_refs) if r["person"] == person and len(hits[i][0])]
+            if not person_hits: continue
+
+            potential_matches_df = unified_df.iloc[np.concatenate([rows for rows, _ in person_hits])].copy()
+            potential_matches_df["distance"] = np.concatenate([dists for _, dists in person_hits])
+            potential_matches_df = potential_matches_df[potential_matches_df["distance"] >= 1e-6]  # exact duplicates (the reference itself)
+            potential_matches_df = potential_matches_df.sort_values(by="distance").drop_duplicates(subset=["identity"])
+            potential_matches_df.insert(0, "person", person)
+            matches.append(potential_matches_df)
+            if copy:
+                # Pass the first archive dir just as a fallback, though rows have specific ones
+                default_arch = self.archive_dirs[0] if self.archive_dirs else ""
+                self._copy_hits_for_archive(potential_matches_df, person, default_arch)
+        if copy: self._finish_copies()
+        if not matches: return pd.DataFrame(columns=["person", "identity", "archive_dir", "distance"])
+        return pd.concat(matches, ignore_index=True)[["person", "identity", "archive_dir", "distance"]]
+
+    def run_analysis(self, index=True):
+        """Index (with live matching) unless index=False, then run the final verification sweep."""
+        live_references = []
+        if index:
+            live_references = self.index(live_match=True)
+        else:
+            for archive_dir in self.archive_dirs: print(f"\n🧠 Using existing index (Read-Only) for: {archive_dir}")
+        if self.stop_event.is_set(): return None
+        print(f"\n{'=' * 60}\n🔍 Performing Final Verification Sweep\n{'=' * 60}")
+        matches = self.search(references=live_references)
+        if matches is not None and not self.stop_event.is_set():
+            print(f"\n{'=' * 60}\n🎉 COMPLETE\n{'=' * 60}")
+            self._update_status("Analysis Complete.")
+        return matches
+
+    def copy_matches(self, matches):
+        """Copy a matches table (as returned by search(copy=False)) into output_dir/<person>. Returns files copied."""
+        default_arch = self.archive_dirs[0] if self.archive_dirs else ""
+        for person, person_df in matches.groupby("person", sort=False):
+            if self.stop_event.is_set(): break
+            self._copy_hits_for_archive(person_df, person, default_arch)
+        return self._finish_copies()
+
+    def min_distances(self):
+        """
+        Closest (non-identical) archive face per reference image, in one pass over the archive.
+        Returns [{"person", "ref_path", "distance", "path"}] (distance inf: exact matches only),
+        or None if no index could be loaded.
+        """
+        unified_embeddings_df, archive_embeddings_np, archive_parts = self._load_archive_embeddings()
+        if unified_embeddings_df is None: return None
+        refs = self._precompute_reference_embeddings()
+        best_dist, best_idx = [], []
+        if refs:
+            self._update_status(f"Calculating min distances for {len(refs)} references...")
+            ref_matrix = np.vstack([r["embedding"] for r in refs])
+            if self.use_ann:
+                for rows, dists in self._ann_search(archive_parts, ref_matrix, k=8):
+                    keep = dists >= 1e-6  # skip exact duplicates, like the exact path
+                    best_dist.append(dists[keep][0] if keep.any() else np.inf)
+                    best_idx.append(rows[keep][0] if keep.any() else -1)
+            else:
+                best_dist, best_idx, _ = batched_distance_search(archive_embeddings_np, ref_matrix, self.metric)
+
+        results = []
+        for ref, lowest_dist_for_ref, min_index in zip(refs, best_dist, best_idx):
+            result = {"person": ref["person"], "ref_path": ref["ref_path"], "distance": float(lowest_dist_for_ref), "path": None}
+            if lowest_dist_for_ref != np.inf:
+                # === SMART PATH RESOLVE FOR LINK ===
+                raw_match_path = unified_embeddings_df.iloc[min_index]["identity"]
+                match_archive_root = unified_embeddings_df.iloc[min_index].get("archive_dir", "")
+                closest_match_path = smart_resolve_path(raw_match_path, match_archive_root)
+                if not closest_match_path: closest_match_path = raw_match_path
+                result["path"] = os.path.abspath(closest_match_path)
+            results.append(result)
+        return results
+
+    def watch(self):
+        """Catch up once, then index (and live-match) files as they land until stop_event is set."""
+        watcher = None
+        try:
+            if self.references: self._open_hits_log()
+            live_references = self._precompute_reference_embeddings() if self.references else []
+            # Watch first, then catch up: files landing during the catch-up are queued, not missed
+            watcher = ArchiveWatcher(self.archive_dirs, self.excluded_folder_names, self.allowed_exts, force_poll=self.watch_polling)
+            self._start_index_pool()
+            for archive_dir in self.archive_dirs:
+                if self.stop_event.is_set(): break
+                print(f"\n🧠 Catching up: {archive_dir}")
+                try: self._incremental_index(self.model, archive_dir, live_references=live_references)
+                finally: self.progress.finish()
+            self._stop_index_pool()  # new files arrive a handful at a time: embedded in-process
+
+            print(f"\n👀 Watching {len(self.archive_dirs)} archive folder(s) ({watcher.mode}).")
+            self._update_status(f"Watching for new photos ({watcher.mode})...")
+            for archive_dir, paths in watcher.changes(self.stop_event.is_set):
+                if paths: print(f"📥 {len(paths)} new/changed file(s) in {archive_dir}")
+                try: self._incremental_index(self.model, archive_dir, live_references=live_references, paths=paths, keep_open=True)
+                finally: self.progress.finish()
+                if self.hits: self.hits.flush()
+                self._update_status(f"Watching for new photos ({watcher.mode})...")
+        finally:
+            self._stop_index_pool()
+            if watcher: watcher.close()
+            # Write out whatever is still only in memory. stop_event stays set (after Stop this is a forced
+            # checkpoint): clearing it would re-arm the copy service and run the copies still queued.
+            for archive_dir in self.archive_dirs:
+                if os.path.join(archive_dir, f"representations_{self.model.lower()}.pkl") not in self._open_indexes: continue
+                try: self._incremental_index(self.model, archive_dir, paths=[])
+                except Exception as e: print(f"⚠️ Could not save index for {archive_dir}: {e}")
+            self._open_indexes.clear()
+            self.progress.finish()
+            self._finish_copies()
+            self._print_cascade_summary()
+            self._print_duplicate_summary()
+            if self.hits: self.hits.close()
+            print("🛑 Watch mode stopped.")
+            self._update_status("Watch mode stopped.")
+
+    # --- Internals ---
+
+    def _precompute_reference_embeddings(self):
+        """Calculates and returns a list of dictionaries containing reference embeddings."""
+        live_refs = []
+        print("🔄 Pre-calculating reference embeddings for live matching...")
+        self._update_status("Pre-calculating reference embeddings...")
+        cache = ReferenceEmbeddingCache(self.reference_cache_file)
+        cached = 0
+        
+        for person, refs in self.references.items():
+            for ref_path in refs:
+                if not os.path.exists(ref_path): continue
+                try:
+                    key = ReferenceEmbeddingCache.key(ref_path, self.model, self.detector)
+                    hit = cache.get(key)
+                    if hit is not None:
+                        emb, n_faces = hit
+                        cached += 1
+                    else:
+                        img_input = load_image_fixed(ref_path)
+                        ref_reps = MODELS.get(self.model, self.detector).represent(img_input)
+                        if not ref_reps: continue
+                        # Reference photos should show one person; if several faces are found, use the largest
+                        main_face = max(ref_reps, key=lambda r: _facial_area_box(r.get("facial_area"))[2] * _facial_area_box(r.get("facial_area"))[3])
+                        emb, n_faces = np.array(main_face["embedding"]), len(ref_reps)
+                        cache.put(key, emb, n_faces)
+                    if n_faces > 1:
+                        print(f"ℹ️ {n_faces} faces in reference {os.path.basename(ref_path)}, using the largest.")
+                    if self.metric == "cosine":
+                        # Pre-normalize to speed up math inside loop
+                        emb = emb / np.linalg.norm(emb)
+                    live_refs.append({
+                        "person": person,
+                        "ref_path": ref_path,
+                        "embedding": emb
+                    })
+                except Exception as e:
+                    print(f"⚠️ Error loading reference {os.path.basename(ref_path)}: {e}")
+        
+        cache.save()
+        print(f"✅ Loaded {len(live_refs)} reference embeddings ({cached} from cache).")
+        return live_refs
+
+    def _handle_live_match(self, archive_path, archive_embs, live_refs, archive_dir):
+        """Compare the face embeddings (one row per face) of a new archive image against all references and copy matches."""
+        archive_embs = np.atleast_2d(archive_embs)
+        
+        # Pre-normalize archive embeddings if cosine (references are already normalized)
+        if self.metric == "cosine":
+            norms = np.linalg.norm(archive_embs, axis=1)
+            if not norms.any(): return
+            archive_emb_norm = archive_embs[norms > 0] / norms[norms > 0, np.newaxis]
+        
+        for ref in live_refs:
+            ref_emb = ref["embedding"]
+            
+            # Closest face in the photo decides
+            if self.metric == "cosine":
+                distance = np.min(1 - archive_emb_norm @ ref_emb)
+            else:
+                distance = np.min(np.linalg.norm(archive_embs - ref_emb, axis=1))
+            
+            # --- Check Logic ---
+            if distance <= self.max_dist:
+                # Filter Exact Duplicates (Self-Matches)
+                if distance < 1e-6: continue
+                
+                person = ref["person"]
+                print(f"🔥 LIVE MATCH FOUND! {person} -> {os.path.basename(archive_path)} (dist: {distance:.4f})")
+                # Copied in the background; several references of one person only queue it once
+                self._copy_service().submit(person, archive_path, archive_dir, distance,
+                                            os.path.join(self.output_dir, person), source=archive_path, live=True)
+
+    def _load_archive_embeddings(self):
+        """
+        (identity/archive_dir table, float32 matrix, parts) over all archives, read from the binary store.
+        For cosine the matrix is the cached pre-normalised copy. parts = [(store, first_row, matrix)]
+        per archive, for the per-archive ANN indexes.
+        """
+        frames, matrices, stores = [], [], []
+        for archive_dir in self.archive_dirs:
+            try:
+                self._update_status(f"Loading index: {os.path.basename(archive_dir)}")
+                store = EmbeddingStore(archive_dir, self.model)
+                identities, matrix = store.load_or_migrate(normalized=(self.metric == "cosine"))
+            except Exception as e:
+                print(f"⚠️ Failed to load index: {e}")
+                continue
+            if not identities: continue
+            if matrices and matrix.shape[1] != matrices[0].shape[1]:
+                print(f"⚠️ Skipping {archive_dir}: embedding size {matrix.shape[1]} differs from {matrices[0].shape[1]} (index built with another model?)")
+                continue
+            # IMPORTANT: Tag with source dir
+            frames.append(pd.DataFrame({"identity": identities, "archive_dir": archive_dir}))
+            matrices.append(matrix)
+            stores.append(store)
+        if not frames: return None, None, []
+        offsets = np.cumsum([0] + [len(f) for f in frames[:-1]])
+        parts = list(zip(stores, offsets, matrices))
+        if len(frames) == 1: return frames[0], matrices[0], parts  # single archive: stay on the memory map
+        return pd.concat(frames, ignore_index=True), np.vstack(matrices), parts
+
+    def _ann_search(self, parts, queries, k=None, radius=None):
+        """Approximate top-k / radius search over every archive's IVF index; rows are global (unified table) indices."""
+        merged = [([], []) for _ in range(len(queries))]
+        for store, first_row, matrix in parts:
+            ivf = store.ann_index(matrix, self.metric)
+            for (rows, dists), (found_rows, found_dists) in zip(merged, ivf.search(matrix, queries, k=k, radius=radius)):
+                rows.append(found_rows + first_row)
+                dists.append(found_dists)
+        results = []
+        for rows, dists in merged:
+            rows, dists = np.concatenate(rows), np.concatenate(dists)
+            order = np.argsort(dists)
+            if k is not None: order = order[:k]
+            results.append((rows[order], dists[order]))
+        return results
+
+    def _copy_service(self):
+        if self.copier is None: self.copier = CopyService(self._open_hits_log(), self.stop_event.is_set, mode=self.output_mode)
+        return self.copier
+
+    def _start_index_pool(self):
+        """Spawn the index workers once per run (worker_count > 1); every archive's full scan uses them."""
+        if self.worker_count > 1 and self._index_pool is None:
+            self._index_pool = create_index_pool(self.model, self.detector, self.batch_size, self.worker_count,
+                                                 self.cascade_detector, self.detect_max_edge)
+
+    def _stop_index_pool(self):
+        pool, self._index_pool = self._index_pool, None
+        if pool: pool.shutdown(wait=False, cancel_futures=True)
+
+    def _finish_copies(self):
+        """Wait for queued copies, print per-person stats, flush the hits log. Returns files copied."""
+        copier, self.copier = self.copier, None
+        if copier is None: return 0
+        copier.close()
+        for line in copier.summary(): print(line)
+        if self.hits: self.hits.flush()
+        return copier.copied
+
+    def _print_cascade_summary(self):
+        line = self.cascade.summary() if self.cascade else None
+        if line: print(line)
+
+    def _duplicate_finder(self):
+        if self.duplicates is None: self.duplicates = DuplicateFinder(self.archive_dirs, self.model)
+        return self.duplicates
+
+    def _print_duplicate_summary(self):
+        line = self.duplicates.summary() if self.duplicates else None
+        if line: print(line)
+
+    def _open_hits_log(self):
+        if self.hits is None:
+            os.makedirs(self.output_dir, exist_ok=True)
+            self.hits = HitsJournal(self.hits_log_path)
+        return self.hits
+
+    def _atomic_pickle_save(self, df, path):
+        tmp_path = path + ".tmp"
+        try:
+            with open(tmp_path, 'wb') as f: pickle.dump(df, f)
+            os.replace(tmp_path, path)
+        except: 
+            if os.path.exists(tmp_path): os.remove(tmp_path)
+
+    def _incremental_index(self, model_name, db_path, live_references=None, paths=None, keep_open=False):
+        """
+        Scan folder, calc embeddings. If live_references is provided, check matches immediately.
+        paths: embed just these files instead of crawling the archive (watch mode).
+        keep_open: keep the index in memory for the next call and only save it on the checkpoint timer (watch mode).
+        """
+        index_path = os.path.join(db_path, f"representations_{model_name.lower()}.pkl")
+        bak_path = index_path + ".bak"
+        store = EmbeddingStore(db_path, model_name)
+
+        session = self._open_indexes.pop(index_path, None)
+        if session and session["signature"] != store.pickle_signature(): session = None  # written by someone else since
+        if session:
+            buf, last_save_time, unsaved = session["buf"], session["last_save_time"], session["unsaved"]
+        else:
+            if os.path.exists(index_path):
+                try: shutil.copy2(index_path, bak_path)
+                except: pass
+
+            existing = pd.DataFrame()
+            
+            files_to_try = [index_path, index_path + ".tmp", bak_path]
+            for fp in files_to_try:
+                if os.path.exists(fp):
+                    try:
+                        with open(fp, 'rb') as f: existing = pickle.load(f)
+                        if not existing.empty and 'identity' in existing.columns: break 
+                    except: pass
+            
+            if not existing.empty:
+                if "status" not in existing.columns: existing["status"] = "ok"
+                if "error" not in existing.columns: existing["error"] = None
+
+            # Rows are appended to a columnar buffer; a DataFrame is only built at checkpoints
+            buf = EmbeddingBuffer.from_dataframe(existing)
+            last_save_time = time.time()
+            unsaved = False  # new entries, re-embedded files or adopted signatures not written yet
+
+        indexed = buf.latest_by_identity()  # path -> image id of its current entry
+        pending_signatures = {}  # path -> stat signature seen when it was queued for embedding
+
+        dedup = self._duplicate_finder() if self.deduplicate else None
+
+        progress = self.progress
+        if paths is None: progress.begin("scanning", db_path)
+        else: progress.phase, progress.archive = "indexing", db_path  # watch mode: counters keep running between events
+
+        # Build dynamic list of allowed extensions
+        allowed_exts = tuple(ext for ext, enabled in self.enabled_extensions.items() if enabled)
+
+        def maybe_checkpoint(force=False):
+            nonlocal last_save_time, unsaved
+            now = time.time()
+            if force or (now - last_save_time) >= CHECKPOINT_INTERVAL_SECONDS:
+                progress.saving = True
+                try:
+                    self._atomic_pickle_save(buf.to_dataframe(), index_path)
+                    store.write_from_buffer(buf)
+                    if dedup: dedup.save()
+                finally: progress.saving = False
+                last_save_time = now
+                unsaved = False
+                print(f"💾 checkpoint saved ({len(buf)} images, {buf.n_faces} faces)")
+            progress.next_save = last_save_time + CHECKPOINT_INTERVAL_SECONDS
+
+        def record(img_path, reps, error=None, reused=False):
+            nonlocal unsaved
+            signature = pending_signatures.pop(img_path, None)
+            previous = indexed.pop(img_path, None)  # a re-checked cascade reject
+            if previous is not None: buf.mark_stale(previous)
+            # identical copies queued behind this file share its result
+            # (a cascade reject isn't entered: it can't vouch that a copy has no face)
+            rejected = isinstance(reps, CascadeReject)
+            copies = dedup.done(db_path, img_path, None if error is not None or rejected else len(reps or []), reused) if dedup else []
+            for copy_path in copies:
+                progress.duplicates += 1
+                record(copy_path, reps, error)
+            if error is not None:
+                progress.failed += 1
+                msg = str(error)
+                print(f"⚠️ Skipping {img_path}: {msg}")
+                indexed[img_path] = len(buf)
+                buf.append(img_path, None, "failed", msg, signature)
+                unsaved = True
+                return
+            progress.embedded += 1
+            if isinstance(reps, list) and len(reps) > 0:
+                progress.faces += len(reps)
+                # Every detected face gets its own row, so group photos are searchable by each person in them
+                indexed[img_path] = len(buf)
+                buf.append_faces(img_path, reps, signature)
+                unsaved = True
+                
+                # --- LIVE MATCHING HOOK ---
+                if live_references:
+                    self._handle_live_match(img_path, np.array([r["embedding"] for r in reps]), live_references, db_path)
+                # --------------------------
+            elif isinstance(reps, list):
+                # no face: remembered, so unchanged files aren't retried (cascade rejects only while the cascade runs)
+                indexed[img_path] = len(buf)
+                buf.append(img_path, None, "cascade_reject" if rejected else "no_face", None, signature)
+                unsaved = True
+
+        # --- BATCHED MODE: faces are detected as images arrive, one forward pass per self.batch_size images ---
+        batcher = FaceBatcher(model_name, self.detector, self.cascade, self.detect_max_edge) if self.batch_size > 1 else None
+
+        def flush_batch():
+            if batcher is None or not len(batcher): return
+            for img_path, result in batcher.embed():
+                if isinstance(result, Exception): record(img_path, None, result)
+                else: record(img_path, result)
+
+        # --- MULTI-PROCESS MODE: workers (started by index() / watch()) embed chunks, this thread stays the only index writer ---
+        # (not for the handful of files watch mode passes in: they'd wait behind whole chunks)
+        pool = self._index_pool if paths is None else None
+        chunk = []
+        in_flight = {}  # future -> paths of its chunk
+
+        def submit_chunk():
+            if not chunk or not pool: return
+            in_flight[pool.submit(_index_worker_embed, list(chunk))] = list(chunk)
+            chunk.clear()
+
+        def collect(max_in_flight):
+            """Record finished chunks; block only while more than max_in_flight are outstanding."""
+            nonlocal pool
+            while in_flight:
+                block = len(in_flight) > max_in_flight
+                done, _ = futures_wait(list(in_flight), timeout=None if block else 0, return_when=FIRST_COMPLETED)
+                if not done: break
+                for fut in done:
+                    paths = in_flight.pop(fut)
+                    try: rows, cascade_counts = fut.result()
+                    except BrokenProcessPool:
+                        # A worker died (OOM, native crash): don't mark its files as failed, retry them next run
+                        if pool:
+                            print("⚠️ An index worker crashed. Continuing in-process; unfinished files are retried on the next run.")
+                            self._stop_index_pool()
+                            pool = None
+                        continue
+                    except Exception as e: rows, cascade_counts = [(p, None, str(e)) for p in paths], None
+                    if cascade_counts and self.cascade: self.cascade.merge(cascade_counts)
+                    for img_path, reps, error in rows: record(img_path, reps, error)
+
+        def changed_or_new(img_path, st=None):
+            """True if the file needs (re-)embedding; a changed file's old entry is marked stale."""
+            nonlocal unsaved
+            progress.scanned += 1
+            try: signature = file_signature(st or os.stat(img_path))
+            except OSError: return False
+            image_id = indexed.get(img_path)
+            if image_id is not None:
+                old = buf.signatures[image_id]
+                if old is None:
+                    # entry from an index without signatures: adopt the current one instead of re-embedding everything
+                    buf.signatures[image_id] = signature
+                    unsaved = True
+                    progress.skipped += 1
+                    return False
+                if same_file_signature(old, signature):
+                    progress.skipped += 1
+                    return False
+                print(f"♻️ Changed on disk, re-indexing: {img_path}")
+                buf.mark_stale(image_id)
+                del indexed[img_path]
+                unsaved = True
+            pending_signatures[img_path] = signature
+            return True
+
+        # --- EXCLUSION + EXTENSION FILTERS are applied by the crawler; unchanged folders are not listed ---
+        crawler = ArchiveCrawler(os.path.join(db_path, f"representations_{model_name.lower()}.dirs.json"),
+                                 index_path, self.excluded_folder_names, allowed_exts) if paths is None else None
+
+        def given_files():
+            """The files passed in by watch mode that still need embedding."""
+            for img_path in paths:
+                if self.stop_event.is_set(): return
+                if not img_path.lower().endswith(allowed_exts) or not changed_or_new(img_path): continue
+                progress.current = img_path
+                yield img_path
+
+        def new_files():
+            """Crawl the archive, then yield only the files that still need embedding."""
+            scan_start = time.time()
+            delta = [img_path for img_path, st in crawler.crawl(db_path, self.stop_event.is_set) if changed_or_new(img_path, st)]
+            print(f"📂 Scanned in {time.time() - scan_start:.1f}s: {crawler.listed} folders listed, "
+                  f"{crawler.skipped} unchanged, {crawler.files} files checked, {len(delta)} new/changed"
+                  + (" (full rescan)" if crawler.full else ""))
+            progress.start_indexing(total=len(delta))
+            progress.next_save = last_save_time + CHECKPOINT_INTERVAL_SECONDS
+            for img_path in delta:
+                if self.stop_event.is_set(): return
+                progress.current = img_path
+                maybe_checkpoint(force=False)
+                yield img_path
+
+        def rejected_files():
+            """
+            Images the cascade skipped, requeued once it no longer screens (off in the config, unavailable,
+            or switched itself off after too many misses); their folders may be unchanged, so not crawled.
+            """
+            if self.cascade and self.cascade.running: return
+            rejected = [p for p, image_id in indexed.items() if buf.statuses[image_id] == "cascade_reject" and p not in pending_signatures]
+            if rejected: print(f"🪜 Re-checking {len(rejected)} image(s) the detector cascade skipped earlier.")
+            if progress.total is not None: progress.total += len(rejected)
+            for img_path in rejected:
+                if self.stop_event.is_set(): return
+                try: signature = file_signature(os.stat(img_path))
+                except OSError: continue
+                pending_signatures[img_path] = signature  # its old entry is replaced when the new result is recorded
+                progress.current = img_path
+                yield img_path
+
+        def indexed_reps(identity):
+            """represent-style faces of an indexed file of this archive, or None if it has no usable entry."""
+            image_id = indexed.get(identity)
+            status = buf.statuses[image_id] if image_id is not None else None
+            if status == "no_face": return []
+            if status != "ok": return None
+            return [{"embedding": buf.embeddings[r], "facial_area": dict(zip(("x", "y", "w", "h"), buf.face_boxes[r].tolist())),
+                     "face_confidence": float(buf.face_confidences[r])} for r in buf.face_rows(image_id)]
+
+        embed_start = None  # for the inference-time-saved estimate
+        by_size = None  # file size -> image ids of files indexed before this run (built on first use)
+
+        def indexed_same_size(size):
+            """Indexed files with this size, for DuplicateFinder to hash if its table doesn't know them yet."""
+            nonlocal by_size
+            if by_size is None:
+                by_size = collections.defaultdict(list)
+                for image_id in indexed.values():
+                    if buf.signatures[image_id]: by_size[buf.signatures[image_id][0]].append(image_id)
+            return [(buf.identities[i], buf.signatures[i], len(buf.face_rows(i)) if buf.statuses[i] == "ok" else 0)
+                    for i in by_size.get(size, ()) if buf.statuses[i] in ("ok", "no_face")]
+
+        def unique_files(files):
+            """Byte-identical copies of indexed (or already queued) files reuse their embeddings instead of being queued."""
+            nonlocal embed_start
+            for img_path in files:
+                if embed_start is None: embed_start = (time.time(), progress.done, progress.duplicates)
+                verdict, original = dedup.check(db_path, img_path, pending_signatures[img_path], indexed_same_size)
+                if verdict == "wait": continue  # recorded together with the original
+                if verdict == "reuse":
+                    archive, identity = original
+                    reps = indexed_reps(identity) if archive == db_path else dedup.stored_reps(archive, identity)
+                    if reps is not None:
+                        progress.duplicates += 1
+                        record(img_path, reps, reused=True)
+                        continue
+                yield img_path
+
+        def embed_in_process(files):
+            """IN-PROCESS MODE: readers decode ahead while this thread runs the model."""
+            prefetcher = ImagePrefetcher(lambda p: load_image_fixed(p, self.detect_max_edge), PREFETCH_DEPTH, PREFETCH_THREADS)
+            models = None  # built on the first file that needs embedding
+            for img_path, img_input in prefetcher.iterate(files):
+                if self.stop_event.is_set(): break
+                if batcher is not None:
+                    batcher.add(img_path, img_input, source=img_path)
+                    if len(batcher) >= self.batch_size: flush_batch()
+                    continue
+                # (a model that can't be built stops the run instead of marking every file failed)
+                if models is None: models = MODELS.get(model_name, self.detector)
+                try:
+                    reps = represent_screened(models, img_input, self.cascade)
+                    record(img_path, reps)
+                except Exception as e:
+                    record(img_path, None, e)
+            flush_batch()
+            if prefetcher.count: print(f"⏱️ Decode prefetch: {prefetcher.summary()}")
+
+        source = new_files() if paths is None else given_files()
+        if dedup: source = unique_files(source)
+        try:
+            if pool:
+                for img_path in source:
+                    chunk.append(img_path)
+                    if len(chunk) >= self.batch_size:
+                        submit_chunk()
+                        collect(2 * self.worker_count)
+                        if not pool: break  # worker crashed: finish the walk in-process below
+                if self.stop_event.is_set(): collect(len(in_flight))  # keep whatever already finished
+                else:
+                    submit_chunk()
+                    collect(0)
+
+            if not pool and not self.stop_event.is_set(): embed_in_process(source)
+            # once every result is in: the cascade may have switched itself off along the way
+            if paths is None and not self.stop_event.is_set():
+                embed_in_process(unique_files(rejected_files()) if dedup else rejected_files())
+        finally:
+            for fut in in_flight: fut.cancel()  # stopped: chunks not started yet are dropped, the pool stays up
+            if dedup:
+                dedup.settle()
+                if embed_start:
+                    started, done, duplicates = embed_start
+                    duplicates = progress.duplicates - duplicates
+                    inferred = progress.done - done - duplicates
+                    # measured inference time per image; wall clock per embedded file when workers did the inference,
+                    # the warm-up call when nothing was embedded at all (a run of nothing but copies)
+                    handle = MODELS.peek(model_name, self.detector)
+                    per_image = handle.seconds_per_image() if handle else None
+                    if per_image is None and inferred > 0: per_image = (time.time() - started) / inferred
+                    if per_image is None and handle: per_image = handle.seconds_per_image(warmup=True)
+                    if duplicates and per_image: dedup.stats["saved_seconds"] += duplicates * per_image
+
+        if self.stop_event.is_set():
+            print("🛑 Stop requested. Saving current progress...")
+            maybe_checkpoint(force=True) 
+            return
+
+        if keep_open:
+            maybe_checkpoint(force=False)
+            self._open_indexes[index_path] = {"buf": buf, "last_save_time": last_save_time, "unsaved": unsaved,
+                                              "signature": store.pickle_signature()}
+            return
+        if unsaved: maybe_checkpoint(force=True)
+        if crawler:
+            # files still pending were never recorded (crashed chunk, copies of a file lost with it): retry next run
+            if pending_signatures: print(f"⚠️ {len(pending_signatures)} file(s) not indexed; their folders are re-listed next run.")
+            crawler.forget(pending_signatures)
+            crawler.save()
+        print(f"✅ index complete: {len(buf)} images, {buf.n_faces} faces saved")
+        if self.use_ann:
+            try:
+                _, matrix = store.load_or_migrate(normalized=(self.metric == "cosine"))
+                if len(matrix): store.ann_index(matrix, self.metric)
+            except Exception as e: print(f"⚠️ ANN index build failed: {e}")
+
+    def _copy_hits_for_archive(self, df, person, archive_dir):
+        """Queue the matches of one person on the copy service; returns how many were queued."""
+        if df is None or df.empty: return 0
+        df = df.sort_values(by="distance").drop_duplicates(subset=["identity"])
+        hits = df[df["distance"] <= self.max_dist].copy()
+        if hits.empty: return 0
+
+        person_dir = os.path.join(self.output_dir, person)
+        copier = self._copy_service()
+        queued = 0
+
+        for _, row in hits.iterrows():
+            if self.stop_event.is_set(): break 
+            p = row["identity"]
+            dist = row["distance"]
+            # row.get("archive_dir") is the key here - it's the CURRENT ROOT attached to this row
+            src_arch = row.get("archive_dir", archive_dir)
+
+            if dist < 1e-6: continue # Skip exact
+
+            # Smart path resolution and the copy itself happen on the copy workers
+            if copier.submit(person, p, src_arch, dist, person_dir): queued += 1
+        return queued
+
+# ========== COMMAND LINE ==========
+def _print_min_distances(results):
+    for r in results:
+        print(f"Ref: {os.path.basename(r['ref_path'])} ({r['person']})")
+        if r["path"] is None: print("  Result: Exact matches only.")
+        else: print(f"  Dist: {r['distance']:.4f}\n  Path: {r['path']}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="facefinder_engine", description="Headless FaceFinder: index archives, search and copy matches.")
+    parser.add_argument("--config", default="facefinder.json", help="JSON config (same keys as the GUI settings) or the GUI's deepface_gui_config.pkl")
+    parser.add_argument("--output-mode", choices=OUTPUT_MODES, help="override the config's output_mode for this run")
+    parser.add_argument("--cascade", metavar="DETECTOR", help="override the config's cascade_detector for this run (e.g. opencv, ssd, off)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_index = sub.add_parser("index", help="build/update the archive indexes")
+    p_index.add_argument("--live", action="store_true", help="copy matches for the references while indexing")
+    p_index.add_argument("--watch", action="store_true", help="keep running and index new/changed files as they land")
+    p_index.add_argument("--poll", action="store_true", help="with --watch: poll the archives instead of using inotify (e.g. shares not detected as such)")
+    p_search = sub.add_parser("search", help="search the indexes for the references and copy the matches")
+    p_search.add_argument("--no-copy", action="store_true", help="only report the matches")
+    p_search.add_argument("--matches", help="write the matches to this CSV (input for 'copy')")
+    sub.add_parser("mindist", help="closest archive face per reference image")
+    p_copy = sub.add_parser("copy", help="copy the matches listed in a CSV written by 'search --matches'")
+    p_copy.add_argument("matches_csv")
+    p_init = sub.add_parser("init-config", help="write a config file with the default settings")
+    p_init.add_argument("path", nargs="?", default="facefinder.json")
+    args = parser.parse_args(argv)
+
+    if args.command == "init-config":
+        save_config(DEFAULT_CONFIG, args.path)
+        print(f"✅ Wrote {args.path}")
+        return 0
+    try: config = load_config(args.config)
+    except FileNotFoundError:
+        print(f"❌ Config file not found: {args.config} (create one with: init-config {args.config})")
+        return 2
+    if not config["archive_dirs"]:
+        print("❌ No archive_dirs configured.")
+        return 2
+    os.makedirs(config["output_dir"], exist_ok=True)
+    if args.output_mode: config["output_mode"] = args.output_mode
+    if args.cascade: config["cascade_detector"] = args.cascade
+    if getattr(args, "poll", False): config["watch_polling"] = True
+
+    engine = FaceFinderEngine(config)
+    # SIGINT/SIGTERM (Ctrl+C, systemctl stop) end the run cleanly, with a checkpoint
+    def request_stop(signum, frame):
+        print(f"\n🛑 Signal {signum} received, stopping after the current file...")
+        engine.stop_event.set()
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+
+    if args.command == "index":
+        if args.watch: engine.watch()
+        else: engine.index(live_match=args.live)
+    elif args.command == "search":
+        matches = engine.search(copy=not args.no_copy)
+        if matches is None: return 1
+        if args.matches: matches.to_csv(args.matches, index=False)
+        print(f"🔍 {len(matches)} match(es)" + (f" written to {args.matches}" if args.matches else ""))
+        if args.no_copy and not args.matches and len(matches): print(matches.to_string(index=False))
+    elif args.command == "mindist":
+        results = engine.min_distances()
+        if results is None:
+            print("❌ No embeddings indexes found.")
+            return 1
+        _print_min_distances(results)
+    elif args.command == "copy":
+        copied = engine.copy_matches(pd.read_csv(args.matches_csv))
+        print(f"✅ Saved {copied} match(es) to {engine.output_dir} ({engine.output_mode})")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,399 @@
+"""
+Regression tests for facefinder_engine that run without TensorFlow/DeepFace:
+the model registry is replaced by a fake that returns one deterministic face per image.
+    python -m pytest -q tests
+"""
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pytest
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import facefinder_engine as engine
+
+
+class FakeHandle(object):
+    input_size = (112, 112)
+
+    def represent(self, img, op="represent"):
+        return [{"embedding": self._embedding(img), "facial_area": {"x": 1, "y": 2, "w": 3, "h": 4}, "face_confidence": 0.9}]
+
+    def detect(self, img, align=True, op="detect"):
+        return [{"face": np.zeros((30, 20, 3), dtype=np.float32), "facial_area": {"x": 1, "y": 2, "w": 3, "h": 4}, "confidence": 0.9}]
+
+    def forward(self, batch):
+        return np.ones((len(batch), 8), dtype=np.float32)
+
+    @staticmethod
+    def _embedding(img):
+        seed = int(np.asarray(img, dtype=np.float64).sum()) % 2**32 if not isinstance(img, str) else 0
+        return np.random.default_rng(seed).standard_normal(8).tolist()
+
+
+class BlindHandle(FakeHandle):
+    """A cascade detector that never sees a face."""
+    def detect(self, img, align=True, op="detect"):
+        return []
+
+
+class FakeRegistry(object):
+    def get(self, model_name, detector_backend):
+        return BlindHandle() if model_name is None else FakeHandle()
+
+    def peek(self, model_name, detector_backend):
+        return None
+
+    def summary(self):
+        return []
+
+
+class CrashingPool(object):
+    """Every chunk dies with its worker, like an OOM kill."""
+    def submit(self, fn, *args):
+        fut = Future()
+        fut.set_exception(BrokenProcessPool("worker died"))
+        return fut
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        pass
+
+
+@pytest.fixture
+def fake_models(monkeypatch):
+    monkeypatch.setattr(engine, "MODELS", FakeRegistry())
+
+
+def make_archive(root, n=6):
+    folder = os.path.join(root, "photos")
+    os.makedirs(folder)
+    for i in range(n):
+        Image.new("RGB", (40, 30), (10 * i, 0, 0)).save(os.path.join(folder, f"img{i}.png"))
+    old = time.time_ns() - 60 * 10**9  # settled folders, so the crawler may cache them
+    for path in (folder, root): os.utime(path, ns=(old, old))
+    return folder
+
+
+def indexed_files(archive):
+    df = engine.pd.read_pickle(os.path.join(archive, "representations_arcface.pkl"))
+    return set(os.path.basename(p) for p in df["identity"])
+
+
+def test_files_of_crashed_chunk_are_retried_next_run(tmp_path, fake_models, monkeypatch):
+    archive = str(tmp_path / "archive")
+    make_archive(archive)
+    config = {"archive_dirs": [archive], "output_dir": str(tmp_path / "out"), "batch_size": 2, "worker_count": 2}
+
+    monkeypatch.setattr(engine, "create_index_pool", lambda *args: CrashingPool())
+    engine.FaceFinderEngine(config).index()
+    assert len(indexed_files(archive)) == 4  # first chunk lost with its worker, the rest done in-process
+
+    engine.FaceFinderEngine(dict(config, worker_count=1)).index()
+    assert indexed_files(archive) == set(f"img{i}.png" for i in range(6))
+
+
+def test_failed_copy_leaves_no_partial_file(tmp_path, monkeypatch):
+    source = tmp_path / "a.jpg"
+    source.write_bytes(b"x" * 1000)
+    dest_dir = str(tmp_path / "out")
+
+    def torn_copy(src, dst):
+        with open(dst, "wb") as f: f.write(b"x" * 10)
+        raise OSError(engine.errno.ENOSPC, "No space left on device")
+
+    monkeypatch.setattr(engine.shutil, "copy2", torn_copy)
+    journal = engine.HitsJournal(str(tmp_path / "hits_log.csv"))
+    copier = engine.CopyService(journal, retries=0)
+    assert copier.submit("Ann", str(source), str(tmp_path), 0.1, dest_dir, source=str(source))
+    copier.close()
+    assert os.listdir(dest_dir) == [] and copier.stats["Ann"]["failed"] == 1
+
+    monkeypatch.undo()  # disk space freed: the next run copies it
+    copier = engine.CopyService(journal)
+    copier.submit("Ann", str(source), str(tmp_path), 0.1, dest_dir, source=str(source))
+    copier.close()
+    name = engine.output_file_name(str(source), str(tmp_path))
+    assert os.listdir(dest_dir) == [name] and os.path.getsize(os.path.join(dest_dir, name)) == 1000
+
+
+def index_statuses(archive):
+    df = engine.pd.read_pickle(os.path.join(archive, "representations_arcface.pkl"))
+    return df["status"].value_counts().to_dict()
+
+
+@pytest.mark.parametrize("batch_size", [1, 2])
+def test_cascade_rejects_are_rechecked_when_the_cascade_is_off(tmp_path, fake_models, batch_size):
+    archive = str(tmp_path / "archive")
+    make_archive(archive)
+    config = {"archive_dirs": [archive], "output_dir": str(tmp_path / "out"), "batch_size": batch_size,
+              "cascade_detector": "blind"}
+    finder = engine.FaceFinderEngine(config)
+    finder.cascade.audit_rate = 0  # no audits: the cascade stays on and rejects everything
+    finder.index()
+    assert index_statuses(archive) == {"cascade_reject": 6}
+
+    engine.FaceFinderEngine(dict(config, cascade_detector="off")).index()
+    assert index_statuses(archive) == {"ok": 6}
+    assert len(indexed_files(archive)) == 6
+
+
+def test_cascade_rejects_are_rechecked_after_it_switches_itself_off(tmp_path, fake_models):
+    archive = str(tmp_path / "archive")
+    make_archive(archive)
+    finder = engine.FaceFinderEngine({"archive_dirs": [archive], "output_dir": str(tmp_path / "out"), "cascade_detector": "blind"})
+    finder.cascade.audit_rate, finder.cascade.min_audits = 0.5, 2  # every audit finds a face: off after two of them
+    finder.index()
+    assert finder.cascade.counts["switched_off"] == 1
+    assert index_statuses(archive) == {"ok": 6}
+
+
+def test_undecodable_file_with_reduced_decode_is_not_refined(fake_models, monkeypatch):
+    monkeypatch.setattr(FakeHandle, "detect", lambda self, img, align=True, op="detect": [{
+        "face": np.zeros((30, 20, 3), dtype=np.float32), "facial_area": {"x": 0, "y": 0, "w": 1, "h": 1}, "confidence": 0.9}])
+    batcher = engine.FaceBatcher("ArcFace", "retinaface", detect_max_edge=64)
+    batcher._setup()
+    batcher._preprocessing = type("Preprocessing", (), {"resize_image": staticmethod(lambda img, target_size: img[None])})
+    batcher.batched, batcher._target_w, batcher._target_h = True, 112, 112
+    batcher.add("raw.cr2", "raw.cr2", source="raw.cr2")  # what load_image_fixed returns when PIL can't decode it
+    (key, result), = batcher.embed()
+    assert not isinstance(result, Exception), result
+    assert len(result) == 1
+
+
+def test_normalized_copy_is_built_on_first_normalized_load(tmp_path):
+    store = engine.EmbeddingStore(str(tmp_path), "ArcFace")
+    store.write(["a", "b"], np.array([[3, 4], [0, 2]], dtype=np.float32))
+    assert not os.path.exists(store.norm_path)  # checkpoints only write the raw matrix
+
+    _, matrix = store.load(normalized=True)
+    assert np.allclose(matrix, [[0.6, 0.8], [0, 1]])
+
+    store.write(["a"], np.array([[0, 5]], dtype=np.float32))
+    _, matrix = store.load(normalized=True)
+    assert np.allclose(matrix, [[0, 1]])
+
+
+def test_watch_stop_saves_the_index_and_drops_queued_copies(tmp_path, fake_models, monkeypatch):
+    archive = str(tmp_path / "archive")
+    folder = make_archive(archive, n=2)
+    finder = engine.FaceFinderEngine({"archive_dirs": [archive], "output_dir": str(tmp_path / "out")})
+    new_file = os.path.join(folder, "new.png")
+
+    class OneEventWatcher(object):
+        mode = "test"
+
+        def __init__(self, *args, **kwargs): pass
+
+        def changes(self, should_stop):
+            Image.new("RGB", (40, 30), (0, 99, 0)).save(new_file)
+            yield archive, [new_file]
+            finder.stop_event.set()  # Stop pressed with a copy still queued
+            finder._copy_service().submit("Ann", new_file, archive, 0.1, str(tmp_path / "out" / "Ann"), source=new_file)
+
+        def close(self): pass
+
+    monkeypatch.setattr(engine, "ArchiveWatcher", OneEventWatcher)
+    finder.watch()
+    assert "new.png" in indexed_files(archive)
+    assert finder.stop_event.is_set()
+    assert not os.path.exists(str(tmp_path / "out" / "Ann"))
+
+
+@pytest.mark.parametrize("filesystem, force_poll, mode", [(None, False, "inotify"), ("NFS", False, "polling"), (None, True, "polling")])
+def test_watcher_polls_network_shares(tmp_path, monkeypatch, filesystem, force_poll, mode):
+    if sys.platform != "linux": pytest.skip("inotify is Linux-only")
+    monkeypatch.setattr(engine, "network_filesystem", lambda path: filesystem)
+    watcher = engine.ArchiveWatcher([str(tmp_path)], [], (".jpg",), force_poll=force_poll)
+    try: assert watcher.mode == mode
+    finally: watcher.close()
+
+
+def test_model_registry_builds_pairs_independently(monkeypatch):
+    import threading
+    slow_started, release = threading.Event(), threading.Event()
+    built = []
+
+    def build(model_name, detector_backend):
+        if model_name == "slow":
+            slow_started.set()
+            assert release.wait(5)
+        built.append(model_name)
+        return object()
+
+    monkeypatch.setattr(engine, "ModelHandle", build)
+    registry = engine.ModelRegistry()
+    results = []
+    slow = [threading.Thread(target=lambda: results.append(registry.get("slow", "retinaface"))) for _ in range(2)]
+    for t in slow: t.start()
+    assert slow_started.wait(5)
+    fast = threading.Thread(target=registry.get, args=(None, "opencv"))
+    fast.start()
+    fast.join(5)
+    assert not fast.is_alive()  # not blocked behind the slow build
+    release.set()
+    for t in slow: t.join(5)
+    assert built == [None, "slow"] and results[0] is results[1]  # the slow pair was built once, and shared
+
+
+def test_load_config_fills_defaults_without_sharing_them(tmp_path):
+    path = str(tmp_path / "deepface_gui_config.pkl")
+    with open(path, "wb") as f: engine.pickle.dump({"model": "Facenet", "enabled_extensions": {".png": False}}, f)
+    config = engine.load_config(path)
+    assert config["model"] == "Facenet" and config["detector"] == engine.DEFAULT_CONFIG["detector"]
+    assert config["enabled_extensions"][".png"] is False and config["enabled_extensions"][".jpg"] is True
+    config["reference_images_config"]["Ann"] = ["a.jpg"]
+    config["excluded_folder_names"].append("thumbs")
+    assert engine.DEFAULT_CONFIG["reference_images_config"] == {} and "thumbs" not in engine.DEFAULT_CONFIG["excluded_folder_names"]
+
+
+def test_polling_reports_files_rewritten_in_place(tmp_path):
+    folder = make_archive(str(tmp_path / "archive"), n=2)
+    archive = os.path.dirname(folder)
+    watcher = engine.ArchiveWatcher([archive], [], (".png",), debounce=0, poll_interval=0, force_poll=True)
+    target = os.path.join(folder, "img0.png")
+    folder_mtime = os.stat(folder).st_mtime_ns
+    Image.new("RGB", (60, 40), (1, 2, 3)).save(target)  # retouched: same name, new content
+    assert os.stat(folder).st_mtime_ns == folder_mtime  # ...so its folder looks unchanged
+
+    deadline = time.time() + 10
+    events = next(watcher.changes(lambda: time.time() > deadline), None)
+    watcher.close()
+    assert events == (archive, [target])
+
+
+def test_copies_of_files_indexed_without_deduplication_are_reused(tmp_path, fake_models, monkeypatch):
+    archive = str(tmp_path / "archive")
+    folder = make_archive(archive)
+    config = {"archive_dirs": [archive], "output_dir": str(tmp_path / "out"), "deduplicate": False}
+    engine.FaceFinderEngine(config).index()
+
+    embedded = []
+    monkeypatch.setattr(FakeHandle, "represent", lambda self, img, op="represent": embedded.append(img) or [
+        {"embedding": self._embedding(img), "facial_area": {"x": 1, "y": 2, "w": 3, "h": 4}, "face_confidence": 0.9}])
+    backup = os.path.join(archive, "backup")
+    os.makedirs(backup)
+    for i in range(3): shutil.copy2(os.path.join(folder, f"img{i}.png"), backup)
+
+    finder = engine.FaceFinderEngine(dict(config, deduplicate=True))
+    finder.index()
+    assert embedded == []  # the backups were found by hashing the indexed originals of the same size
+    assert finder.duplicates.stats["reused"] == 3
+    assert index_statuses(archive) == {"ok": 9}
+    df = engine.pd.read_pickle(os.path.join(archive, "representations_arcface.pkl"))
+    assert sum(os.path.dirname(p) == backup for p in df["identity"]) == 3
+
+
+def test_copy_run_replaces_matches_only_symlinked_or_listed_before(tmp_path):
+    sources = []
+    for name in ("a.jpg", "b.jpg"):
+        sources.append(str(tmp_path / name))
+        (tmp_path / name).write_bytes(name.encode() * 100)
+    dest_dir, log = str(tmp_path / "out"), str(tmp_path / "hits_log.csv")
+
+    def save(mode, source):
+        copier = engine.CopyService(engine.HitsJournal(log), mode=mode)
+        queued = copier.submit("Ann", source, str(tmp_path), 0.1, dest_dir, source=source)
+        copier.close()
+        copier.journal.close()
+        return queued
+
+    assert save("symlink", sources[0]) and save("manifest", sources[1])
+    link = os.path.join(dest_dir, engine.output_file_name(sources[0], str(tmp_path)))
+    assert os.path.islink(link)
+
+    assert save("copy", sources[0]) and save("copy", sources[1])
+    for source in sources:
+        path = os.path.join(dest_dir, engine.output_file_name(source, str(tmp_path)))
+        assert os.path.isfile(path) and not os.path.islink(path) and os.path.getsize(path) == 500
+    assert engine.HitsJournal(log).copied == {("Ann", s): "copy" for s in sources}
+    assert not save("copy", sources[0]) and not save("symlink", sources[0])  # real files already there
+
+
+class InlinePool(object):
+    """Index workers in this process: chunks run at submit()."""
+    def __init__(self, model_name, detector_backend, batch_size, worker_count, cascade_detector=None, detect_max_edge=None):
+        engine._index_worker_init(model_name, detector_backend, batch_size, 1, cascade_detector, detect_max_edge)
+        self.shutdowns = 0
+
+    def submit(self, fn, *args):
+        fut = Future()
+        fut.set_result(fn(*args))
+        return fut
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.shutdowns += 1
+
+
+def test_one_index_pool_serves_every_archive(tmp_path, fake_models, monkeypatch):
+    archives = [str(tmp_path / name) for name in ("a", "b")]
+    for archive in archives: make_archive(archive)
+    pools = []
+    monkeypatch.setattr(engine, "create_index_pool", lambda *args: pools.append(InlinePool(*args)) or pools[-1])
+    engine.FaceFinderEngine({"archive_dirs": archives, "output_dir": str(tmp_path / "out"), "batch_size": 2,
+                             "worker_count": 2}).index()
+    assert len(pools) == 1 and pools[0].shutdowns == 1
+    for archive in archives: assert index_statuses(archive) == {"ok": 6}
+
+
+def test_reference_cache_lives_next_to_the_config_file(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    folder = tmp_path / "settings"
+    folder.mkdir()
+    engine.save_config({"model": "ArcFace"}, str(folder / "facefinder.json"))
+    engine.save_config({"reference_cache_file": "cache/refs.pkl"}, str(folder / "custom.json"))
+    assert engine.load_config("settings/facefinder.json")["reference_cache_file"] == str(folder / engine.REFERENCE_CACHE_FILE)
+    assert engine.load_config("settings/custom.json")["reference_cache_file"] == str(folder / "cache" / "refs.pkl")
+
+
+def test_equally_named_photos_from_different_folders_get_distinct_stable_names(tmp_path):
+    archive = tmp_path / "archive"
+    sources = []
+    for folder, content in (("2019/Party", b"party"), ("2020/Beach", b"beach")):
+        (archive / folder).mkdir(parents=True)
+        sources.append(str(archive / folder / "IMG_0001.JPG"))
+        (archive / folder / "IMG_0001.JPG").write_bytes(content * 100)
+    dest_dir = str(tmp_path / "out")
+    copier = engine.CopyService(engine.HitsJournal(str(tmp_path / "hits_log.csv")))
+    for source in sources: assert copier.submit("Ann", source, str(archive), 0.1, dest_dir, source=source)
+    copier.close()
+    copier.journal.close()
+
+    names = [engine.output_file_name(source, str(archive)) for source in sources]
+    assert names[0] != names[1] and all(name.startswith("IMG_0001_") and name.endswith(".JPG") for name in names)
+    assert sorted(os.listdir(dest_dir)) == sorted(names)
+    for source, name in zip(sources, names):
+        with open(os.path.join(dest_dir, name), "rb") as f, open(source, "rb") as g: assert f.read() == g.read()
+    copier = engine.CopyService(engine.HitsJournal(str(tmp_path / "hits_log.csv")))
+    assert not any(copier.submit("Ann", source, str(archive), 0.1, dest_dir, source=source) for source in sources)
+    copier.close()
+    assert sorted(os.listdir(dest_dir)) == sorted(names)  # nothing copied twice on the next run
+    # the names only depend on the path inside the archive: the same for the archive mounted elsewhere
+    moved = str(tmp_path / "mounted")
+    os.rename(str(archive), moved)
+    assert [engine.output_file_name(s.replace(str(archive), moved), moved) for s in sources] == names
+
+
+@pytest.mark.parametrize("metric", ["cosine", "euclidean_l2"])
+def test_ivf_search_agrees_with_exact_search(metric):
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((40, 32))
+    matrix = (np.repeat(centers, 50, axis=0) + 0.3 * rng.standard_normal((2000, 32))).astype(np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)  # unit-length, like the stored embeddings
+    ivf = engine.IVFIndex.build(matrix, metric, generation=1)
+    queries = matrix[rng.choice(len(matrix), size=50, replace=False)]
+
+    for query, (rows, dists) in zip(queries, ivf.search(matrix, queries, k=1)):
+        assert np.allclose(matrix[rows[0]], query) and dists[0] < 1e-5  # each archive row finds itself
+
+    radius = np.quantile(engine.exact_topk(matrix, queries, metric, 20)[1][:, -1], 0.5)
+    _, _, exact = engine.batched_distance_search(matrix, queries, metric, max_dist=radius)
+    approx = ivf.search(matrix, queries, radius=radius)
+    found = sum(len(set(e) & set(a)) for (e, _), (a, _) in zip(exact, approx))
+    assert found / sum(len(e) for e, _ in exact) >= 0.9
+    assert all(set(a) <= set(e) for (e, _), (a, _) in zip(exact, approx))  # no hits beyond the radius
+    assert ivf.recall(matrix, k=10) >= 0.9